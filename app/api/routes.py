@@ -1,56 +1,157 @@
+import logging
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse, Response
 from app.services.rag_service import rag_service
-from app.models.schemas import ChatRequest, ChatResponse, SearchHintRequest, SearchHintResponse, FeedbackRequest, FeedbackResponse
+from app.models.schemas import ChatRequest, ChatResponse, ChatBatchRequest, SearchHintRequest, SearchHintResponse, FeedbackRequest, FeedbackResponse
 from app.services.openai_service import openai_service
 from app.services.scheduler_service import scheduler_service
 from app.services.hint_service import hint_service
 from app.services.strapi_service import strapi_service
 from app.services.redis_service import redis_service
-import asyncio
+from app.services.session_cache_service import session_cache_service
+from app.services.strapi_writer_service import strapi_writer_service
+from app.services.executor_service import executor_service
+from app.services.answer_cache_service import answer_cache_service
+from app.services.embedding_cache_service import embedding_cache_service
+from app.services.admission_service import llm_admission, OverloadedError
+from app.services.llm_router_service import llm_router_service
+from app.services.metrics_service import metrics_service
 import uuid
-import traceback
 import json
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """处理聊天请求"""
-    try:
-        # 生成回复
-        response = await openai_service.generate_rag_response(
-            session_id=request.session_id, 
-            query=request.query
-        )
-        
-        # 创建响应对象
-        chat_response = ChatResponse(
-            content=response["content"],
-            session_id=request.session_id,
-
-        )
-        
-        # 异步更新redis会话历史
-        asyncio.create_task(
-            openai_service.update_redis_conversation_history(
+    with metrics_service.request("chat"):
+        try:
+            # 生成回复
+            response = await openai_service.generate_rag_response(
+                session_id=request.session_id, 
+                query=request.query
+            )
+            
+            # 创建响应对象
+            chat_response = ChatResponse(
+                content=response["content"],
                 session_id=request.session_id,
-                query=request.query,
-                response=response["content"]
+                image_url=response.get("image_url"),
+                source=response.get("source"),
+                # 缓存命中和直接回答没有调用上游，不返回令牌用量
+                usage=response.get("usage") if response.get("source") == "llm" else None
             )
-        )
-        
-        # 异步存储会话历史到Strapi
-        asyncio.create_task(
-            openai_service.save_conversation_to_strapi(
+            metrics_service.record_answer(response.get("source"))
+            
+            # 异步更新redis会话历史，并把会话加入 Strapi 合并写入队列
+            openai_service.schedule_persist(
                 session_id=request.session_id,
                 query=request.query,
                 response=response["content"]
             )
-        )
-        
-        return chat_response
+            
+            return chat_response
+        except OverloadedError as e:
+            raise _overloaded_exception(e)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+def _overloaded_exception(error: OverloadedError) -> HTTPException:
+    """将过载错误转换为带 Retry-After 的 429/503 响应"""
+    return HTTPException(
+        status_code=error.status_code,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def _sse_event(data: dict, event: str = None) -> str:
+    """将数据编码为一条 SSE 事件"""
+    message = f"event: {event}\n" if event else ""
+    message += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return message
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """以 SSE 方式流式返回聊天回答"""
+    stream = openai_service.generate_rag_response_stream(
+        session_id=request.session_id,
+        query=request.query
+    )
+    
+    # 在返回响应头之前取得第一段内容，过载或前置步骤失败时仍可返回正确的状态码
+    try:
+        first_chunk = await stream.__anext__()
+    except StopAsyncIteration:
+        first_chunk = None
+    except OverloadedError as e:
+        raise _overloaded_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    async def event_generator():
+        chunks = []
+        try:
+            if first_chunk is not None:
+                chunks.append(first_chunk)
+                yield _sse_event({"content": first_chunk})
+                async for content in stream:
+                    chunks.append(content)
+                    yield _sse_event({"content": content})
+        except Exception as e:
+            logger.error(f"❌ 流式生成回答失败: {str(e)}")
+            yield _sse_event({"detail": str(e)}, event="error")
+            return
+        
+        full_response = "".join(chunks)
+        yield _sse_event({"session_id": request.session_id}, event="done")
+        
+        # 仅在流式输出完整结束后写入完整回答
+        if full_response:
+            openai_service.schedule_persist(
+                session_id=request.session_id,
+                query=request.query,
+                response=full_response
+            )
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 禁用反向代理缓冲，保证首字节尽快到达
+        }
+    )
+
+@router.post("/chat/batch")
+async def chat_batch(request: ChatBatchRequest):
+    """批量问答，以 NDJSON 逐行返回，每个问题一行（按完成顺序）"""
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="queries 不能为空")
+    if len(request.queries) > settings.BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"单次最多 {settings.BATCH_MAX_QUERIES} 个问题")
+    concurrency = min(request.concurrency or settings.BATCH_CONCURRENCY, settings.BATCH_CONCURRENCY)
+    
+    async def ndjson_generator():
+        try:
+            async for indices, response in openai_service.generate_rag_responses_batch(request.queries, concurrency):
+                for index in indices:
+                    yield json.dumps({
+                        "index": index,
+                        "query": request.queries[index],
+                        "content": response.get("content"),
+                        "source": response.get("source"),
+                        "image_url": response.get("image_url"),
+                        "faq_ids": response.get("faq_ids", []),
+                        "error": bool(response.get("error"))
+                    }, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"❌ 批量问答失败: {str(e)}")
+            yield json.dumps({"error": True, "detail": str(e)}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(ndjson_generator(), media_type="application/x-ndjson")
 
 @router.post("/update-knowledge")
 async def update_knowledge():
@@ -68,42 +169,42 @@ async def update_knowledge():
 async def update_knowledge_full():
     """手动触发知识库全量更新"""
     try:
-        print("🚀 开始执行知识库全量更新...")
+        logger.info("🚀 开始执行知识库全量更新...")
 
         # 1. 从 Strapi 获取最新数据并保存为 strapi_knowledge_full.json
-        print("étape 1: 从 Strapi 获取最新数据...")
+        logger.info("étape 1: 从 Strapi 获取最新数据...")
         full_json_path = strapi_service.fetch_and_save_knowledge()
         if not full_json_path:
             raise HTTPException(status_code=500, detail="从 Strapi 获取数据失败")
-        print(f"✅ 数据已保存到: {full_json_path}")
+        logger.info(f"✅ 数据已保存到: {full_json_path}")
 
         # 2. 解析完整数据，生成 strapi_knowledge_parsed.json
-        print("étape 2: 解析数据...")
+        logger.info("étape 2: 解析数据...")
         parsed_json_path = strapi_service.parse_knowledge_json(input_file="strapi_knowledge_full.json")
         if not parsed_json_path:
              raise HTTPException(status_code=500, detail="解析 Strapi 数据失败")
-        print(f"✅ 解析后的数据已保存到: {parsed_json_path}")
+        logger.info(f"✅ 解析后的数据已保存到: {parsed_json_path}")
 
         # 3. 将解析后的数据存储到 ChromaDB，并重建集合
-        print("étape 3: 将数据存储到 ChromaDB...")
+        logger.info("étape 3: 将数据存储到 ChromaDB...")
         # 使用 store_faq_in_chromadb 方法，设置 recreate_collection=True
         updated = strapi_service.store_faq_in_chromadb(recreate_collection=True)
         if not updated:
             # store_faq_in_chromadb 内部已经打印了错误，这里直接抛出异常
             raise HTTPException(status_code=500, detail="将数据存储到 ChromaDB 失败")
-        print("✅ 数据成功存储到 ChromaDB")
+        logger.info("✅ 数据成功存储到 ChromaDB")
 
         # 4. 刷新搜索提示 (store_faq_in_chromadb 内部也会尝试刷新，这里保留显式调用以防万一)
         # 注意：store_faq_in_chromadb 内部已包含刷新逻辑，这里的调用可能重复，但为了保险起见保留
-        print("étape 4: 刷新搜索提示...")
+        logger.info("étape 4: 刷新搜索提示...")
         try:
             hint_service.refresh()
-            print("✅ 搜索提示列表已刷新")
+            logger.info("✅ 搜索提示列表已刷新")
         except Exception as e:
             # 允许刷新失败，只记录警告
-            print(f"⚠️ 刷新搜索提示列表失败: {str(e)}")
+            logger.warning(f"⚠️ 刷新搜索提示列表失败: {str(e)}")
 
-        print("🎉 知识库全量更新成功完成！")
+        logger.info("🎉 知识库全量更新成功完成！")
         return {
             "status": "success",
             "message": "知识库全量更新成功"
@@ -112,8 +213,7 @@ async def update_knowledge_full():
         # 直接重新抛出 HTTP 异常
         raise http_exc
     except Exception as e:
-        print(f"❌ 知识库全量更新过程中发生意外错误: {str(e)}")
-        traceback.print_exc() # 打印详细错误堆栈
+        logger.exception(f"❌ 知识库全量更新过程中发生意外错误: {str(e)}")
         # 返回通用错误
         raise HTTPException(status_code=500, detail=f"知识库全量更新失败: {str(e)}")
 
@@ -132,6 +232,72 @@ async def get_scheduler_jobs():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取调度任务失败: {str(e)}")
 
+@router.get("/answer-cache/stats")
+async def get_answer_cache_stats():
+    """获取回答缓存命中率等统计信息"""
+    return {
+        "status": "success",
+        "data": answer_cache_service.get_stats()
+    }
+
+@router.get("/admission/stats")
+async def get_admission_stats():
+    """获取上游 LLM 调用的并发、排队深度和等待时间统计"""
+    return {
+        "status": "success",
+        "data": llm_admission.get_stats()
+    }
+
+@router.get("/metrics")
+async def metrics():
+    """以 Prometheus 文本格式导出各阶段耗时、缓存命中率和上游错误等指标"""
+    content, content_type = metrics_service.render()
+    return Response(content=content, media_type=content_type)
+
+@router.get("/health")
+async def health():
+    """获取依赖服务的健康状态：Redis 连接（PING 延迟、连接池使用情况、熔断器状态）、降级模式下的暂存写入和会话数据编码节省的字节数"""
+    return {
+        "status": "success",
+        "data": {
+            "redis": await redis_service.health_check(),
+            "session_fallback": session_cache_service.get_fallback_stats(),
+            "session_codec": redis_service.codec.get_stats()
+        }
+    }
+
+@router.get("/llm-upstreams")
+async def get_llm_upstreams():
+    """获取各上游 LLM 端点的健康状态和延迟统计"""
+    return {
+        "status": "success",
+        "data": llm_router_service.get_stats()
+    }
+
+@router.get("/embedding-cache/stats")
+async def get_embedding_cache_stats():
+    """获取查询 embedding 缓存命中率等统计信息"""
+    return {
+        "status": "success",
+        "data": embedding_cache_service.get_stats()
+    }
+
+@router.get("/session-cache/stats")
+async def get_session_cache_stats():
+    """获取进程内会话缓存命中率和失效次数"""
+    return {
+        "status": "success",
+        "data": session_cache_service.get_stats()
+    }
+
+@router.get("/strapi-writer/stats")
+async def get_strapi_writer_stats():
+    """获取 Strapi 会话合并写入队列的深度、最长等待时间和合并次数"""
+    return {
+        "status": "success",
+        "data": strapi_writer_service.get_stats()
+    }
+
 @router.post("/refresh-search-hints")
 async def refresh_search_hints():
     """手动刷新搜索提示列表"""
@@ -149,32 +315,34 @@ async def refresh_search_hints():
 @router.post("/searchHint", response_model=SearchHintResponse)
 async def search_hint(request: SearchHintRequest):
     """根据用户部分输入，提供可能的问题补全"""
-    try:
-        # 确保初始化
-        if not hint_service.is_initialized:
-            hint_service.initialize()
+    with metrics_service.request("search_hint"):
+        try:
+            # 确保初始化
+            if not hint_service.is_initialized:
+                hint_service.initialize()
+                
+            # 获取匹配的提示列表
+            with metrics_service.stage("hint_search"):
+                suggestions = hint_service.search_hints(
+                    query=request.query,
+                    limit=request.limit
+                )
             
-        # 获取匹配的提示列表
-        suggestions = hint_service.search_hints(
-            query=request.query,
-            limit=request.limit
-        )
-        
-        # 判断是否所有结果来自同一个知识库项
-        source_id = None
-        if len(suggestions) == 1:
-            source_id = hint_service.get_hint_source(suggestions[0])
-        elif len(suggestions) > 1:
-            sources = set(hint_service.get_hint_source(hint) for hint in suggestions)
-            if len(sources) == 1:
-                source_id = sources.pop()
-        
-        return SearchHintResponse(
-            suggestions=suggestions,
-            source_id=source_id
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"搜索提示失败: {str(e)}")
+            # 判断是否所有结果来自同一个知识库项
+            source_id = None
+            if len(suggestions) == 1:
+                source_id = hint_service.get_hint_source(suggestions[0])
+            elif len(suggestions) > 1:
+                sources = set(hint_service.get_hint_source(hint) for hint in suggestions)
+                if len(sources) == 1:
+                    source_id = sources.pop()
+            
+            return SearchHintResponse(
+                suggestions=suggestions,
+                source_id=source_id
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"搜索提示失败: {str(e)}")
 
 @router.post("/feedback", response_model=FeedbackResponse)
 async def feedback(request: FeedbackRequest):
@@ -187,19 +355,27 @@ async def feedback(request: FeedbackRequest):
         session_id = request.session_id
         feedback_id = request.feedback_id
 
-        # 2. 从Redis获取会话历史记录
-        session_history = redis_service.get_conversation_history(session_id)
+        # 2. 从Redis获取对话记录（已移出 Redis 的早前消息以会话摘要代替）；Redis 不可用时使用本地会话副本
+        try:
+            transcript = await redis_service.call_async(redis_service.get_transcript_async, session_id)
+            session_history = transcript["messages"]
+            if transcript["offset"]:
+                session_history.insert(0, redis_service.summary_message(transcript["summary"], transcript["offset"]))
+        except Exception as e:
+            logger.warning(f"⚠️ 读取完整对话记录失败，使用本地会话副本: {str(e)}")
+            session_history = (await session_cache_service.get(session_id))["messages"]
         
         # 3. 处理空会话历史
         if not session_history:
-            print(f"⚠️ 警告: Redis中没有找到会话历史记录 (session_id: {session_id})，此次反馈可能超过三个月，请检查")
+            logger.warning(f"⚠️ 警告: Redis中没有找到会话历史记录 (session_id: {session_id})，此次反馈可能超过三个月，请检查")
             session_history = [{"role": "system", "content": "没有历史记录 - 可能超过三个月"}]
         
         # 4. 将会话历史转换为JSON，以便在Strapi中存储
         session_history_json = json.dumps(session_history)
 
         # 5. 将反馈信息存储到Strapi
-        success, message = strapi_service.submit_feedback(
+        success, message = await executor_service.run(
+            strapi_service.submit_feedback,
             feedback_id=feedback_id,
             good_or_bad=satisfaction,
             session_history=session_history_json,
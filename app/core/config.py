@@ -1,7 +1,10 @@
+import logging
 import os
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables from .env file
 load_dotenv(override=True)
 
@@ -21,6 +24,19 @@ class Settings(BaseModel):
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
     REDIS_DB: int = int(os.getenv("REDIS_DB", 0))
     REDIS_PASSWORD: str = os.getenv("REDIS_PASSWORD", "")
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+    REDIS_SOCKET_TIMEOUT: float = float(os.getenv("REDIS_SOCKET_TIMEOUT", 2.0))
+    REDIS_CONNECT_TIMEOUT: float = float(os.getenv("REDIS_CONNECT_TIMEOUT", 1.0))
+    REDIS_HEALTH_CHECK_INTERVAL: int = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+    REDIS_CODEC: str = os.getenv("REDIS_CODEC", "msgpack+zstd")  # msgpack+zstd / msgpack / json
+    REDIS_CODEC_LEVEL: int = int(os.getenv("REDIS_CODEC_LEVEL", 3))
+    REDIS_CODEC_MIN_COMPRESS_BYTES: int = int(os.getenv("REDIS_CODEC_MIN_COMPRESS_BYTES", 128))
+    # Redis 熔断：请求路径上的操作超时或连续失败后直接使用进程内的会话副本，写入暂存并在恢复后重放
+    REDIS_OP_TIMEOUT: float = float(os.getenv("REDIS_OP_TIMEOUT", 0.5))
+    REDIS_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("REDIS_BREAKER_FAILURE_THRESHOLD", 3))
+    REDIS_BREAKER_COOLDOWN: float = float(os.getenv("REDIS_BREAKER_COOLDOWN", 5.0))
+    REDIS_FALLBACK_SESSIONS: int = int(os.getenv("REDIS_FALLBACK_SESSIONS", 5000))
+    REDIS_WRITE_BUFFER_SIZE: int = int(os.getenv("REDIS_WRITE_BUFFER_SIZE", 10000))
     
     # Strapi Configuration
     STRAPI_API_URL: str = os.getenv("STRAPI_API_URL")
@@ -30,6 +46,104 @@ class Settings(BaseModel):
     LOCAL_STRAPI_API_URL: str = os.getenv("LOCAL_STRAPI_API_URL", "http://localhost:1337/")
     LOCAL_STRAPI_API_TOKEN: str = os.getenv("LOCAL_STRAPI_API_TOKEN", "")
     
+    # HTTP Client Pool Configuration
+    HTTP2_ENABLED: bool = os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20))
+    HTTP_KEEPALIVE_EXPIRY: float = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60.0))
+    HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", 30.0))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5.0))
+    HTTP_PREWARM_CONNECTIONS: int = int(os.getenv("HTTP_PREWARM_CONNECTIONS", 2))
+    
+    # Blocking Executor Configuration（同步 Redis / embedding / ChromaDB 调用）
+    BLOCKING_EXECUTOR_WORKERS: int = int(os.getenv("BLOCKING_EXECUTOR_WORKERS", 16))
+    BLOCKING_EXECUTOR_MAX_PENDING: int = int(os.getenv("BLOCKING_EXECUTOR_MAX_PENDING", 64))
+    
+    # Answer Cache Configuration
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_TTL: int = int(os.getenv("ANSWER_CACHE_TTL", 24 * 60 * 60))
+    KB_VERSION_REFRESH_SECONDS: float = float(os.getenv("KB_VERSION_REFRESH_SECONDS", 5.0))
+    
+    # Embedding Cache Configuration（进程内 LRU + Redis）
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", 2048))
+    EMBEDDING_CACHE_TTL: int = int(os.getenv("EMBEDDING_CACHE_TTL", 30 * 24 * 60 * 60))
+    
+    # Prompt Token Budget Configuration
+    PROMPT_TOKEN_ENCODING: str = os.getenv("PROMPT_TOKEN_ENCODING", "o200k_base")
+    PROMPT_TOKEN_BUDGET: int = int(os.getenv("PROMPT_TOKEN_BUDGET", 4000))
+    PROMPT_MAX_QUERY_TOKENS: int = int(os.getenv("PROMPT_MAX_QUERY_TOKENS", 500))
+    PROMPT_MAX_KNOWLEDGE_TOKENS: int = int(os.getenv("PROMPT_MAX_KNOWLEDGE_TOKENS", 2500))
+    PROMPT_MAX_FAQ_RESPONSE_TOKENS: int = int(os.getenv("PROMPT_MAX_FAQ_RESPONSE_TOKENS", 800))
+    PROMPT_MAX_HISTORY_TOKENS: int = int(os.getenv("PROMPT_MAX_HISTORY_TOKENS", 1200))
+    PROMPT_MAX_MESSAGE_TOKENS: int = int(os.getenv("PROMPT_MAX_MESSAGE_TOKENS", 400))
+    
+    # LLM Admission Control Configuration
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", 32))
+    LLM_MAX_QUEUE: int = int(os.getenv("LLM_MAX_QUEUE", 64))
+    LLM_QUEUE_TIMEOUT: float = float(os.getenv("LLM_QUEUE_TIMEOUT", 10.0))
+    LLM_RETRY_AFTER: int = int(os.getenv("LLM_RETRY_AFTER", 2))
+    
+    # LLM Upstream Router Configuration
+    # OPENAI_UPSTREAMS: JSON 列表，例如 [{"name": "a", "url": "...", "model": "gpt-4o", "weight": 2}]
+    OPENAI_UPSTREAMS: str = os.getenv("OPENAI_UPSTREAMS", "")
+    LLM_ROUTING_STRATEGY: str = os.getenv("LLM_ROUTING_STRATEGY", "least_latency")  # least_latency / round_robin
+    LLM_FAILOVER_ATTEMPTS: int = int(os.getenv("LLM_FAILOVER_ATTEMPTS", 2))
+    LLM_UNHEALTHY_THRESHOLD: int = int(os.getenv("LLM_UNHEALTHY_THRESHOLD", 3))
+    LLM_UNHEALTHY_COOLDOWN: float = float(os.getenv("LLM_UNHEALTHY_COOLDOWN", 30.0))
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_PERCENTILE: float = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+    LLM_HEDGE_INITIAL_DELAY: float = float(os.getenv("LLM_HEDGE_INITIAL_DELAY", 3.0))
+    LLM_HEDGE_MIN_DELAY: float = float(os.getenv("LLM_HEDGE_MIN_DELAY", 0.5))
+    
+    # Direct Answer Configuration（高置信度 FAQ 命中时跳过 LLM，直接返回知识库中的回答）
+    DIRECT_ANSWER_ENABLED: bool = os.getenv("DIRECT_ANSWER_ENABLED", "true").lower() == "true"
+    DIRECT_ANSWER_MIN_SCORE: float = float(os.getenv("DIRECT_ANSWER_MIN_SCORE", 0.85))
+    DIRECT_ANSWER_MIN_MARGIN: float = float(os.getenv("DIRECT_ANSWER_MIN_MARGIN", 0.1))
+    DIRECT_ANSWER_FIRST_TURN_ONLY: bool = os.getenv("DIRECT_ANSWER_FIRST_TURN_ONLY", "true").lower() == "true"
+    
+    # Batch Chat Configuration
+    BATCH_MAX_QUERIES: int = int(os.getenv("BATCH_MAX_QUERIES", 1000))
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", 8))
+    BATCH_EMBEDDING_SIZE: int = int(os.getenv("BATCH_EMBEDDING_SIZE", 256))  # 单次 embedding API 调用的最大文本数
+    
+    # Logging Configuration
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")  # text / json
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    
+    # Tracing Configuration
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    TRACING_EXPORTER: str = os.getenv("TRACING_EXPORTER", "none")  # jsonl / memory / none
+    TRACING_FILE: str = os.getenv("TRACING_FILE", "logs/traces.jsonl")
+    TRACE_HEADER: str = os.getenv("TRACE_HEADER", "X-Trace-Id")
+    
+    # Conversation History Configuration
+    HISTORY_MAX_MESSAGES: int = int(os.getenv("HISTORY_MAX_MESSAGES", 200))
+    HISTORY_PROMPT_ROUNDS: int = int(os.getenv("HISTORY_PROMPT_ROUNDS", 3))
+    HISTORY_MIGRATE_ON_STARTUP: bool = os.getenv("HISTORY_MIGRATE_ON_STARTUP", "true").lower() == "true"
+    HISTORY_MIGRATION_LOCK_TTL: int = int(os.getenv("HISTORY_MIGRATION_LOCK_TTL", 3600))
+    HISTORY_SUMMARY_ENABLED: bool = os.getenv("HISTORY_SUMMARY_ENABLED", "true").lower() == "true"
+    HISTORY_SUMMARY_TRIGGER_MESSAGES: int = int(os.getenv("HISTORY_SUMMARY_TRIGGER_MESSAGES", 20))
+    HISTORY_SUMMARY_KEEP_ROUNDS: int = int(os.getenv("HISTORY_SUMMARY_KEEP_ROUNDS", 3))
+    HISTORY_SUMMARY_MAX_TOKENS: int = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", 300))
+    HISTORY_SUMMARY_MODEL: str = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-4o")
+    HISTORY_SUMMARY_LOCK_TTL: int = int(os.getenv("HISTORY_SUMMARY_LOCK_TTL", 120))
+    HISTORY_SUMMARY_CONCURRENCY: int = int(os.getenv("HISTORY_SUMMARY_CONCURRENCY", 2))
+    
+    # Session Cache Configuration
+    SESSION_CACHE_ENABLED: bool = os.getenv("SESSION_CACHE_ENABLED", "true").lower() == "true"
+    SESSION_CACHE_SIZE: int = int(os.getenv("SESSION_CACHE_SIZE", 10000))
+    SESSION_CACHE_TTL: float = float(os.getenv("SESSION_CACHE_TTL", 60.0))
+    
+    # Strapi Session Write-behind Configuration
+    STRAPI_WRITE_QUIET_PERIOD: float = float(os.getenv("STRAPI_WRITE_QUIET_PERIOD", 10.0))
+    STRAPI_WRITE_MAX_DELAY: float = float(os.getenv("STRAPI_WRITE_MAX_DELAY", 60.0))
+    STRAPI_WRITE_CONCURRENCY: int = int(os.getenv("STRAPI_WRITE_CONCURRENCY", 4))
+    STRAPI_WRITE_MAX_RETRIES: int = int(os.getenv("STRAPI_WRITE_MAX_RETRIES", 3))
+    STRAPI_WRITE_SHUTDOWN_TIMEOUT: float = float(os.getenv("STRAPI_WRITE_SHUTDOWN_TIMEOUT", 30.0))
+    
     # Debug Configuration
     DEBUG_MODE: bool = os.getenv("DEBUG_MODE", "false").lower() == "true"
     SKIP_STRAPI_FETCH: bool = os.getenv("SKIP_STRAPI_FETCH", "false").lower() == "true"
@@ -42,10 +156,10 @@ class Settings(BaseModel):
         # print(f"❗️❗️❗️Loaded STRAPI_API_TOKEN: {self.STRAPI_API_TOKEN}")
         # 打印调试模式状态
         if self.DEBUG_MODE:
-            print(f"⚠️ 调试模式已启用")
+            logger.warning("⚠️ 调试模式已启用")
             if self.SKIP_STRAPI_FETCH:
-                print(f"⚠️ Strapi数据抓取已禁用")
+                logger.warning("⚠️ Strapi数据抓取已禁用")
             if self.SKIP_CHROMA_UPDATE:
-                print(f"⚠️ ChromaDB向量化已禁用")
+                logger.warning("⚠️ ChromaDB向量化已禁用")
 
 settings = Settings() 
\ No newline at end of file
@@ -0,0 +1,86 @@
+import json
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from app.core.config import settings
+
+# LogRecord 自带的属性，其余属性视为通过 extra 传入的结构化字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，extra 字段原样并入"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class DroppingQueueHandler(QueueHandler):
+    """队列已满时丢弃日志并计数，保证记录日志永远不会阻塞请求"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+_listener: QueueListener = None
+_queue_handler: DroppingQueueHandler = None
+
+def setup_logging() -> None:
+    """
+    配置根日志：请求线程只把日志放入内存队列，由后台线程格式化并写到 stdout
+
+    日志级别由 LOG_LEVEL 控制（生产环境使用 INFO，提示词、FAQ 明细等大段内容只在 DEBUG 输出），
+    LOG_FORMAT=json 时输出结构化 JSON，否则输出文本格式。
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    level = logging.getLevelName(settings.LOG_LEVEL.upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+
+    stream_handler = logging.StreamHandler()
+    if settings.LOG_FORMAT.lower() == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.handlers = [_queue_handler]
+    root.setLevel(level)
+
+    # httpx/httpcore 在 INFO 级别会为每个请求输出一行日志
+    if level > logging.DEBUG:
+        for name in ("httpx", "httpcore"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging() -> None:
+    """停止后台日志线程，并写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,10 +1,26 @@
+import logging
+import asyncio
+from app.core.logging_config import setup_logging
+
+# 在导入各服务（模块级单例会在导入时记录日志）之前配置日志
+setup_logging()
+
 from fastapi import FastAPI
+from starlette.datastructures import Headers, MutableHeaders
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from app.services.redis_service import redis_service
+from app.services.session_cache_service import session_cache_service
+from app.services.strapi_writer_service import strapi_writer_service
+from app.services.history_summary_service import history_summary_service
+from app.services.openai_service import openai_service
 from app.services.strapi_service import strapi_service
 from app.services.scheduler_service import scheduler_service
 from app.services.hint_service import hint_service
+from app.services.http_client_service import http_client_service
+from app.services.executor_service import executor_service
+from app.services.knowledge_index_service import knowledge_index_service
+from app.services.tracing_service import tracing_service
 
 # 设置环境变量，禁用 CoreML 执行提供程序
 import os
@@ -14,33 +30,42 @@ os.environ["ONNX_PROVIDERS"] = "CPUExecutionProvider"
 from app.api.routes import router as api_router
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+async def migrate_conversation_histories():
+    """在后台把旧格式（JSON 字符串）的会话历史迁移为 Redis 列表"""
+    try:
+        await executor_service.run(redis_service.migrate_legacy_histories)
+    except Exception as e:
+        logger.error(f"❌ 迁移旧格式会话历史失败: {str(e)}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时执行
-    print("\n🚀 应用启动中...")
+    logger.info("🚀 应用启动中...")
     
     try:
         # 根据环境变量决定是否清空 ChromaDB
         clear_db = os.environ.get("CLEAR_CHROMA_ON_STARTUP", "False").lower() == "true"
         if clear_db:
-            print("\n⚠️ 检测到 CLEAR_CHROMA_ON_STARTUP=True，将清空 ChromaDB...")
+            logger.warning("⚠️ 检测到 CLEAR_CHROMA_ON_STARTUP=True，将清空 ChromaDB...")
             # 首先清空 ChromaDB 中的所有集合
             strapi_service.clear_chromadb()
         else:
-            print("\nℹ️ 跳过清空 ChromaDB 步骤 (CLEAR_CHROMA_ON_STARTUP 未设置为 True)")
+            logger.info("ℹ️ 跳过清空 ChromaDB 步骤 (CLEAR_CHROMA_ON_STARTUP 未设置为 True)")
         
         # 爬取Strapi语料库知识
         if not settings.SKIP_STRAPI_FETCH:
-            print("\n📥 开始抓取Strapi上的所有知识...")
+            logger.info("📥 开始抓取Strapi上的所有知识...")
             # 抓取所有知识并保存到_full.json
             full_json_path = strapi_service.fetch_and_save_knowledge()
-            print(f"✅ 知识抓取完成，保存到: {full_json_path}")
+            logger.info(f"✅ 知识抓取完成，保存到: {full_json_path}")
             
-            print("\n🔍 开始解析知识库数据...")
+            logger.info("🔍 开始解析知识库数据...")
             # 解析_full.json生成_parsed.json
             parsed_json_path = strapi_service.parse_knowledge_json()
-            print(f"✅ 知识解析完成，保存到: {parsed_json_path}")
+            logger.info(f"✅ 知识解析完成，保存到: {parsed_json_path}")
             
         
         # 将Strapi上的知识更新进ChromDB
@@ -56,45 +81,71 @@ async def lifespan(app: FastAPI):
         parsed_json_path = os.path.join(settings.DATA_DIR, "strapi_knowledge_parsed.json")
         
         if not os.path.exists(full_json_path):
-            print(f"⚠️ 警告: 未找到完整知识库文件 {full_json_path}")
+            logger.warning(f"⚠️ 警告: 未找到完整知识库文件 {full_json_path}")
         if not os.path.exists(parsed_json_path):
-            print(f"⚠️ 警告: 未找到解析后的知识库文件 {parsed_json_path}")
+            logger.warning(f"⚠️ 警告: 未找到解析后的知识库文件 {parsed_json_path}")
+        else:
+            # 预先加载常驻内存的知识库索引，避免首个请求解析文件
+            knowledge_index_service.reload()
             
-        print("✅ 语料库RAG服务初始化完成")
+        logger.info("✅ 语料库RAG服务初始化完成")
     except Exception as e:
-        print(f"❌ 语料库RAG服务初始化失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ 语料库RAG服务初始化失败: {str(e)}")
     
     # 启动调度服务
     scheduler_service.start()
-    print("✅ 调度服务已启动")
+    logger.info("✅ 调度服务已启动")
     
     # 初始化搜索提示服务
     try:
         hint_service.initialize()
-        print(f"✅ 搜索提示服务初始化完成，共加载 {len(hint_service.hint_list)} 个问题")
+        logger.info(f"✅ 搜索提示服务初始化完成，共加载 {len(hint_service.hint_list)} 个问题")
         # Check if hints are missing and generate if necessary
         if not hint_service.is_initialized or len(hint_service.hint_list) == 0:
-             print("💡 提示文件不存在或为空，尝试生成...")
+             logger.info("💡 提示文件不存在或为空，尝试生成...")
              if hint_service.generate_and_load_hints():
-                 print(f"✅ 成功生成并加载了 {len(hint_service.hint_list)} 条搜索提示。")
+                 logger.info(f"✅ 成功生成并加载了 {len(hint_service.hint_list)} 条搜索提示。")
              else:
-                 print("❌ 生成搜索提示失败。服务可能无法提供搜索建议。")
+                 logger.error("❌ 生成搜索提示失败。服务可能无法提供搜索建议。")
 
     except Exception as e:
-        print(f"❌ 搜索提示服务初始化失败: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ 搜索提示服务初始化失败: {str(e)}")
+
+    # 创建共享 HTTP 连接池并预热到 LLM 网关和 Strapi 的连接
+    try:
+        await http_client_service.startup()
+    except Exception as e:
+        logger.error(f"❌ HTTP 客户端池初始化失败: {str(e)}")
 
-    print("✅ 应用启动完成")
+    # 创建 Redis 异步连接池，启动会话缓存的失效通知订阅
+    await redis_service.startup()
+    await session_cache_service.startup()
+
+    # 旧格式的会话历史在首次访问时也会自动迁移，这里在后台提前完成
+    migration_task = None
+    if settings.HISTORY_MIGRATE_ON_STARTUP:
+        migration_task = asyncio.create_task(migrate_conversation_histories())
+
+    logger.info("✅ 应用启动完成")
     
     yield
     
     # 关闭时执行
-    print("\n🛑 应用关闭中...")
+    logger.info("🛑 应用关闭中...")
+    if migration_task is not None and not migration_task.done():
+        migration_task.cancel()
     scheduler_service.shutdown()
-    print("✅ 应用已关闭")
+    # 依次：等待进行中的会话保存任务 -> 重放 Redis 不可用期间暂存的写入 -> 把所有待写入的会话写入 Strapi，
+    # 最后才关闭它们依赖的 HTTP 和 Redis 连接池
+    await openai_service.shutdown()
+    await history_summary_service.shutdown()
+    await session_cache_service.shutdown()
+    await strapi_writer_service.shutdown()
+    await http_client_service.shutdown()
+    await redis_service.shutdown()
+    executor_service.shutdown()
+    tracing_service.shutdown()
+    logger.info("✅ 应用已关闭")
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -112,6 +163,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class TraceRequestsMiddleware:
+    """
+    为每个请求创建根 span（沿用请求头中的 trace id），并在响应头中返回 trace id
+
+    使用纯 ASGI 中间件，在最后一段响应体（more_body=False）发送后才结束 span，
+    流式响应（/chat/stream、/chat/batch）的输出时间和其中的子 span 都包含在请求 span 之内。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with tracing_service.span(
+            f"{scope['method']} {scope['path']}",
+            trace_id=Headers(scope=scope).get(settings.TRACE_HEADER)
+        ) as span:
+            if span is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    MutableHeaders(scope=message).append(settings.TRACE_HEADER, span.trace_id)
+                await send(message)
+                if message["type"] == "http.response.body" and not message.get("more_body", False):
+                    span.end()
+
+            await self.app(scope, receive, send_with_trace)
+
+app.add_middleware(TraceRequestsMiddleware)
+
 # 包含路由
 app.include_router(api_router)
 
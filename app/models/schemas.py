@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 
 class Message(BaseModel):
@@ -15,8 +15,16 @@ class ChatResponse(BaseModel):
     """聊天响应模型"""
     content: str = Field(..., description="AI生成的回答内容")
     session_id: str = Field(..., description="会话唯一标识符")
+    image_url: Optional[str] = Field(None, description="直接回答时FAQ的移动端图片URL")
+    source: Optional[str] = Field(None, description="回答来源：faq_direct / answer_cache / llm")
+    usage: Optional[Dict[str, int]] = Field(None, description="本次LLM调用的令牌用量，cached_tokens 为命中前缀缓存的输入令牌数")
 
 
+class ChatBatchRequest(BaseModel):
+    """批量聊天请求模型"""
+    queries: List[str] = Field(..., description="问题列表，相同的问题只回答一次")
+    concurrency: Optional[int] = Field(None, description="同时生成回答的最大数量，默认使用 BATCH_CONCURRENCY")
+
 class SearchHintRequest(BaseModel):
     """搜索提示请求模型"""
     query: str = Field(..., description="用户已输入的部分查询")
@@ -0,0 +1,122 @@
+import math
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+from app.core.config import settings
+
+class OverloadedError(Exception):
+    """上游并发已满且排队已满/等待超时，请求被快速拒绝"""
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class AdmissionController:
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        """
+        初始化准入控制：限制并发数，超出部分进入有界等待队列
+        
+        Args:
+            name (str): 名称，用于日志和统计
+            max_concurrency (int): 最大并发数
+            max_queue (int): 等待队列长度上限，队列已满时返回 429
+            queue_timeout (float): 最长排队时间（秒），超时返回 503
+        """
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = None
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_service = 0.0
+        self.completed = 0
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+    
+    def _retry_after(self) -> int:
+        """按平均服务时间和当前排队长度估算客户端重试等待秒数"""
+        avg_service = self.total_service / self.completed if self.completed else 0.0
+        estimate = avg_service * (self.waiting + 1) / max(self.max_concurrency, 1)
+        return max(settings.LLM_RETRY_AFTER, math.ceil(estimate))
+    
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        获取一个并发名额，退出上下文时释放
+        
+        Raises:
+            OverloadedError: 队列已满（429）或排队超时（503）
+        """
+        semaphore = self._get_semaphore()
+        start = time.monotonic()
+        if not semaphore.locked():
+            # 有空闲名额时立即获得，不会挂起
+            await semaphore.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise OverloadedError(
+                    f"{self.name} 当前请求过多，请稍后重试",
+                    status_code=429,
+                    retry_after=self._retry_after()
+                )
+            
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise OverloadedError(
+                    f"{self.name} 排队超时，请稍后重试",
+                    status_code=503,
+                    retry_after=self._retry_after()
+                )
+            finally:
+                self.waiting -= 1
+        
+        wait = time.monotonic() - start
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.admitted += 1
+        self.active += 1
+        service_start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.completed += 1
+            self.total_service += time.monotonic() - service_start
+            semaphore.release()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取并发、排队深度和等待时间统计"""
+        return {
+            "name": self.name,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait_seconds": round(self.total_wait / self.admitted, 4) if self.admitted else 0.0,
+            "max_wait_seconds": round(self.max_wait, 4)
+        }
+
+# 上游 LLM 调用的准入控制实例
+llm_admission = AdmissionController(
+    name="LLM",
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_queue=settings.LLM_MAX_QUEUE,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT
+)
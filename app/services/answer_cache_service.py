@@ -0,0 +1,192 @@
+import logging
+import json
+import time
+import hashlib
+import unicodedata
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.services.redis_service import redis_service
+from app.services.tracing_service import tracing_service
+
+logger = logging.getLogger(__name__)
+
+class AnswerCacheService:
+    # 归一化时去除的结尾标点
+    TRAILING_PUNCTUATION = "?？!！。.,，~～ "
+    
+    def __init__(self):
+        """初始化回答缓存服务（仅缓存无会话历史的首轮问题）"""
+        self.redis_service = redis_service
+        self.enabled = settings.ANSWER_CACHE_ENABLED
+        self.ttl = settings.ANSWER_CACHE_TTL
+        self.hits = 0
+        self.misses = 0
+        # 知识库版本号的本地缓存，避免每次查询都多一次 Redis 往返
+        self._kb_version = 0
+        self._kb_version_checked_at = 0.0
+    
+    def normalize_query(self, query: str) -> str:
+        """
+        归一化查询文本：全角转半角、转小写、合并空白、去掉结尾标点
+        
+        Args:
+            query (str): 原始查询
+            
+        Returns:
+            str: 归一化后的查询
+        """
+        normalized = unicodedata.normalize("NFKC", query or "").lower()
+        normalized = " ".join(normalized.split())
+        return normalized.rstrip(self.TRAILING_PUNCTUATION)
+    
+    async def refresh_kb_version_async(self) -> int:
+        """获取知识库版本号（本地缓存 KB_VERSION_REFRESH_SECONDS 秒），通过异步 Redis 客户端刷新，不阻塞事件循环"""
+        now = time.monotonic()
+        if now - self._kb_version_checked_at >= settings.KB_VERSION_REFRESH_SECONDS:
+            self._kb_version = await self.redis_service.get_knowledge_version_async()
+            self._kb_version_checked_at = now
+        return self._kb_version
+    
+    def invalidate_kb_version(self) -> None:
+        """本地知识库版本号过期，下次读取时从 Redis 重新获取"""
+        self._kb_version_checked_at = 0.0
+    
+    @property
+    def kb_version(self) -> int:
+        """最近一次读取到的知识库版本号（不访问 Redis）"""
+        return self._kb_version
+    
+    def coalescing_key(self, query: str, faq_ids: Optional[List[str]] = None) -> str:
+        """
+        构建并发请求合并键：知识库版本 + 归一化查询（+ 有序FAQ ID），不访问 Redis
+        
+        Args:
+            query (str): 用户查询
+            faq_ids (Optional[List[str]]): 检索到的有序FAQ ID，检索阶段尚未得到时为 None
+            
+        Returns:
+            str: 合并键
+        """
+        key = f"v{self._kb_version}:{self.normalize_query(query)}"
+        if faq_ids is not None:
+            key += "|" + ",".join(str(faq_id) for faq_id in faq_ids)
+        return key
+    
+    async def coalescing_key_async(self, query: str, faq_ids: Optional[List[str]] = None) -> str:
+        """
+        先刷新知识库版本号再构建合并键，知识库更新后新的请求不会合并到旧版本的进行中请求上
+
+        Redis 不可用时使用本地缓存的版本号。
+
+        Args:
+            query (str): 用户查询
+            faq_ids (Optional[List[str]]): 检索到的有序FAQ ID，检索阶段尚未得到时为 None
+
+        Returns:
+            str: 合并键
+        """
+        try:
+            await self.redis_service.call_async(self.refresh_kb_version_async)
+        except Exception as e:
+            logger.debug(f"⚠️ 刷新知识库版本失败，使用本地缓存的版本号: {str(e)}")
+        return self.coalescing_key(query, faq_ids)
+    
+    def build_key(self, query: str, faq_ids: List[str]) -> str:
+        """
+        构建缓存键：知识库版本 + 归一化查询 + 有序的FAQ ID列表
+        
+        只使用本地缓存的知识库版本号，不访问 Redis；调用前先执行 refresh_kb_version_async
+        
+        Args:
+            query (str): 用户查询
+            faq_ids (List[str]): get_similar_faq_ids 返回的有序FAQ ID
+            
+        Returns:
+            str: Redis 缓存键
+        """
+        raw = self.normalize_query(query) + "|" + ",".join(str(faq_id) for faq_id in faq_ids)
+        digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+        return f"{self.redis_service.NAMESPACE}:answer-cache:v{self._kb_version}:{digest}"
+    
+    async def _get(self, query: str, faq_ids: List[str]) -> Optional[Dict[str, Any]]:
+        await self.refresh_kb_version_async()
+        cached = await self.redis_service.async_client.get(self.build_key(query, faq_ids))
+        return json.loads(cached) if cached else None
+    
+    async def _set(self, query: str, faq_ids: List[str], response: Dict[str, Any]) -> None:
+        value = {
+            "content": response["content"],
+            "role": response.get("role", "assistant"),
+            "model": response.get("model")
+        }
+        await self.refresh_kb_version_async()
+        await self.redis_service.async_client.setex(
+            self.build_key(query, faq_ids),
+            self.ttl,
+            json.dumps(value, ensure_ascii=False)
+        )
+    
+    @tracing_service.traced("answer_cache.get")
+    async def get(self, query: str, faq_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存的回答
+        
+        Args:
+            query (str): 用户查询
+            faq_ids (List[str]): 检索到的有序FAQ ID
+            
+        Returns:
+            Optional[Dict[str, Any]]: 命中时返回回答字典，否则返回 None
+        """
+        if not self.enabled or not faq_ids:
+            return None
+        try:
+            # 经 Redis 熔断器执行：Redis 不可用时直接按未命中处理
+            cached = await self.redis_service.call_async(self._get, query, faq_ids)
+        except Exception as e:
+            logger.warning(f"⚠️ 读取回答缓存失败: {str(e)}")
+            return None
+        
+        if cached:
+            self.hits += 1
+            logger.debug(f"✅ 回答缓存命中 (命中率: {self.hit_rate:.2%})")
+        else:
+            self.misses += 1
+        return cached
+    
+    @tracing_service.traced("answer_cache.set")
+    async def set(self, query: str, faq_ids: List[str], response: Dict[str, Any]) -> None:
+        """
+        缓存回答
+        
+        Args:
+            query (str): 用户查询
+            faq_ids (List[str]): 检索到的有序FAQ ID
+            response (Dict[str, Any]): generate_response 的返回值
+        """
+        if not self.enabled or not faq_ids or response.get("error"):
+            return
+        try:
+            await self.redis_service.call_async(self._set, query, faq_ids, response)
+        except Exception as e:
+            logger.warning(f"⚠️ 写入回答缓存失败: {str(e)}")
+    
+    @property
+    def hit_rate(self) -> float:
+        """当前进程的缓存命中率"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "ttl": self.ttl,
+            "kb_version": self._kb_version
+        }
+
+# 创建回答缓存服务实例
+answer_cache_service = AnswerCacheService()
@@ -0,0 +1,195 @@
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+class CircuitBreaker:
+    """
+    异步调用的熔断器
+
+    - closed: 正常调用；连续失败 failure_threshold 次后打开
+    - open: 直接抛出 CircuitOpenError，不再等待超时；cooldown 秒后进入 half_open
+    - half_open: 只放行一次试探调用，成功则关闭并通知恢复回调，失败则重新打开
+
+    只有 failure_types 中的异常（连接错误、超时）计为失败；其他异常（如 WRONGTYPE）说明服务可达，按成功处理。
+    状态和计数在事件循环和线程池（call_sync）中都会更新，由同一把锁保护；恢复回调在锁外调用。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float, timeout: float,
+                 failure_types: Tuple[Type[BaseException], ...]):
+        """
+        初始化熔断器
+
+        Args:
+            name (str): 用于日志和统计的名称
+            failure_threshold (int): 连续失败多少次后打开
+            cooldown (float): 打开后多少秒允许试探调用
+            timeout (float): 单次调用的超时时间（秒），超时计为失败
+            failure_types (Tuple[Type[BaseException], ...]): 计为失败的异常类型
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.failure_types = failure_types + (asyncio.TimeoutError,)
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.last_error = None
+        self._recovery_callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opens = 0
+
+    def on_recovery(self, callback: Callable[[], None]) -> None:
+        """注册熔断器从打开恢复为关闭时调用的回调（在事件循环中同步调用）"""
+        self._recovery_callbacks.append(callback)
+
+    @property
+    def is_open(self) -> bool:
+        """是否处于打开或试探状态（调用可能被拒绝）"""
+        return self.state != self.CLOSED
+
+    def _admit(self) -> Tuple[bool, bool]:
+        """
+        判断是否放行一次异步调用，放行时计入调用次数
+
+        Returns:
+            Tuple[bool, bool]: (是否放行, 是否为试探调用)；试探状态下只放行一次
+        """
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = self.HALF_OPEN
+                logger.info(f"🔄 {self.name} 熔断器进入试探状态")
+                self.calls += 1
+                return True, True
+            if self.state != self.CLOSED:
+                self.rejected += 1
+                return False, False
+            self.calls += 1
+            return True, False
+
+    def _on_success(self) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            recovered = self.state != self.CLOSED
+            self.state = self.CLOSED
+        if recovered:
+            logger.info(f"✅ {self.name} 已恢复，熔断器关闭")
+            for callback in self._recovery_callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.error(f"❌ {self.name} 恢复回调执行失败: {str(e)}")
+
+    def _on_failure(self, error: BaseException) -> None:
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {str(error)}"
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opens += 1
+                    logger.warning(f"⚠️ {self.name} 连续失败{self.consecutive_failures}次，熔断器打开 {self.cooldown}秒: {self.last_error}")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """
+        经熔断器执行异步调用
+
+        Args:
+            fn (Callable[..., Awaitable[Any]]): 返回协程的函数
+            *args, **kwargs: 传给 fn 的参数
+
+        Returns:
+            Any: fn 的结果
+
+        Raises:
+            CircuitOpenError: 熔断器打开（或已有试探调用在进行中）
+        """
+        allowed, trial = self._admit()
+        if not allowed:
+            raise CircuitOpenError(f"{self.name} 熔断器已打开")
+
+        try:
+            result = await asyncio.wait_for(fn(*args, **kwargs), self.timeout)
+        except self.failure_types as e:
+            self._on_failure(e)
+            raise
+        except asyncio.CancelledError:
+            # 试探调用被取消时不能一直停在 half_open，重新打开以便下次再试
+            with self._lock:
+                if trial and self.state == self.HALF_OPEN:
+                    self.state = self.OPEN
+            raise
+        except Exception:
+            self._on_success()
+            raise
+        self._on_success()
+        return result
+
+    def call_sync(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        经熔断器执行同步调用（线程池中的调用使用）
+
+        打开或试探期间直接拒绝，试探调用只由异步调用发起，恢复回调始终在事件循环中执行。
+        超时由客户端自身的 socket 超时控制。
+
+        Args:
+            fn (Callable[..., Any]): 同步函数
+            *args, **kwargs: 传给 fn 的参数
+
+        Returns:
+            Any: fn 的结果
+
+        Raises:
+            CircuitOpenError: 熔断器打开或处于试探状态
+        """
+        with self._lock:
+            if self.state != self.CLOSED:
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} 熔断器已打开")
+            self.calls += 1
+
+        try:
+            result = fn(*args, **kwargs)
+        except self.failure_types as e:
+            self._on_failure(e)
+            raise
+        with self._lock:
+            # 只在仍处于关闭状态时清零，不覆盖期间发生的打开或试探
+            if self.state == self.CLOSED:
+                self.consecutive_failures = 0
+        return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取熔断器状态和统计信息"""
+        retry_in = None
+        if self.state == self.OPEN:
+            retry_in = round(max(0.0, self.cooldown - (time.monotonic() - self.opened_at)), 3)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "cooldown": self.cooldown,
+            "timeout": self.timeout,
+            "retry_in": retry_in,
+            "last_error": self.last_error,
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "opens": self.opens
+        }
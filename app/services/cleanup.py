@@ -1,7 +1,10 @@
+import logging
 import os
 import glob
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
+
 def delete_update_file(update_file, data_dir):
     """
     删除指定的更新文件
@@ -19,11 +22,11 @@ def delete_update_file(update_file, data_dir):
         
         if os.path.exists(file_path):
             os.remove(file_path)
-            print(f"✅ 已删除临时JSON文件: {file_path}")
+            logger.info(f"✅ 已删除临时JSON文件: {file_path}")
             return True
         else:
-            print(f"⚠️ 找不到临时JSON文件: {file_path}")
+            logger.warning(f"⚠️ 找不到临时JSON文件: {file_path}")
             return False
     except Exception as e:
-        print(f"⚠️ 删除临时JSON文件失败: {str(e)}")
+        logger.warning(f"⚠️ 删除临时JSON文件失败: {str(e)}")
         return False 
\ No newline at end of file
@@ -0,0 +1,135 @@
+import logging
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import numpy as np
+from app.core.config import settings
+from app.services.redis_service import redis_service
+from app.services.circuit_breaker import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCacheService:
+    def __init__(self):
+        """
+        初始化查询 embedding 的两级缓存
+        
+        L1: 进程内 LRU（有容量上限）
+        L2: Redis，多个 worker 共享，值为紧凑的 float32 字节串
+        """
+        self.redis_service = redis_service
+        self.enabled = settings.EMBEDDING_CACHE_ENABLED
+        self.max_size = settings.EMBEDDING_CACHE_SIZE
+        self.ttl = settings.EMBEDDING_CACHE_TTL
+        self._local = OrderedDict()
+        # 检索在线程池中执行，本地 LRU 需要加锁
+        self._lock = threading.Lock()
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+    
+    def build_key(self, model: str, text: str) -> str:
+        """
+        构建缓存键：embedding 模型 + 预处理后查询文本的哈希
+        
+        Args:
+            model (str): embedding 模型名称
+            text (str): 预处理后的查询文本
+            
+        Returns:
+            str: 缓存键
+        """
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.redis_service.NAMESPACE}:embedding:{model}:{digest}"
+    
+    def _get_local(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            embedding = self._local.get(key)
+            if embedding is not None:
+                self._local.move_to_end(key)
+            return embedding
+    
+    def _set_local(self, key: str, embedding: List[float]) -> None:
+        with self._lock:
+            self._local[key] = embedding
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+    
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """
+        查询缓存的 embedding，先查本地 LRU，再查 Redis
+        
+        Args:
+            model (str): embedding 模型名称
+            text (str): 预处理后的查询文本
+            
+        Returns:
+            Optional[List[float]]: 命中时返回 embedding，否则返回 None
+        """
+        if not self.enabled:
+            return None
+        
+        key = self.build_key(model, text)
+        embedding = self._get_local(key)
+        if embedding is not None:
+            self.l1_hits += 1
+            return embedding
+        
+        try:
+            raw = self.redis_service.call_sync(self.redis_service.binary_client.get, key)
+        except CircuitOpenError:
+            # Redis 熔断期间只使用本地 LRU，不在线程池中逐个等待超时
+            raw = None
+        except Exception as e:
+            logger.warning(f"⚠️ 读取 embedding 缓存失败: {str(e)}")
+            raw = None
+        
+        if raw:
+            embedding = np.frombuffer(raw, dtype=np.float32).tolist()
+            self._set_local(key, embedding)
+            self.l2_hits += 1
+            return embedding
+        
+        self.misses += 1
+        return None
+    
+    def set(self, model: str, text: str, embedding: List[float]) -> None:
+        """
+        写入两级缓存
+        
+        Args:
+            model (str): embedding 模型名称
+            text (str): 预处理后的查询文本
+            embedding (List[float]): embedding 向量
+        """
+        if not self.enabled or not embedding:
+            return
+        
+        key = self.build_key(model, text)
+        # 两级缓存统一保存 float32 精度，保证各 worker 命中的结果一致
+        vector = np.asarray(embedding, dtype=np.float32)
+        self._set_local(key, vector.tolist())
+        try:
+            self.redis_service.call_sync(self.redis_service.binary_client.setex, key, self.ttl, vector.tobytes())
+        except CircuitOpenError:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ 写入 embedding 缓存失败: {str(e)}")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        total = self.l1_hits + self.l2_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._local),
+            "max_size": self.max_size,
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.l1_hits + self.l2_hits) / total, 4) if total else 0.0
+        }
+
+# 创建 embedding 缓存服务实例
+embedding_cache_service = EmbeddingCacheService()
@@ -0,0 +1,68 @@
+import logging
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class ExecutorService:
+    def __init__(self):
+        """
+        初始化阻塞调用专用线程池
+        
+        同步的 Redis、OpenAI embedding（含 time.sleep 重试）、ChromaDB 查询和知识库文件读取
+        都通过这里执行，避免占用事件循环。线程数和排队数量均有上限。
+        """
+        self.max_workers = settings.BLOCKING_EXECUTOR_WORKERS
+        self.max_pending = settings.BLOCKING_EXECUTOR_MAX_PENDING
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """线程池（按需创建）"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="blocking-io"
+            )
+        return self._executor
+    
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """限制同时提交到线程池的任务数（执行中 + 排队中）"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers + self.max_pending)
+        return self._semaphore
+    
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        在线程池中执行阻塞函数并等待结果
+        
+        Args:
+            func (Callable): 阻塞函数
+            *args, **kwargs: 传给 func 的参数
+            
+        Returns:
+            Any: func 的返回值
+        """
+        loop = asyncio.get_running_loop()
+        # 在调用方的上下文副本中执行，使线程中的追踪 span 挂在当前请求之下
+        context = contextvars.copy_context()
+        async with self._get_semaphore():
+            return await loop.run_in_executor(
+                self.executor,
+                functools.partial(context.run, func, *args, **kwargs)
+            )
+    
+    def shutdown(self) -> None:
+        """关闭线程池，等待已提交的任务结束"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            logger.info("✅ 阻塞调用线程池已关闭")
+
+# 创建线程池服务实例
+executor_service = ExecutorService()
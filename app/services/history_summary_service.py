@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import datetime
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.services.redis_service import redis_service
+from app.services.session_cache_service import session_cache_service
+from app.services.llm_router_service import llm_router_service
+from app.services.token_service import token_service
+from app.services.metrics_service import metrics_service
+from app.services.tracing_service import tracing_service
+
+logger = logging.getLogger(__name__)
+
+class HistorySummaryService:
+    # 压缩会话历史的提示词
+    SUMMARY_PROMPT = (
+        "你负责压缩AiCoin智能客服的会话历史。请把已有摘要和新增的对话合并为一段新的摘要，"
+        "保留用户关注的问题、已经给出的关键结论和操作步骤、用户提供的账户或设备信息以及尚未解决的问题，"
+        "省略寒暄和重复内容。只输出摘要正文，不超过{max_chars}字。"
+    )
+
+    def __init__(self):
+        """初始化会话历史压缩服务：会话消息数超过阈值时，把较早的轮次合并到滚动摘要中"""
+        self.enabled = settings.HISTORY_SUMMARY_ENABLED
+        self.trigger_messages = settings.HISTORY_SUMMARY_TRIGGER_MESSAGES
+        # 至少保留构建提示词所需的最近轮次
+        self.keep_messages = max(settings.HISTORY_SUMMARY_KEEP_ROUNDS, settings.HISTORY_PROMPT_ROUNDS) * 2
+        self.model = settings.HISTORY_SUMMARY_MODEL
+        # 压缩在独立的后台任务中执行，使用自己的并发上限，不占用面向用户请求的 LLM 并发名额
+        self.concurrency = max(1, settings.HISTORY_SUMMARY_CONCURRENCY)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.compactions = 0
+        self.failures = 0
+
+    def _fold_count(self, messages: List[Dict[str, Any]], persisted: int) -> int:
+        """
+        计算从头部折叠的消息条数：保留最近 keep_messages 条，只折叠已写入 Strapi 的消息（折叠后原文从 Redis 中删除），
+        并且折叠部分以助手回复结尾（不拆开一轮对话）
+        """
+        count = min(len(messages) - self.keep_messages, persisted)
+        while count > 0 and messages[count - 1]["role"] != "assistant":
+            count -= 1
+        return count
+
+    def _build_messages(self, previous: Optional[Dict[str, Any]], folded: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """构建压缩请求：固定的系统提示词 + 已有摘要和需要折叠的对话"""
+        lines = []
+        for msg in folded:
+            role = "用户" if msg["role"] == "user" else "助手"
+            content = token_service.truncate(msg["content"], settings.PROMPT_MAX_MESSAGE_TOKENS)
+            lines.append(f"{role}: {content}")
+
+        parts = []
+        if previous:
+            parts.append(f"## 已有摘要\n{previous['content']}")
+        parts.append("## 新增对话\n" + "\n".join(lines))
+        return [
+            {"role": "system", "content": self.SUMMARY_PROMPT.format(max_chars=settings.HISTORY_SUMMARY_MAX_TOKENS)},
+            {"role": "user", "content": "\n\n".join(parts)}
+        ]
+
+    async def _summarize(self, previous: Optional[Dict[str, Any]], folded: List[Dict[str, Any]]) -> str:
+        payload = {
+            "model": self.model,
+            "messages": self._build_messages(previous, folded),
+            "temperature": 0.2,
+            "max_tokens": settings.HISTORY_SUMMARY_MAX_TOKENS * 2
+        }
+        async with self._get_semaphore():
+            result, _ = await llm_router_service.complete(payload)
+        content = result["choices"][0]["message"]["content"].strip()
+        return token_service.truncate(content, settings.HISTORY_SUMMARY_MAX_TOKENS)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # 在事件循环中首次使用时创建
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def schedule(self, session_id: str, length: int) -> None:
+        """
+        在独立的后台任务中压缩会话（不等待结果），写入会话历史后调用
+
+        同一会话已有进行中的压缩时跳过；未超过阈值时不创建任务。
+
+        Args:
+            session_id (str): 会话 ID
+            length (int): 追加后的列表长度（RPUSH 的返回值）
+        """
+        if not self.enabled or length <= self.trigger_messages:
+            return
+        task = self._tasks.get(session_id)
+        if task is not None and not task.done():
+            return
+        task = asyncio.get_running_loop().create_task(self.maybe_compact(session_id, length))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda t: self._tasks.pop(session_id, None) if self._tasks.get(session_id) is t else None)
+
+    async def shutdown(self) -> None:
+        """取消进行中的压缩（压缩是可选的，下一轮对话后会重新触发），由 app.main.lifespan 调用"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    @tracing_service.traced("history.compact")
+    async def maybe_compact(self, session_id: str, length: Optional[int] = None) -> bool:
+        """
+        会话消息数超过 HISTORY_SUMMARY_TRIGGER_MESSAGES 时压缩较早的轮次（由 schedule 在独立的后台任务中调用）
+
+        Args:
+            session_id (str): 会话 ID
+            length (Optional[int]): 追加后的列表长度（RPUSH 的返回值），未超过阈值时无需读取历史
+
+        Returns:
+            bool: 是否执行了压缩
+        """
+        if not self.enabled or (length is not None and length <= self.trigger_messages):
+            return False
+
+        try:
+            entries, persisted = await redis_service.get_history_entries_async(session_id)
+            if len(entries) <= self.trigger_messages:
+                return False
+
+            messages = [msg for _, msg in entries]
+            fold_count = self._fold_count(messages, persisted)
+            if fold_count <= 0:
+                # 较早的消息还未写入 Strapi，下一轮对话后再试
+                return False
+
+            # 同一会话同时只有一个进程执行压缩
+            lock_name = f"history-compact:{session_id}"
+            if not await redis_service.acquire_lock_async(lock_name, settings.HISTORY_SUMMARY_LOCK_TTL):
+                return False
+            try:
+                with metrics_service.stage("history_compaction"):
+                    previous = await redis_service.get_history_summary_async(session_id)
+                    content = await self._summarize(previous, messages[:fold_count])
+                    summary = {
+                        "content": content,
+                        "folded_messages": (previous["folded_messages"] if previous else 0) + fold_count,
+                        "updated_at": datetime.datetime.now().isoformat()
+                    }
+                    applied = await redis_service.apply_history_compaction_async(
+                        session_id, [item for item, _ in entries[:fold_count]], summary
+                    )
+            finally:
+                await redis_service.release_lock_async(lock_name)
+
+            if applied:
+                await session_cache_service.invalidate(session_id)
+                self.compactions += 1
+                logger.info(f"🗜️ 会话历史已压缩: session_id={session_id}, 折叠{fold_count}条消息")
+            else:
+                logger.debug(f"⚠️ 会话历史在压缩期间发生变化，放弃本次压缩: session_id={session_id}")
+            return applied
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"⚠️ 压缩会话历史失败: session_id={session_id}, {str(e)}")
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取压缩统计信息"""
+        return {
+            "enabled": self.enabled,
+            "trigger_messages": self.trigger_messages,
+            "keep_messages": self.keep_messages,
+            "running": len(self._tasks),
+            "compactions": self.compactions,
+            "failures": self.failures
+        }
+
+# 创建会话历史压缩服务实例
+history_summary_service = HistorySummaryService()
@@ -0,0 +1,95 @@
+import logging
+import asyncio
+import httpx
+from typing import Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class HTTPClientService:
+    def __init__(self):
+        """初始化进程级共享的 HTTP 客户端池（在应用 lifespan 中创建和关闭）"""
+        self.openai_url = settings.OPENAI_API_URL
+        self.strapi_url = settings.LOCAL_STRAPI_API_URL.rstrip('/') if settings.LOCAL_STRAPI_API_URL else None
+        self._openai_client: Optional[httpx.AsyncClient] = None
+        self._strapi_client: Optional[httpx.AsyncClient] = None
+        self.http2 = self._http2_enabled()
+    
+    def _http2_enabled(self) -> bool:
+        """HTTP/2 依赖 h2 包（httpx[http2]），缺失时回退到 HTTP/1.1 keep-alive"""
+        if not settings.HTTP2_ENABLED:
+            return False
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            logger.warning("⚠️ 未安装 h2，HTTP 客户端将回退到 HTTP/1.1")
+            return False
+    
+    def _create_client(self) -> httpx.AsyncClient:
+        """按配置创建带连接池限制的异步客户端"""
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        )
+        return httpx.AsyncClient(
+            http2=self.http2,
+            limits=limits,
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+        )
+    
+    @property
+    def openai_client(self) -> httpx.AsyncClient:
+        """访问 LLM 网关的共享客户端（未经 lifespan 启动时按需创建）"""
+        if self._openai_client is None or self._openai_client.is_closed:
+            self._openai_client = self._create_client()
+        return self._openai_client
+    
+    @property
+    def strapi_client(self) -> httpx.AsyncClient:
+        """访问本地 Strapi 的共享客户端（未经 lifespan 启动时按需创建）"""
+        if self._strapi_client is None or self._strapi_client.is_closed:
+            self._strapi_client = self._create_client()
+        return self._strapi_client
+    
+    async def _prewarm(self, client: httpx.AsyncClient, url: Optional[str], name: str) -> None:
+        """
+        预热连接：提前完成 TCP/TLS 握手，让连接进入 keep-alive 池
+        
+        Args:
+            client (httpx.AsyncClient): 要预热的客户端
+            url (Optional[str]): 目标地址，任何状态码都视为握手成功
+            name (str): 用于日志的名称
+        """
+        if not url or settings.HTTP_PREWARM_CONNECTIONS <= 0:
+            return
+        
+        results = await asyncio.gather(
+            *[client.head(url) for _ in range(settings.HTTP_PREWARM_CONNECTIONS)],
+            return_exceptions=True
+        )
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures:
+            logger.warning(f"⚠️ {name} 连接预热失败 ({len(failures)}/{len(results)}): {str(failures[0])}")
+        else:
+            logger.info(f"✅ {name} 连接预热完成 ({len(results)} 个)")
+    
+    async def startup(self) -> None:
+        """创建共享客户端并预热连接，由 app.main.lifespan 调用"""
+        await asyncio.gather(
+            self._prewarm(self.openai_client, self.openai_url, "OpenAI"),
+            self._prewarm(self.strapi_client, self.strapi_url, "Strapi")
+        )
+    
+    async def shutdown(self) -> None:
+        """关闭共享客户端，释放所有 keep-alive 连接"""
+        for client in (self._openai_client, self._strapi_client):
+            if client is not None and not client.is_closed:
+                await client.aclose()
+        self._openai_client = None
+        self._strapi_client = None
+        logger.info("✅ HTTP 客户端池已关闭")
+
+# 创建 HTTP 客户端服务实例
+http_client_service = HTTPClientService()
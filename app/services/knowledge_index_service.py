@@ -0,0 +1,138 @@
+import logging
+import os
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class KnowledgeRecord:
+    """单条知识库数据的紧凑表示"""
+    __slots__ = ("id", "faq", "keywords", "response", "app_image_url", "pc_image_url")
+    
+    def __init__(self, item: Dict[str, Any]):
+        self.id = str(item.get("id"))
+        self.faq = item.get("FAQ") or ""
+        self.keywords = item.get("Keywords") or ""
+        self.response = item.get("Response") or ""
+        self.app_image_url = item.get("Response_Pic_App_URL") or ""
+        self.pc_image_url = item.get("Response_Pic_Pc_URL") or ""
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为与 strapi_knowledge_parsed.json 条目一致的字典"""
+        return {
+            "id": self.id,
+            "FAQ": self.faq,
+            "Keywords": self.keywords,
+            "Response": self.response,
+            "Response_Pic_App_URL": self.app_image_url,
+            "Response_Pic_Pc_URL": self.pc_image_url
+        }
+
+class KnowledgeIndexService:
+    def __init__(self, json_path: Optional[str] = None):
+        """
+        初始化常驻内存的知识库索引（按ID索引）
+        
+        知识库文件只在首次使用或文件变更时解析一次，之后按ID直接查找；
+        重新加载时先构建新索引，再整体替换引用，读请求不会看到半成品；
+        加载失败时继续使用上一次成功加载的索引，直到文件再次变更才重试。
+        """
+        if json_path is None:
+            data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+            json_path = os.path.join(data_dir, "strapi_knowledge_parsed.json")
+        self.json_path = json_path
+        self._records: Dict[str, KnowledgeRecord] = {}
+        self._mtime: Optional[int] = None
+        self._failed_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+    
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.json_path).st_mtime_ns
+        except OSError:
+            return None
+    
+    def replace(self, items: Iterable[Dict[str, Any]], mtime: Optional[int] = None) -> int:
+        """
+        用新数据构建索引并原子替换
+        
+        Args:
+            items (Iterable[Dict[str, Any]]): 解析后的知识库条目
+            mtime (Optional[int]): 数据对应的文件修改时间（纳秒），默认读取当前文件
+            
+        Returns:
+            int: 索引中的条目数
+        """
+        records = {}
+        for item in items:
+            if isinstance(item, dict) and "id" in item:
+                record = KnowledgeRecord(item)
+                records[record.id] = record
+        
+        self._records = records
+        self._mtime = mtime if mtime is not None else self._file_mtime()
+        return len(records)
+    
+    def reload(self) -> bool:
+        """
+        从知识库文件重新加载索引
+        
+        Returns:
+            bool: 是否加载成功
+        """
+        with self._lock:
+            mtime = self._file_mtime()
+            if mtime is None:
+                logger.error(f"❌ 错误: 找不到知识库文件 {self.json_path}")
+                return False
+            
+            try:
+                with open(self.json_path, 'r', encoding='utf-8') as f:
+                    knowledge_items = json.load(f)
+            except Exception as e:
+                self._failed_mtime = mtime
+                logger.error(f"❌ 加载知识库索引失败，继续使用已加载的 {len(self._records)} 条数据: {str(e)}")
+                return False
+            
+            if not isinstance(knowledge_items, list):
+                self._failed_mtime = mtime
+                logger.error("❌ 错误: 知识库数据格式不正确，应为数组格式")
+                return False
+            
+            count = self.replace(knowledge_items, mtime)
+            logger.info(f"✅ 知识库索引已加载，共 {count} 条数据")
+            return True
+    
+    def _ensure_fresh(self) -> None:
+        """首次使用或文件被其他进程更新时重新加载（仅一次 stat 调用），同一版本加载失败后不再重试"""
+        mtime = self._file_mtime()
+        if mtime is not None and mtime != self._mtime and mtime != self._failed_mtime:
+            self.reload()
+    
+    def get_many(self, ids: List[Any]) -> List[KnowledgeRecord]:
+        """
+        按ID列表获取知识库条目，保持传入顺序，跳过不存在的ID
+        
+        Args:
+            ids (List[Any]): FAQ ID 列表
+            
+        Returns:
+            List[KnowledgeRecord]: 找到的条目
+        """
+        self._ensure_fresh()
+        records = self._records
+        found = []
+        for faq_id in ids:
+            record = records.get(str(faq_id))
+            if record is not None:
+                found.append(record)
+            else:
+                logger.warning(f"⚠️ 警告: 未找到ID为 {faq_id} 的FAQ数据")
+        return found
+    
+    def __len__(self) -> int:
+        return len(self._records)
+
+# 创建知识库索引服务实例
+knowledge_index_service = KnowledgeIndexService()
@@ -0,0 +1,314 @@
+import logging
+import json
+import math
+import time
+import asyncio
+import statistics
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+import httpx
+from app.core.config import settings
+from app.services.http_client_service import http_client_service
+from app.services.metrics_service import metrics_service
+from app.services.tracing_service import tracing_service
+
+logger = logging.getLogger(__name__)
+
+class UpstreamError(Exception):
+    """可重试的上游错误（5xx、429、超时、连接失败），触发故障转移"""
+    
+    def __init__(self, message: str, reason: str = "error"):
+        super().__init__(message)
+        self.reason = reason
+
+class UpstreamEndpoint:
+    def __init__(self, name: str, url: str, model: Optional[str] = None, weight: float = 1.0,
+                 api_key: Optional[str] = None, auth_key: Optional[str] = None):
+        """
+        初始化单个上游 LLM 端点及其健康状态
+        
+        Args:
+            name (str): 端点名称
+            url (str): chat completions 地址
+            model (Optional[str]): 该端点使用的模型，为 None 时沿用请求中的模型
+            weight (float): 负载均衡权重
+            api_key (Optional[str]): 该端点的 API Key，默认使用 OPENAI_API_KEY
+            auth_key (Optional[str]): 该端点的 x-auth-key，默认使用 OPENAI_AUTH_KEY
+        """
+        self.name = name
+        self.url = url
+        self.model = model
+        self.weight = max(float(weight), 0.01)
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key or settings.OPENAI_API_KEY}",
+            "x-auth-key": auth_key or settings.OPENAI_AUTH_KEY
+        }
+        self.latencies = deque(maxlen=200)
+        self.ewma_latency: Optional[float] = None
+        self.current_weight = 0.0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+    
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+    
+    def percentile(self, p: float) -> Optional[float]:
+        """最近请求延迟的第 p 百分位（秒）"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+        return ordered[index]
+    
+    def record_success(self, latency: float) -> None:
+        self.latencies.append(latency)
+        alpha = 0.2
+        self.ewma_latency = latency if self.ewma_latency is None else alpha * latency + (1 - alpha) * self.ewma_latency
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+    
+    def record_failure(self, reason: str) -> None:
+        metrics_service.record_upstream_error(self.name, reason)
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= settings.LLM_UNHEALTHY_THRESHOLD:
+            self.unhealthy_until = time.monotonic() + settings.LLM_UNHEALTHY_COOLDOWN
+            logger.warning(f"⚠️ 上游 {self.name} 连续失败 {self.consecutive_failures} 次，暂停 {settings.LLM_UNHEALTHY_COOLDOWN} 秒")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        p95 = self.percentile(95)
+        return {
+            "name": self.name,
+            "url": self.url,
+            "model": self.model,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "consecutive_failures": self.consecutive_failures,
+            "ewma_latency_seconds": round(self.ewma_latency, 4) if self.ewma_latency is not None else None,
+            "p95_latency_seconds": round(p95, 4) if p95 is not None else None
+        }
+
+class LLMRouterService:
+    def __init__(self):
+        """初始化多上游 LLM 路由：负载均衡、对冲请求、故障转移和健康跟踪"""
+        self.strategy = settings.LLM_ROUTING_STRATEGY
+        self.endpoints = self._load_endpoints()
+        logger.info(f"🔀 LLM 路由已加载 {len(self.endpoints)} 个上游 (策略: {self.strategy})")
+    
+    def _load_endpoints(self) -> List[UpstreamEndpoint]:
+        """从 OPENAI_UPSTREAMS（JSON 列表）加载上游，未配置时使用 OPENAI_API_URL"""
+        if settings.OPENAI_UPSTREAMS:
+            try:
+                configs = json.loads(settings.OPENAI_UPSTREAMS)
+                endpoints = [
+                    UpstreamEndpoint(
+                        name=config.get("name") or f"upstream-{i}",
+                        url=config["url"],
+                        model=config.get("model"),
+                        weight=config.get("weight", 1.0),
+                        api_key=config.get("api_key"),
+                        auth_key=config.get("auth_key")
+                    )
+                    for i, config in enumerate(configs)
+                ]
+                if endpoints:
+                    return endpoints
+            except Exception as e:
+                logger.error(f"❌ 解析 OPENAI_UPSTREAMS 失败，回退到 OPENAI_API_URL: {str(e)}")
+        return [UpstreamEndpoint(name="default", url=settings.OPENAI_API_URL)]
+    
+    def select(self, exclude: Sequence[UpstreamEndpoint] = ()) -> Optional[UpstreamEndpoint]:
+        """
+        选择一个上游：优先健康的端点，全部不健康时仍在剩余端点中选择
+        
+        Args:
+            exclude (Sequence[UpstreamEndpoint]): 本次请求已尝试过的端点
+            
+        Returns:
+            Optional[UpstreamEndpoint]: 选中的端点，没有可用端点时为 None
+        """
+        candidates = [e for e in self.endpoints if e not in exclude]
+        if not candidates:
+            return None
+        healthy = [e for e in candidates if e.healthy]
+        candidates = healthy or candidates
+        
+        if self.strategy == "least_latency":
+            # 按 延迟 / 权重 选择；尚无延迟样本的端点使用已知延迟的中位数（都没有样本时用对冲初始延迟）作为先验
+            known = [e.ewma_latency for e in self.endpoints if e.ewma_latency is not None]
+            prior = statistics.median(known) if known else settings.LLM_HEDGE_INITIAL_DELAY
+            return min(candidates, key=lambda e: (e.ewma_latency if e.ewma_latency is not None else prior) / e.weight)
+        
+        # 平滑加权轮询
+        total = sum(e.weight for e in candidates)
+        for e in candidates:
+            e.current_weight += e.weight
+        chosen = max(candidates, key=lambda e: e.current_weight)
+        chosen.current_weight -= total
+        return chosen
+    
+    def _payload_for(self, endpoint: UpstreamEndpoint, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {**payload, "model": endpoint.model} if endpoint.model else payload
+    
+    def _hedge_delay(self, endpoint: UpstreamEndpoint) -> float:
+        """对冲延迟：取端点最近请求的 p95，样本不足时使用初始值"""
+        if len(endpoint.latencies) < 20:
+            return settings.LLM_HEDGE_INITIAL_DELAY
+        return max(settings.LLM_HEDGE_MIN_DELAY, endpoint.percentile(settings.LLM_HEDGE_PERCENTILE))
+    
+    @staticmethod
+    def _is_retriable_status(status_code: int) -> bool:
+        return status_code >= 500 or status_code == 429
+    
+    @tracing_service.traced("llm.upstream")
+    async def _post(self, endpoint: UpstreamEndpoint, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """向单个端点发送请求，可重试的错误转换为 UpstreamError 并记录健康状态"""
+        span = tracing_service.current_span()
+        if span is not None:
+            span.set_attribute("upstream", endpoint.name)
+        endpoint.requests += 1
+        start = time.monotonic()
+        try:
+            response = await http_client_service.openai_client.post(
+                endpoint.url,
+                headers=endpoint.headers,
+                json=self._payload_for(endpoint, payload)
+            )
+            if self._is_retriable_status(response.status_code):
+                raise UpstreamError(f"{endpoint.name} 返回 {response.status_code}", reason=str(response.status_code))
+            response.raise_for_status()
+            result = response.json()
+        except (UpstreamError, httpx.TimeoutException, httpx.TransportError) as e:
+            reason = e.reason if isinstance(e, UpstreamError) else type(e).__name__
+            endpoint.record_failure(reason)
+            raise UpstreamError(f"{endpoint.name}: {str(e) or type(e).__name__}", reason=reason) from e
+        except httpx.HTTPStatusError as e:
+            # 4xx 不重试也不影响端点健康状态，只计入错误数
+            metrics_service.record_upstream_error(endpoint.name, str(e.response.status_code))
+            raise
+        endpoint.record_success(time.monotonic() - start)
+        return result
+    
+    async def _post_hedged(self, primary: UpstreamEndpoint, payload: Dict[str, Any],
+                           tried: List[UpstreamEndpoint]) -> Tuple[Dict[str, Any], UpstreamEndpoint]:
+        """
+        向主端点发送请求，超过对冲延迟仍未返回时向另一个端点发送副本，取先成功的结果
+        
+        对冲端点会加入 tried，两个请求都失败时，故障转移不会再次选择它
+        """
+        tasks = {asyncio.ensure_future(self._post(primary, payload)): primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay(primary))
+            if not done:
+                secondary = self.select(exclude=tried)
+                if secondary is not None:
+                    tried.append(secondary)
+                    secondary.hedges += 1
+                    logger.info(f"⏱️ {primary.name} 响应较慢，向 {secondary.name} 发送对冲请求")
+                    tasks[asyncio.ensure_future(self._post(secondary, payload))] = secondary
+            
+            pending = set(tasks)
+            last_error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), tasks[task]
+                    last_error = task.exception()
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def complete(self, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], UpstreamEndpoint]:
+        """
+        发送非流式请求，5xx/429/超时时故障转移到其他端点
+        
+        Args:
+            payload (Dict[str, Any]): chat completions 请求体
+            
+        Returns:
+            Tuple[Dict[str, Any], UpstreamEndpoint]: (响应 JSON, 实际返回结果的端点)
+        """
+        tried: List[UpstreamEndpoint] = []
+        last_error: Optional[Exception] = None
+        for _ in range(max(settings.LLM_FAILOVER_ATTEMPTS, 1)):
+            endpoint = self.select(exclude=tried)
+            if endpoint is None:
+                break
+            tried.append(endpoint)
+            try:
+                if settings.LLM_HEDGE_ENABLED and len(self.endpoints) > 1:
+                    return await self._post_hedged(endpoint, payload, tried)
+                return await self._post(endpoint, payload), endpoint
+            except UpstreamError as e:
+                logger.warning(f"⚠️ 上游请求失败，尝试故障转移: {str(e)}")
+                last_error = e
+        raise last_error or UpstreamError("没有可用的上游端点")
+    
+    async def stream_lines(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        发送流式请求并逐行返回上游输出；只在收到首字节之前故障转移
+        
+        Args:
+            payload (Dict[str, Any]): chat completions 请求体（stream=true）
+            
+        Yields:
+            str: 上游 SSE 输出的每一行
+        """
+        tried: Tuple[UpstreamEndpoint, ...] = ()
+        last_error: Optional[Exception] = None
+        for _ in range(max(settings.LLM_FAILOVER_ATTEMPTS, 1)):
+            endpoint = self.select(exclude=tried)
+            if endpoint is None:
+                break
+            tried += (endpoint,)
+            endpoint.requests += 1
+            start = time.monotonic()
+            started = False
+            try:
+                async with http_client_service.openai_client.stream(
+                    "POST",
+                    endpoint.url,
+                    headers=endpoint.headers,
+                    json=self._payload_for(endpoint, payload)
+                ) as response:
+                    if self._is_retriable_status(response.status_code):
+                        raise UpstreamError(f"{endpoint.name} 返回 {response.status_code}", reason=str(response.status_code))
+                    if response.is_error:
+                        metrics_service.record_upstream_error(endpoint.name, str(response.status_code))
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not started:
+                            started = True
+                            # 流式请求以首字节时间作为端点延迟
+                            endpoint.record_success(time.monotonic() - start)
+                        yield line
+                return
+            except (UpstreamError, httpx.TimeoutException, httpx.TransportError) as e:
+                endpoint.record_failure(e.reason if isinstance(e, UpstreamError) else type(e).__name__)
+                if started:
+                    raise
+                logger.warning(f"⚠️ 上游流式请求失败，尝试故障转移: {str(e) or type(e).__name__}")
+                last_error = e
+        raise last_error or UpstreamError("没有可用的上游端点")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各上游端点的健康和延迟统计"""
+        return {
+            "strategy": self.strategy,
+            "hedge_enabled": settings.LLM_HEDGE_ENABLED,
+            "endpoints": [e.get_stats() for e in self.endpoints]
+        }
+
+# 创建 LLM 路由服务实例
+llm_router_service = LLMRouterService()
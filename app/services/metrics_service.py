@@ -0,0 +1,227 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# 各阶段耗时分布：Redis/缓存在毫秒级，embedding/ChromaDB 在百毫秒级，LLM 在秒级
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 会话变更到写入 Strapi 的延迟（合并写入的静默期通常为秒级到分钟级）
+LAG_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0, 120.0, 300.0)
+
+class ServiceStatsCollector:
+    """抓取时从各服务的 get_stats 读取缓存命中、准入控制和上游健康状态，服务本身不依赖 prometheus_client"""
+
+    def collect(self):
+        # 延迟导入，避免与被统计的服务形成循环导入
+        from app.services.answer_cache_service import answer_cache_service
+        from app.services.embedding_cache_service import embedding_cache_service
+        from app.services.admission_service import llm_admission
+        from app.services.llm_router_service import llm_router_service
+        from app.services.history_summary_service import history_summary_service
+        from app.services.redis_service import redis_service
+        from app.services.session_cache_service import session_cache_service
+        from app.services.strapi_writer_service import strapi_writer_service
+
+        lookups = CounterMetricFamily("ai_support_cache_lookups", "缓存查询次数", labels=["cache", "result"])
+        hit_rate = GaugeMetricFamily("ai_support_cache_hit_rate", "缓存命中率", labels=["cache"])
+
+        answer = answer_cache_service.get_stats()
+        lookups.add_metric(["answer", "hit"], answer["hits"])
+        lookups.add_metric(["answer", "miss"], answer["misses"])
+        hit_rate.add_metric(["answer"], answer["hit_rate"])
+
+        embedding = embedding_cache_service.get_stats()
+        lookups.add_metric(["embedding", "l1_hit"], embedding["l1_hits"])
+        lookups.add_metric(["embedding", "l2_hit"], embedding["l2_hits"])
+        lookups.add_metric(["embedding", "miss"], embedding["misses"])
+        hit_rate.add_metric(["embedding"], embedding["hit_rate"])
+
+        session = session_cache_service.get_stats()
+        lookups.add_metric(["session", "hit"], session["hits"])
+        lookups.add_metric(["session", "miss"], session["misses"])
+        lookups.add_metric(["session", "fallback"], session["fallback"]["reads"])
+        hit_rate.add_metric(["session"], session["hit_rate"])
+        yield lookups
+        yield hit_rate
+
+        admission = llm_admission.get_stats()
+        yield GaugeMetricFamily("ai_support_llm_active", "正在进行的 LLM 调用数", value=admission["active"])
+        yield GaugeMetricFamily("ai_support_llm_queue_depth", "等待 LLM 并发名额的请求数", value=admission["queue_depth"])
+        admission_total = CounterMetricFamily("ai_support_llm_admission", "LLM 准入结果", labels=["result"])
+        admission_total.add_metric(["admitted"], admission["admitted"])
+        admission_total.add_metric(["rejected"], admission["rejected"])
+        admission_total.add_metric(["timed_out"], admission["timed_out"])
+        yield admission_total
+
+        healthy = GaugeMetricFamily("ai_support_upstream_healthy", "上游 LLM 端点是否健康", labels=["upstream"])
+        p95 = GaugeMetricFamily("ai_support_upstream_p95_latency_seconds", "上游 LLM 端点最近请求的 p95 延迟", labels=["upstream"])
+        for endpoint in llm_router_service.get_stats()["endpoints"]:
+            healthy.add_metric([endpoint["name"]], 1 if endpoint["healthy"] else 0)
+            if endpoint["p95_latency_seconds"] is not None:
+                p95.add_metric([endpoint["name"]], endpoint["p95_latency_seconds"])
+        yield healthy
+        yield p95
+
+        summary = history_summary_service.get_stats()
+        compactions = CounterMetricFamily("ai_support_history_compactions", "会话历史压缩次数", labels=["result"])
+        compactions.add_metric(["success"], summary["compactions"])
+        compactions.add_metric(["failure"], summary["failures"])
+        yield compactions
+
+        codec = redis_service.codec.get_stats()
+        codec_bytes = CounterMetricFamily(
+            "ai_support_session_codec_bytes",
+            "会话数据编码字节数 (sampled_* 为抽样编码的紧凑 JSON 等价大小和实际大小)",
+            labels=["kind"]
+        )
+        codec_bytes.add_metric(["stored"], codec["stored_bytes"])
+        codec_bytes.add_metric(["sampled_json"], codec["sampled_json_bytes"])
+        codec_bytes.add_metric(["sampled_stored"], codec["sampled_stored_bytes"])
+        yield codec_bytes
+        codec_reads = CounterMetricFamily("ai_support_session_codec_reads", "会话数据读取次数", labels=["format"])
+        codec_reads.add_metric(["legacy_json"], codec["legacy_reads"])
+        codec_reads.add_metric(["binary"], codec["binary_reads"])
+        yield codec_reads
+
+        breaker = redis_service.breaker.get_stats()
+        yield GaugeMetricFamily("ai_support_redis_breaker_open", "Redis 熔断器是否打开 (half_open 也计为 1)", value=0 if breaker["state"] == "closed" else 1)
+        breaker_calls = CounterMetricFamily("ai_support_redis_breaker_calls", "经 Redis 熔断器的调用数", labels=["result"])
+        breaker_calls.add_metric(["failed"], breaker["failures"])
+        breaker_calls.add_metric(["rejected"], breaker["rejected"])
+        yield breaker_calls
+        fallback = session["fallback"]
+        yield GaugeMetricFamily("ai_support_session_pending_writes", "等待重放到 Redis 的会话写入数", value=fallback["pending_writes"])
+        session_writes = CounterMetricFamily("ai_support_session_buffered_writes", "降级模式下暂存的会话写入", labels=["result"])
+        session_writes.add_metric(["buffered"], fallback["buffered_writes"])
+        session_writes.add_metric(["replayed"], fallback["replayed_writes"])
+        session_writes.add_metric(["dropped"], fallback["dropped_writes"])
+        yield session_writes
+
+        writer = strapi_writer_service.get_stats()
+        yield GaugeMetricFamily("ai_support_strapi_write_queue_depth", "等待写入 Strapi 的会话数 (含正在写入的)", value=writer["queue_depth"])
+        yield GaugeMetricFamily("ai_support_strapi_write_oldest_pending_seconds", "等待最久的会话已等待的秒数", value=writer["oldest_pending_seconds"])
+        strapi_writes = CounterMetricFamily("ai_support_strapi_session_writes", "会话写入 Strapi 的合并情况", labels=["result"])
+        strapi_writes.add_metric(["scheduled"], writer["scheduled"])
+        strapi_writes.add_metric(["coalesced"], writer["coalesced"])
+        strapi_writes.add_metric(["flushed"], writer["flushed"])
+        strapi_writes.add_metric(["retried"], writer["retried"])
+        strapi_writes.add_metric(["failed"], writer["failed"])
+        yield strapi_writes
+
+class MetricsService:
+    def __init__(self):
+        """初始化 Prometheus 指标：请求与各阶段耗时、阶段错误、回答来源和上游错误"""
+        self.registry = CollectorRegistry()
+        self.request_latency = Histogram(
+            "ai_support_request_latency_seconds", "接口总耗时",
+            ["endpoint"], buckets=STAGE_BUCKETS, registry=self.registry
+        )
+        self.requests = Counter(
+            "ai_support_requests", "接口请求数",
+            ["endpoint", "status"], registry=self.registry
+        )
+        self.stage_latency = Histogram(
+            "ai_support_stage_latency_seconds", "请求各阶段耗时",
+            ["stage"], buckets=STAGE_BUCKETS, registry=self.registry
+        )
+        self.stage_errors = Counter(
+            "ai_support_stage_errors", "请求各阶段抛出的异常数",
+            ["stage"], registry=self.registry
+        )
+        self.answers = Counter(
+            "ai_support_answers", "按来源统计的回答数 (faq_direct / answer_cache / llm)",
+            ["source"], registry=self.registry
+        )
+        self.upstream_errors = Counter(
+            "ai_support_upstream_errors", "上游 LLM 错误数",
+            ["upstream", "reason"], registry=self.registry
+        )
+        self.prompt_tokens = Counter(
+            "ai_support_llm_prompt_tokens", "上游 LLM 输入令牌数 (cached 为命中前缀缓存的部分)",
+            ["upstream", "kind"], registry=self.registry
+        )
+        self.completion_tokens = Counter(
+            "ai_support_llm_completion_tokens", "上游 LLM 输出令牌数",
+            ["upstream"], registry=self.registry
+        )
+        self.strapi_write_lag = Histogram(
+            "ai_support_strapi_write_lag_seconds", "会话首次变更到写入 Strapi 完成的延迟",
+            buckets=LAG_BUCKETS, registry=self.registry
+        )
+        self.registry.register(ServiceStatsCollector())
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        记录一个阶段的耗时，阶段内抛出异常时同时计入错误数；可用于同步和异步代码
+
+        Args:
+            name (str): 阶段名称，如 history_fetch、query_embedding、chroma_query、llm_call
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.stage_errors.labels(name).inc()
+            raise
+        finally:
+            self.stage_latency.labels(name).observe(time.perf_counter() - start)
+
+    @contextmanager
+    def request(self, endpoint: str) -> Iterator[None]:
+        """
+        记录一次接口请求的总耗时和结果
+
+        Args:
+            endpoint (str): 接口名称
+        """
+        start = time.perf_counter()
+        status = "error"
+        try:
+            yield
+            status = "success"
+        finally:
+            self.request_latency.labels(endpoint).observe(time.perf_counter() - start)
+            self.requests.labels(endpoint, status).inc()
+
+    def record_stage_error(self, name: str) -> None:
+        """记录在阶段内部被捕获、没有向外抛出的错误"""
+        self.stage_errors.labels(name).inc()
+
+    def record_answer(self, source: str) -> None:
+        """记录回答来源"""
+        self.answers.labels(source or "unknown").inc()
+
+    def record_upstream_error(self, upstream: str, reason: str) -> None:
+        """记录上游 LLM 错误（状态码或异常类型）"""
+        self.upstream_errors.labels(upstream, reason).inc()
+
+    def record_token_usage(self, upstream: str, usage: Dict[str, int]) -> None:
+        """
+        记录一次 LLM 调用的令牌用量
+        
+        Args:
+            upstream (str): 上游端点名称
+            usage (Dict[str, int]): OpenAIService._normalize_usage 的返回值
+        """
+        cached = usage["cached_tokens"]
+        self.prompt_tokens.labels(upstream, "cached").inc(cached)
+        self.prompt_tokens.labels(upstream, "uncached").inc(max(usage["prompt_tokens"] - cached, 0))
+        self.completion_tokens.labels(upstream).inc(usage["completion_tokens"])
+    
+    def record_strapi_write_lag(self, seconds: float) -> None:
+        """记录一次合并写入 Strapi 的延迟（从会话首次变更到写入完成）"""
+        self.strapi_write_lag.observe(seconds)
+    
+    def render(self) -> Tuple[bytes, str]:
+        """
+        以 Prometheus 文本格式导出所有指标
+
+        Returns:
+            Tuple[bytes, str]: (指标内容, Content-Type)
+        """
+        return generate_latest(self.registry), CONTENT_TYPE_LATEST
+
+# 创建指标服务实例
+metrics_service = MetricsService()
@@ -1,10 +1,24 @@
+import logging
 import json
 import httpx
 import asyncio
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, AsyncIterator, Set, Tuple
 from app.core.config import settings
 from app.services.rag_service import rag_service
 from app.services.redis_service import redis_service
+from app.services.http_client_service import http_client_service
+from app.services.executor_service import executor_service
+from app.services.answer_cache_service import answer_cache_service
+from app.services.single_flight import SingleFlight
+from app.services.admission_service import llm_admission, OverloadedError
+from app.services.llm_router_service import llm_router_service
+from app.services.metrics_service import metrics_service
+from app.services.tracing_service import tracing_service
+from app.services.history_summary_service import history_summary_service
+from app.services.session_cache_service import session_cache_service
+from app.services.strapi_writer_service import strapi_writer_service
+
+logger = logging.getLogger(__name__)
 
 class OpenAIService:
     def __init__(self):
@@ -28,7 +42,12 @@ class OpenAIService:
         
         self.rag_service = rag_service  # 初始化 RAG 服务
         self.redis_service = redis_service  # 初始化 Redis 服务
+        # 合并相同首轮问题的并发上游调用
+        self.completion_flight = SingleFlight("completion")
+        # 进行中的会话保存任务，应用关闭时等待它们完成
+        self._persist_tasks: Set[asyncio.Task] = set()
     
+    @tracing_service.traced("llm.generate")
     async def generate_response(self, messages: List[Dict[str, str]], 
                              temperature: float = 0.7, 
                              max_tokens: int = 1000) -> Dict[str, Any]:
@@ -50,31 +69,148 @@ class OpenAIService:
             "max_tokens": max_tokens
         }
         
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json=payload
-                )
-                response.raise_for_status()
-                result = response.json()
+        # 准入控制：超出并发上限时排队，队列已满或排队超时直接抛出 OverloadedError
+        async with llm_admission.slot():
+            try:
+                # 经由多上游路由发送请求（负载均衡、对冲、故障转移），复用共享连接池
+                with metrics_service.stage("llm_call"):
+                    result, endpoint = await llm_router_service.complete(payload)
                 
                 # 提取回答内容
                 if "choices" in result and len(result["choices"]) > 0:
+                    usage = self._normalize_usage(result.get("usage"))
+                    metrics_service.record_token_usage(endpoint.name, usage)
+                    span = tracing_service.current_span()
+                    if span is not None:
+                        span.set_attribute("prompt_tokens", usage["prompt_tokens"])
+                        span.set_attribute("cached_tokens", usage["cached_tokens"])
+                    logger.debug(
+                        "🧮 上游令牌用量: prompt=%s cached=%s completion=%s",
+                        usage["prompt_tokens"], usage["cached_tokens"], usage["completion_tokens"]
+                    )
                     return {
                         "content": result["choices"][0]["message"]["content"],
                         "role": "assistant",
-                        "model": result.get("model", self.model),
-                        "usage": result.get("usage", {})
+                        "model": result.get("model", endpoint.model or self.model),
+                        "upstream": endpoint.name,
+                        "usage": usage
                     }
                 else:
-                    return {"content": "抱歉，无法生成回答。", "role": "assistant"}
+                    return {"content": "抱歉，无法生成回答。", "role": "assistant", "error": True}
+            
+            except Exception as e:
+                logger.error(f"OpenAI API 请求错误: {str(e)}")
+                return {"content": f"抱歉，请求出错: {str(e)}", "role": "assistant", "error": True}
+    
+    @staticmethod
+    def _normalize_usage(usage: Optional[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        统一上游返回的 usage 字段，提取前缀缓存命中的令牌数
+        
+        Args:
+            usage (Optional[Dict[str, Any]]): 上游响应中的 usage，cached_tokens 位于 prompt_tokens_details 中
+            
+        Returns:
+            Dict[str, int]: {"prompt_tokens", "cached_tokens", "completion_tokens", "total_tokens"}
+        """
+        usage = usage or {}
+        details = usage.get("prompt_tokens_details") or {}
+        return {
+            "prompt_tokens": usage.get("prompt_tokens") or 0,
+            "cached_tokens": details.get("cached_tokens") or 0,
+            "completion_tokens": usage.get("completion_tokens") or 0,
+            "total_tokens": usage.get("total_tokens") or 0
+        }
+    
+    async def generate_response_stream(self, messages: List[Dict[str, str]],
+                                       temperature: float = 0.7,
+                                       max_tokens: int = 1000) -> AsyncIterator[str]:
+        """
+        通过 OpenAI API 以流式方式生成回答（stream=true）
+        
+        Args:
+            messages (List[Dict[str, str]]): 消息列表，包含角色和内容
+            temperature (float): 温度参数，控制随机性
+            max_tokens (int): 最大令牌数
+            
+        Yields:
+            str: 上游返回的增量文本片段
+        """
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        
+        # 流式调用在整个输出期间占用一个并发名额
+        async with llm_admission.slot():
+            # 上游按 SSE 格式返回，每行形如 "data: {...}"，以 "data: [DONE]" 结束
+            with metrics_service.stage("llm_stream"):
+                async for line in llm_router_service.stream_lines(payload):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
                     
-        except Exception as e:
-            print(f"OpenAI API 请求错误: {str(e)}")
-            return {"content": f"抱歉，请求出错: {str(e)}", "role": "assistant"}
+                    try:
+                        chunk = json.loads(data)
+                    except json.JSONDecodeError:
+                        logger.warning(f"⚠️ 无法解析的流式数据: {data[:100]}")
+                        continue
+                    
+                    choices = chunk.get("choices") or []
+                    if not choices:
+                        continue
+                    delta = choices[0].get("delta") or {}
+                    content = delta.get("content")
+                    if content:
+                        yield content
+        
+    async def generate_rag_response_stream(self, session_id: str, query: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        使用 RAG 提示词模板以流式方式生成回答
+        
+        Args:
+            session_id (str): 会话 ID
+            query (Optional[str]): 当前查询，如果为 None，则使用会话历史中的最后一个用户查询
+            
+        Yields:
+            str: 增量文本片段
+        """
+        # 与非流式接口复用同一套 RAG 提示词构建逻辑
+        context = await self.rag_service.build_rag_context(session_id, query)
+        
+        # 与非流式接口相同：高置信度命中单条FAQ时直接返回知识库中的回答，作为一个片段输出，不调用 LLM
+        direct = self._direct_answer(context)
+        if direct:
+            yield direct["content"]
+            return
+        
+        # 首轮问题优先使用回答缓存，命中时一次性返回完整回答
+        use_cache = not context["full_history"]
+        if use_cache:
+            cached = await answer_cache_service.get(context["query"], context["faq_ids"])
+            if cached:
+                yield cached["content"]
+                return
+        
+        messages = context["messages"]
+        chunks = []
+        async for content in self.generate_response_stream(messages):
+            chunks.append(content)
+            yield content
+        
+        if use_cache and chunks:
+            await answer_cache_service.set(
+                context["query"],
+                context["faq_ids"],
+                {"content": "".join(chunks), "role": "assistant", "model": self.model}
+            )
     
+    @tracing_service.traced("openai.generate_rag_response")
     async def generate_rag_response(self, session_id: str, query: Optional[str] = None) -> str:
         """
         使用 RAG 提示词模板生成回答
@@ -86,25 +222,155 @@ class OpenAIService:
         Returns:
             Dict[str, Any]: 包含生成回答的字典，包括内容、图片URL等
         """
-        # 获取 RAG 提示词模板和图片URL
-        rag_prompt = self.rag_service.build_rag_prompt(session_id, query)
+        # 获取 RAG 上下文（会话历史、检索到的FAQ、提示词模板）
+        context = await self.rag_service.build_rag_context(session_id, query)
+        return await self.answer_from_context(context)
+    
+    async def answer_from_context(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        根据已构建的 RAG 上下文生成回答：直接回答 → 回答缓存 / 合并的上游调用
+        
+        Args:
+            context (Dict[str, Any]): RAGService.build_rag_context 的返回值
+            
+        Returns:
+            Dict[str, Any]: 包含生成回答的字典
+        """
+        # 高置信度命中单条FAQ时直接返回知识库中的回答，不调用 LLM
+        direct = self._direct_answer(context)
+        if direct:
+            return direct
+        
+        # 首轮问题（无会话历史）的回答只取决于 知识库版本 + 归一化查询 + 有序FAQ ID，
+        # 相同键的并发请求共享同一次缓存查询和上游调用
+        if not context["full_history"]:
+            key = answer_cache_service.coalescing_key(context["query"], context["faq_ids"])
+            response = await self.completion_flight.do(
+                key, lambda: self._generate_rag_completion(context, use_cache=True)
+            )
+            return dict(response)
+        
+        return await self._generate_rag_completion(context, use_cache=False)
+    
+    async def generate_rag_responses_batch(self, queries: List[str],
+                                           concurrency: int) -> AsyncIterator[Tuple[List[int], Dict[str, Any]]]:
+        """
+        批量生成首轮回答（无会话历史，不写入会话记录），用于离线回归和质检
+        
+        相同（归一化后）的问题只回答一次；所有问题的 embedding 和 ChromaDB 查询各只执行一次，
+        之后以有限并发生成回答，并按完成顺序返回。
+        
+        Args:
+            queries (List[str]): 问题列表
+            concurrency (int): 同时生成回答的最大数量
+            
+        Yields:
+            Tuple[List[int], Dict[str, Any]]: (该回答对应的问题下标列表, 回答字典)
+        """
+        groups: Dict[str, List[int]] = {}
+        unique_queries: List[str] = []
+        for index, query in enumerate(queries):
+            key = answer_cache_service.normalize_query(query)
+            if key not in groups:
+                groups[key] = []
+                unique_queries.append(query)
+            groups[key].append(index)
+        logger.info(f"📦 批量问答: {len(queries)} 个问题，去重后 {len(unique_queries)} 个")
+        
+        retrievals = await executor_service.run(self.rag_service.retrieve_knowledge_batch, unique_queries)
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        
+        async def answer(query: str, indices: List[int], retrieval: Dict[str, Any]) -> Tuple[List[int], Dict[str, Any]]:
+            async with semaphore:
+                context = self.rag_service.assemble_context([], [], query, retrieval)
+                try:
+                    response = await self.answer_from_context(context)
+                except OverloadedError as e:
+                    response = {"content": str(e), "role": "assistant", "error": True}
+                response.setdefault("faq_ids", context["faq_ids"])
+                return indices, response
+        
+        tasks = [
+            asyncio.ensure_future(answer(query, indices, retrieval))
+            for query, indices, retrieval in zip(unique_queries, groups.values(), retrievals)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # 客户端断开时取消尚未完成的回答
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    def _direct_answer(self, context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        判断是否可以直接使用FAQ回答：最高综合得分达到阈值，且明显高于第二名
+        
+        Args:
+            context (Dict[str, Any]): RAGService.build_rag_context 的返回值
+            
+        Returns:
+            Optional[Dict[str, Any]]: 直接回答的字典，不满足条件时为 None
+        """
+        if not settings.DIRECT_ANSWER_ENABLED or not context["faq_scores"]:
+            return None
+        if settings.DIRECT_ANSWER_FIRST_TURN_ONLY and context["full_history"]:
+            return None
+        
+        scores = context["faq_scores"]
+        top_score = scores[0]
+        margin = top_score - scores[1] if len(scores) > 1 else top_score
+        if top_score < settings.DIRECT_ANSWER_MIN_SCORE or margin < settings.DIRECT_ANSWER_MIN_MARGIN:
+            return None
+        
+        top_id = context["faq_ids"][0]
+        faq = next((f for f in context["faq_details"] if str(f.get("id")) == top_id), None)
+        if not faq or not faq.get("Response"):
+            return None
+        
+        content = faq["Response"]
+        image_url = faq.get("Response_Pic_App_URL") or None
+        if image_url:
+            content += f"\n\n![操作示意图]({image_url})"
+        
+        logger.info(f"⚡ FAQ {top_id} 高置信度命中 (得分 {top_score:.3f}, 领先 {margin:.3f})，直接返回知识库回答")
+        return {
+            "content": content,
+            "role": "assistant",
+            "image_url": image_url,
+            "faq_id": top_id,
+            "score": top_score,
+            "source": "faq_direct"
+        }
+    
+    async def _generate_rag_completion(self, context: Dict[str, Any], use_cache: bool) -> Dict[str, Any]:
+        """
+        根据 RAG 上下文生成回答（可选经过回答缓存）
         
-        # 打印提示词模板 - 添加分隔线使其在终端中更易读
-        print("\n" + "="*50)
-        print("📝 输入到LLM的提示词模板:")
-        print("="*50)
-        print(rag_prompt)
-        print("="*50 + "\n")
+        Args:
+            context (Dict[str, Any]): RAGService.build_rag_context 的返回值
+            use_cache (bool): 是否查询和写入回答缓存
+            
+        Returns:
+            Dict[str, Any]: 包含生成回答的字典
+        """
+        if use_cache:
+            cached = await answer_cache_service.get(context["query"], context["faq_ids"])
+            if cached:
+                cached["cached"] = True
+                cached["source"] = "answer_cache"
+                return cached
         
-        # 构建消息
-        messages = [{"role": "user", "content": rag_prompt}]
+        # 提示词全文只在 DEBUG 级别输出
+        logger.debug("📝 输入到LLM的提示词（用户消息）:\n%s", context["prompt"])
         
-        # 生成回答
-        response = await self.generate_response(messages)
+        # 固定的系统消息在前，上游可以复用已缓存的前缀
+        response = await self.generate_response(context["messages"])
+        response["source"] = "llm"
         
-        # # 添加图片URL到响应中
-        # response["app_image_urls"] = app_image_urls
-        # response["pc_image_urls"] = pc_image_urls
+        if use_cache:
+            await answer_cache_service.set(context["query"], context["faq_ids"], response)
         
         return response
     
@@ -117,104 +383,242 @@ class OpenAIService:
         """
         self.model = model_name
 
-    async def update_redis_conversation_history(self, session_id: str, query: str, response: str) -> None:
+    @tracing_service.traced("persist.redis_history")
+    async def update_redis_conversation_history(self, session_id: str, query: str, response: str) -> Optional[int]:
         """
         更新会话历史记录
         
+        Args:
+            session_id (str): 会话 ID
+            query (str): 用户查询
+            response (str): AI 响应
+            
+        Returns:
+            Optional[int]: 追加后的列表长度（Redis 不可用、写入被暂存时为 0），写入失败时为 None
+        """
+        with metrics_service.stage("redis_write"):
+            try:
+                # 用户查询和AI响应在一个管道中追加，只需一次往返；同时更新本进程的会话缓存
+                length = await session_cache_service.append(
+                    session_id, self.redis_service.turn_messages(query, response)
+                )
+                
+                logger.debug(f"✅ 成功更新会话历史记录: session_id={session_id}")
+            except Exception as e:
+                logger.error(f"❌ 更新会话历史记录失败: {str(e)}")
+                metrics_service.record_stage_error("redis_write")
+                return None
+        return length
+    
+    async def persist_conversation_turn(self, session_id: str, query: str, response: str) -> None:
+        """
+        在后台保存一轮对话：追加到 Redis，并把会话加入 Strapi 合并写入队列
+        
+        同一会话连续多轮对话只在静默期结束（或达到最长等待时间）后写入 Strapi 一次，见 StrapiWriterService。
+        
         Args:
             session_id (str): 会话 ID
             query (str): 用户查询
             response (str): AI 响应
         """
+        length = await self.update_redis_conversation_history(session_id, query, response)
+        strapi_writer_service.schedule(session_id)
+        # 消息数超过阈值时在独立的后台任务中把较早的轮次压缩为摘要，不阻塞 Strapi 写入排队
+        if length:
+            history_summary_service.schedule(session_id, length)
+
+    def schedule_persist(self, session_id: str, query: str, response: str) -> None:
+        """
+        在后台任务中保存一轮对话（不等待结果），返回响应后调用
+
+        Args:
+            session_id (str): 会话 ID
+            query (str): 用户查询
+            response (str): AI 响应
+        """
+        task = asyncio.get_running_loop().create_task(self.persist_conversation_turn(session_id, query, response))
+        self._persist_tasks.add(task)
+        task.add_done_callback(self._persist_tasks.discard)
+
+    async def shutdown(self) -> None:
+        """等待进行中的会话保存任务完成（之后才能重放暂存的写入并写入 Strapi），由 app.main.lifespan 调用"""
+        if self._persist_tasks:
+            logger.info(f"💾 等待 {len(self._persist_tasks)} 个会话保存任务完成...")
+            await asyncio.gather(*list(self._persist_tasks), return_exceptions=True)
+
+    async def _get_cached_strapi_record_id(self, session_id: str) -> Optional[str]:
+        """读取 Redis 中缓存的 Strapi 记录 ID；Redis 不可用时返回 None（改为按 session_id 查询）"""
         try:
-            # 记录用户查询
-            self.redis_service.record_user_query(session_id, query)
+            return await self.redis_service.call_async(self.redis_service.get_strapi_record_id_async, session_id)
+        except Exception as e:
+            logger.warning(f"⚠️ 读取Strapi记录ID缓存失败: session_id={session_id}, {str(e)}")
+            return None
+
+    async def _cache_strapi_record_id(self, session_id: str, record_id: Any, persisted: int) -> None:
+        try:
+            await self.redis_service.call_async(
+                self.redis_service.set_strapi_record_id_async, session_id, record_id, persisted
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ 缓存Strapi记录ID失败: session_id={session_id}, {str(e)}")
+
+    async def _get_strapi_history(self, record_id: Any) -> Optional[List[Dict[str, Any]]]:
+        """
+        读取 Strapi 会话记录中已保存的对话记录
+        
+        Args:
+            record_id (Any): 记录 ID
             
-            # 记录AI响应
-            self.redis_service.record_ai_response(session_id, response)
+        Returns:
+            Optional[List[Dict[str, Any]]]: 已保存的消息列表，记录不存在时返回 None
             
-            print(f"✅ 成功更新会话历史记录: session_id={session_id}")
-        except Exception as e:
-            print(f"❌ 更新会话历史记录失败: {str(e)}")
+        Raises:
+            httpx.HTTPStatusError: Strapi 查询失败
+        """
+        response = await http_client_service.strapi_client.get(
+            f"{self.strapi_url}/api/ai-support-sessions/{record_id}",
+            headers=self.strapi_headers,
+            params={"fields[0]": "history"}
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return (response.json()["data"].get("attributes") or {}).get("history") or []
+
+    @staticmethod
+    def _merge_transcript(saved: Optional[List[Dict[str, Any]]], transcript: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        拼接完整的对话记录：Strapi 中已保存的前 offset 条消息 + Redis 历史列表中的消息
+        
+        Strapi 中也缺少的早前消息以一条 system 摘要消息代替（omitted 字段记录代替的条数，下次拼接时按条数对齐）。
+        
+        Args:
+            saved (Optional[List[Dict[str, Any]]]): Strapi 中已保存的消息列表
+            transcript (Dict[str, Any]): redis_service.get_transcript_async 的返回值
+            
+        Returns:
+            List[Dict[str, Any]]: 按时间顺序排列的完整对话记录
+        """
+        offset = transcript["offset"]
+        earlier, covered = [], 0
+        for msg in saved or []:
+            if covered >= offset:
+                break
+            earlier.append(msg)
+            covered += msg.get("omitted", 1)
+        if covered < offset:
+            logger.warning(f"⚠️ Strapi 中缺少{offset - covered}条早前消息，以会话摘要代替")
+            earlier.append(redis_service.summary_message(transcript["summary"], offset - covered))
+        return earlier + transcript["messages"]
 
-    async def save_conversation_to_strapi(self, session_id: str, query: str, response: str) -> None:
+    async def _find_strapi_record_id(self, session_id: str) -> Optional[Any]:
         """
-        保存会话历史到Strapi
+        按 session_id 在 Strapi 服务端过滤查询会话记录，只返回 ID 字段
         
         Args:
             session_id (str): 会话 ID
-            query (str): 用户查询
-            response (str): AI 响应
+            
+        Returns:
+            Optional[Any]: 记录 ID，不存在时返回 None
+            
+        Raises:
+            httpx.HTTPStatusError: Strapi 查询失败
         """
-        try:
-            # 获取完整的会话历史
-            full_history = self.redis_service.get_conversation_history(session_id)
+        search_response = await http_client_service.strapi_client.get(
+            f"{self.strapi_url}/api/ai-support-sessions",
+            headers=self.strapi_headers,
+            params={
+                "filters[session_id][$eq]": session_id,
+                "fields[0]": "session_id",
+                "pagination[pageSize]": 1
+            }
+        )
+        search_response.raise_for_status()
+        records = search_response.json().get("data") or []
+        return records[0]["id"] if records else None
+
+    @tracing_service.traced("persist.strapi_session")
+    async def save_conversation_to_strapi(self, session_id: str) -> bool:
+        """
+        保存会话历史到Strapi（由 StrapiWriterService 合并写入时调用，写入的是调用时的完整对话记录）
+        
+        Redis 只保留最近的消息（压缩或超过条数上限的早前消息会被移除），Strapi 中的记录是完整的对话记录：
+        有消息已移出 Redis 时，先读取记录中已保存的早前消息再拼接写入，会话压缩只影响提示词。
+        写入成功后在 Redis 中记录已写入的条数，压缩只删除已写入 Strapi 的消息。
+        Redis 不可用或本会话还有尚未重放的写入时返回 False，由写入队列稍后重试，不会用不完整的历史覆盖记录。
+        
+        会话对应的记录 ID 缓存在 Redis 中，首次写入之后每次只需一次 PUT（有早前消息需要保留时先 GET 一次）；
+        未缓存时按 session_id 在服务端过滤查询，不存在则创建记录。
             
-            # 检查是否已存在该session的记录
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # 查询是否存在 - 不使用过滤器，直接获取所有记录然后筛选
-                search_url = f"{self.strapi_url}/api/ai-support-sessions"
-                
-                search_response = await client.get(
-                    search_url,
-                    headers=self.strapi_headers
-                )
+        Args:
+            session_id (str): 会话 ID
+            
+        Returns:
+            bool: 是否写入成功
+        """
+        with metrics_service.stage("strapi_write"):
+            try:
+                if session_cache_service.has_pending_writes(session_id):
+                    logger.debug(f"⏳ 会话还有尚未写入Redis的消息，稍后再写入Strapi: session_id={session_id}")
+                    return False
+                transcript = await self.redis_service.call_async(self.redis_service.get_transcript_async, session_id)
+                client = http_client_service.strapi_client
                 
-                print(f"🔍 Strapi查询URL: {search_url}")
-                print(f"🔍 Strapi响应状态: {search_response.status_code}")
+                record_id = await self._get_cached_strapi_record_id(session_id)
+                cached = record_id is not None
+                if record_id is None:
+                    record_id = await self._find_strapi_record_id(session_id)
                 
-                if search_response.status_code == 200:
-                    # 添加调试信息，查看响应结构
-                    search_data = search_response.json()
-                    print(f"🔍 Strapi响应数据结构: {search_data}")
-                    
-                if search_response.status_code == 200:
-                    search_data = search_response.json()
-                    
-                    payload = {
-                        "data": {
-                            "session_id": session_id,
-                            "history": full_history
-                        }
+                full_history = transcript["messages"]
+                if transcript["offset"]:
+                    # 早前的消息已移出 Redis，以记录中已保存的为准
+                    saved = await self._get_strapi_history(record_id) if record_id is not None else None
+                    if saved is None and cached:
+                        logger.warning(f"⚠️ 缓存的Strapi会话记录不存在，重新查询: session_id={session_id}, record_id={record_id}")
+                        cached = False
+                        record_id = await self._find_strapi_record_id(session_id)
+                        saved = await self._get_strapi_history(record_id) if record_id is not None else None
+                    full_history = self._merge_transcript(saved, transcript)
+                payload = {
+                    "data": {
+                        "session_id": session_id,
+                        "history": full_history
                     }
+                }
+                
+                if record_id is not None:
+                    # 更新现有记录
+                    update_url = f"{self.strapi_url}/api/ai-support-sessions/{record_id}"
+                    response = await client.put(update_url, headers=self.strapi_headers, json=payload)
+                    if response.status_code == 404 and cached:
+                        # 缓存的记录已在 Strapi 中被删除，重新查询（写入成功后覆盖缓存）
+                        logger.warning(f"⚠️ 缓存的Strapi会话记录不存在，重新查询: session_id={session_id}, record_id={record_id}")
+                        record_id = await self._find_strapi_record_id(session_id)
+                        if record_id is not None:
+                            update_url = f"{self.strapi_url}/api/ai-support-sessions/{record_id}"
+                            response = await client.put(update_url, headers=self.strapi_headers, json=payload)
+                    if record_id is not None and response.status_code in [200, 201]:
+                        logger.debug(f"✅ 成功更新Strapi会话记录: session_id={session_id}, record_id={record_id}")
+                
+                if record_id is None:
+                    # 创建新记录
+                    create_url = f"{self.strapi_url}/api/ai-support-sessions"
+                    response = await client.post(create_url, headers=self.strapi_headers, json=payload)
+                    if response.status_code in [200, 201]:
+                        record_id = response.json()["data"]["id"]
+                        logger.debug(f"✅ 成功创建Strapi会话记录: session_id={session_id}")
                     
-                    # 在客户端过滤匹配的session_id
-                    existing_record = None
-                    if search_data.get("data"):
-                        for record in search_data["data"]:
-                            if record.get("attributes", {}).get("session_id") == session_id:
-                                existing_record = record
-                                break
-                    
-                    if existing_record:
-                        # 更新现有记录
-                        record_id = existing_record["id"]
-                        update_url = f"{self.strapi_url}/api/ai-support-sessions/{record_id}"
-                        
-                        response = await client.put(
-                            update_url,
-                            headers=self.strapi_headers,
-                            json=payload
-                        )
-                        print(f"✅ 成功更新Strapi会话记录: session_id={session_id}, record_id={record_id}")
-                    else:
-                        # 创建新记录
-                        create_url = f"{self.strapi_url}/api/ai-support-sessions"
+                if response.status_code not in [200, 201]:
+                    logger.error(f"❌ Strapi操作失败: {response.status_code}, {response.text}")
+                    metrics_service.record_stage_error("strapi_write")
+                    return False
+                await self._cache_strapi_record_id(session_id, record_id, transcript["total"])
+                return True
                         
-                        response = await client.post(
-                            create_url,
-                            headers=self.strapi_headers,
-                            json=payload
-                        )
-                        print(f"✅ 成功创建Strapi会话记录: session_id={session_id}")
-                        
-                    if response.status_code not in [200, 201]:
-                        print(f"❌ Strapi操作失败: {response.status_code}, {response.text}")
-                else:
-                    print(f"❌ Strapi查询失败: {search_response.status_code}, {search_response.text}")
-                        
-        except Exception as e:
-            print(f"❌ 保存到Strapi失败: {str(e)}")
+            except Exception as e:
+                logger.error(f"❌ 保存到Strapi失败: {str(e)}")
+                metrics_service.record_stage_error("strapi_write")
+                return False
 
 # 创建 OpenAI 服务实例
 openai_service = OpenAIService()
@@ -1,68 +1,207 @@
+import logging
 import json
+import string
+import textwrap
 from app.services.redis_service import redis_service
+from app.services.session_cache_service import session_cache_service
 from app.services.strapi_service import strapi_service
+from app.services.executor_service import executor_service
+from app.services.token_service import token_service
+from app.services.answer_cache_service import answer_cache_service
+from app.services.single_flight import SingleFlight
+from app.services.metrics_service import metrics_service
+from app.services.tracing_service import tracing_service
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def compile_template(template):
+    """
+    预先解析 str.format 风格的模板，返回只做字符串拼接的渲染函数
+    
+    Args:
+        template (str): 模板文本
+        
+    Returns:
+        callable: render(**fields) -> str
+    """
+    parts = list(string.Formatter().parse(template))
+    
+    def render(**fields):
+        pieces = []
+        for literal, field, _, _ in parts:
+            pieces.append(literal)
+            if field is not None:
+                pieces.append(str(fields[field]))
+        return "".join(pieces)
+    return render
 
 class RAGService:
+    # 固定的系统提示词：不含任何可变内容，逐字节保持不变，上游可以缓存这段前缀
+    SYSTEM_PROMPT = textwrap.dedent("""\
+        你是AiCoin应用的智能聊天助手，会根据用户的问题和提供的相关知识给出准确、全面的回答。
+
+        ## 回答要求
+        用户消息依次包含会话历史、相关知识和当前问题。请基于这些信息提供专业、简洁且全面的回答。请遵循以下原则：
+
+        1. **内容准确性**：以提供的相关知识为主要依据，减少自主生成的信息
+        2. **关联性判断**：自行判断相关知识与用户问题的匹配度，优先选择最相关的内容
+        3. **补充完善**：如果相关知识不足以完整回答问题，可基于你的知识进行合理补充
+
+        ## 图片展示规则
+        当相关知识中包含图片URL时，请根据以下情况智能展示：
+
+        **需要展示图片的场景：**
+        - 用户询问操作步骤、使用方法、功能介绍
+        - 问题涉及界面、按钮、设置等可视化内容
+        - 回答中引用的知识点包含图片说明
+
+        **图片展示格式：**
+        - 如果知识点同时包含PC端和移动端图片，优先展示移动端图片（APP端图片）
+        - 使用markdown格式：`![图片描述](图片URL)`
+        - 图片描述应简洁明了，如"操作步骤图"、"界面示意图"、"设置页面"等
+        - 将图片放在回答的相关段落后或回答末尾
+
+        **示例：**
+        如果回答中使用了包含以下内容的知识点：
+        - APP端图片: https://example.com/app-guide.png
+        - PC端图片: https://example.com/pc-guide.png
+
+        请在回答适当位置添加：
+        ![操作指引](https://example.com/app-guide.png)
+
+        请注意，只有在回答操作类问题且相关知识中包含图片URL时才需要添加图片。""")
+    
+    # 用户消息模板，{history}/{knowledge}/{query} 为可变部分，按变化频率从低到高排列
+    USER_PROMPT_TEMPLATE = textwrap.dedent("""\
+        ## 会话历史
+        {history}
+
+        ## 相关知识
+        {knowledge}
+
+        ## 当前问题
+        {query}""")
+    
     def __init__(self):
         """初始化 RAG 服务"""
         self.redis_service = redis_service
         self.strapi_service = strapi_service
+        self._template_tokens = None
+        self._render_user_prompt = compile_template(self.USER_PROMPT_TEMPLATE)
+        # 合并相同查询的并发检索（embedding + ChromaDB + 知识详情）
+        self.retrieval_flight = SingleFlight("retrieval")
     
-    def get_relevant_knowledge(self, query):
+    @tracing_service.traced("rag.retrieve_knowledge")
+    def retrieve_knowledge(self, query):
         """
-        从知识库中获取与查询相关的知识
+        从知识库中检索与查询相关的知识，并保留检索到的FAQ ID
         
         Args:
             query (str): 用户查询
             
         Returns:
-            str: 相关知识文本
+            dict: {"faq_ids": 按综合得分排序的FAQ ID列表, "faq_scores": 对应的综合得分,
+                   "faq_details": FAQ详细信息列表, "knowledge": 相关知识文本}
         """
+        logger.debug(f"🔍 开始获取与查询 '{query}' 相关的知识...")
+        
+        # 1. 获取相似问题的ID及综合得分（得分供直接回答判断使用）
         try:
-            print(f"\n🔍 开始获取与查询 '{query}' 相关的知识...")
+            similar_faqs = strapi_service.search_similar_faqs(query, n_results=3)
+        except Exception as e:
+            logger.error(f"❌ 获取相似问题失败: {str(e)}")
+            return self._empty_retrieval("获取相似问题失败，请确保向量数据库已正确初始化并包含数据。")
+        return self.build_retrieval(similar_faqs)
+    
+    @tracing_service.traced("rag.retrieve_knowledge_batch")
+    def retrieve_knowledge_batch(self, queries):
+        """
+        批量检索知识：embedding 和 ChromaDB 查询各只执行一次
+        
+        Args:
+            queries (list): 用户查询列表
             
-            # 初始化图片URL列表
-            app_image_urls = []
-            pc_image_urls = []
+        Returns:
+            list: 与 queries 一一对应的检索结果，格式同 retrieve_knowledge
+        """
+        try:
+            similar_lists = strapi_service.search_similar_faqs_batch(queries, n_results=3)
+        except Exception as e:
+            logger.error(f"❌ 批量获取相似问题失败: {str(e)}")
+            return [self._empty_retrieval("获取相似问题失败，请确保向量数据库已正确初始化并包含数据。") for _ in queries]
+        return [self.build_retrieval(similar_faqs) for similar_faqs in similar_lists]
+    
+    @staticmethod
+    def _empty_retrieval(knowledge):
+        return {"faq_ids": [], "faq_scores": [], "faq_details": [], "knowledge": knowledge}
+    
+    def build_retrieval(self, similar_faqs):
+        """
+        根据相似问题加载FAQ详细信息并格式化为RAG文本
+        
+        Args:
+            similar_faqs (list): search_similar_faqs 返回的相似问题列表
             
-            # 1. 获取相似问题的ID
-            try:
-                faq_ids = strapi_service.get_similar_faq_ids(query, n_results=3)
-                if not faq_ids:
-                    print("⚠️ 未找到相关的FAQ")
-                    return "未找到相关的知识内容。", [], []
-            except Exception as e:
-                
-                return "获取相似问题失败，请确保向量数据库已正确初始化并包含数据。", [], []
+        Returns:
+            dict: 检索结果，格式同 retrieve_knowledge
+        """
+        result = self._empty_retrieval("")
+        try:
+            if not similar_faqs:
+                logger.warning("⚠️ 未找到相关的FAQ")
+                result["knowledge"] = "未找到相关的知识内容。"
+                return result
+            faq_ids = [faq['id'] for faq in similar_faqs]
+            result["faq_ids"] = [str(faq_id) for faq_id in faq_ids]
+            result["faq_scores"] = [faq['combined_score'] for faq in similar_faqs]
             
             # 2. 获取FAQ详细信息
             try:
-                faq_details = strapi_service.get_faq_details_by_ids(faq_ids)
+                with metrics_service.stage("faq_detail_load"):
+                    faq_details = strapi_service.get_faq_details_by_ids(faq_ids)
                 if not faq_details:
-                    print("⚠️ 无法获取FAQ详细信息")
-                    return "无法获取相关的知识内容。", [], []
+                    logger.warning("⚠️ 无法获取FAQ详细信息")
+                    result["knowledge"] = "无法获取相关的知识内容。"
+                    return result
             except Exception as e:
-                print(f"❌ 获取FAQ详细信息失败: {str(e)}")
-                return "获取知识详情失败，请确保知识库文件存在且格式正确。", [], []
+                logger.error(f"❌ 获取FAQ详细信息失败: {str(e)}")
+                result["knowledge"] = "获取知识详情失败，请确保知识库文件存在且格式正确。"
+                return result
+            result["faq_details"] = faq_details
             
-            # 4. 格式化FAQ信息为RAG文本
+            # 3. 格式化FAQ信息为RAG文本
             try:
                 formatted_text = strapi_service.format_faq_for_rag(faq_details)
                 if not formatted_text:
-                    print("⚠️ 格式化FAQ信息失败")
-                    return "格式化知识内容失败。", [], []
+                    logger.warning("⚠️ 格式化FAQ信息失败")
+                    result["knowledge"] = "格式化知识内容失败。"
+                    return result
             except Exception as e:
-                print(f"❌ 格式化FAQ信息失败: {str(e)}")
-                return "格式化知识内容时发生错误。", [], []
-            
-            print("✅ 成功获取相关知识")
-            print(f"找到 {len(app_image_urls)} 个APP图片和 {len(pc_image_urls)} 个PC图片")
+                logger.error(f"❌ 格式化FAQ信息失败: {str(e)}")
+                result["knowledge"] = "格式化知识内容时发生错误。"
+                return result
             
-            return formatted_text
+            logger.debug("✅ 成功获取相关知识")
+            result["knowledge"] = formatted_text
+            return result
             
         except Exception as e:
-            print(f"❌ 获取相关知识失败: {str(e)}")
-            return f"获取相关知识时发生错误: {str(e)}", [], []
+            logger.error(f"❌ 获取相关知识失败: {str(e)}")
+            result["knowledge"] = f"获取相关知识时发生错误: {str(e)}"
+            return result
+    
+    def get_relevant_knowledge(self, query):
+        """
+        从知识库中获取与查询相关的知识
+        
+        Args:
+            query (str): 用户查询
+            
+        Returns:
+            str: 相关知识文本
+        """
+        return self.retrieve_knowledge(query)["knowledge"]
     
     def format_knowledge(self, relevant_knowledge):
         """
@@ -79,7 +218,7 @@ class RAGService:
             formatted_knowledge = self.strapi_service.format_faq_for_rag(relevant_knowledge)
             return formatted_knowledge
         except Exception as e:
-            print(f"❌ 格式化知识失败: {str(e)}")
+            logger.error(f"❌ 格式化知识失败: {str(e)}")
             return ""
     
     def format_conversation_history(self, history):
@@ -104,7 +243,7 @@ class RAGService:
             formatted_history += f"{role}: {message['content']}\n"
         return formatted_history.strip()  #
     
-    def build_rag_prompt(self, session_id, query=None):
+    async def build_rag_prompt(self, session_id, query=None):
         """
         构建 RAG 提示词模板
         
@@ -113,13 +252,39 @@ class RAGService:
             query (str, optional): 当前查询，如果为 None，则使用会话历史中的最后一个用户查询
             
         Returns:
-            tuple: (RAG提示词模板, APP图片URL列表, PC图片URL列表)
+            str: RAG提示词中的用户消息部分（系统提示词固定为 SYSTEM_PROMPT）
+        """
+        context = await self.build_rag_context(session_id, query)
+        return context["prompt"]
+    
+    @tracing_service.traced("rag.build_context")
+    async def build_rag_context(self, session_id, query=None):
+        """
+        构建 RAG 上下文：会话历史、检索结果和提示词模板
+        
+        会话历史通过进程内会话缓存或异步 Redis 客户端读取，知识检索（embedding、ChromaDB、知识库文件）在专用线程池中执行，
+        不会阻塞事件循环。提示词按令牌预算组装，超出预算时按优先级截断或丢弃各部分。
+        
+        Args:
+            session_id (str): 会话 ID
+            query (str, optional): 当前查询，如果为 None，则使用会话历史中的最后一个用户查询
+            
+        Returns:
+            dict: {"full_history", "history", "query", "faq_ids", "faq_scores", "faq_details", "knowledge",
+                   "prompt": 用户消息, "messages": 系统消息 + 用户消息, "token_usage",
+                   "session": session_cache_service.get 返回的会话摘要和最近消息}
         """
-        # 获取会话历史
-        full_history = self.redis_service.get_conversation_history(session_id)
+        # 会话摘要和历史在一次请求中只读取一次（优先读取进程内缓存），并随上下文传给后续步骤
+        with metrics_service.stage("history_fetch"):
+            session = await session_cache_service.get(session_id)
+        summary = session["summary"]
+        
+        # 只使用构建提示词所需的最近几轮（每轮一问一答，多取一条以补齐可能未完成的轮次）
+        max_rounds = settings.HISTORY_PROMPT_ROUNDS
+        full_history = session["messages"][-(max_rounds * 2 + 1):]
         
-        # 限制历史记录为最近3轮对话
-        history = []
+        # 限制历史记录为最近几轮对话
+        limited_rounds = []
         if full_history:
             # 将消息分组为轮次（一个用户消息和一个助手消息为一轮）
             rounds = []
@@ -136,77 +301,191 @@ class RAGService:
             if current_round:
                 rounds.append(current_round)
             
-            # 只保留最后3轮
-            limited_rounds = rounds[-3:] if len(rounds) > 3 else rounds
+            # 只保留最后几轮
+            limited_rounds = rounds[-max_rounds:] if max_rounds > 0 else []
             
-            # 展平轮次列表，获得最终历史
-            for r in limited_rounds:
-                history.extend(r)
-            
-            print(f"📜 会话历史已限制为{len(limited_rounds)}轮（共{len(rounds)}轮）")
+            logger.debug(f"📜 会话历史已限制为{len(limited_rounds)}轮（共{len(rounds)}轮）")
         
         # 如果提供了查询且不为空，则使用提供的查询
         if query:
             current_query = query
         else:
             # 从历史记录中提取最后一个用户查询
-            user_queries = [msg["content"] for msg in history if msg["role"] == "user"]
+            user_queries = [msg["content"] for r in limited_rounds for msg in r if msg["role"] == "user"]
             if user_queries:
                 current_query = user_queries[-1]
             else:
                 current_query = ""
         
-        # 获取相关知识和图片URL
-        relevant_knowledge = self.get_relevant_knowledge(current_query)
-        # 格式化会话历史
-        formatted_history = self.format_conversation_history(history)
+        # 获取相关知识（检索结果只取决于查询和知识库版本，相同查询的并发检索只执行一次）
+        retrieval = await self.retrieval_flight.do(
+            await answer_cache_service.coalescing_key_async(current_query),
+            lambda: executor_service.run(self.retrieve_knowledge, current_query)
+        )
         
-        print(f"🔄 使用了{len(history)}条历史消息构建RAG提示")
+        context = self.assemble_context(full_history, limited_rounds, current_query, retrieval,
+                                        summary["content"] if summary else None)
+        context["session"] = session
+        return context
+    
+    def assemble_context(self, full_history, limited_rounds, current_query, retrieval, summary=None):
+        """
+        按令牌预算把会话历史、当前问题和检索结果组装为 RAG 上下文
         
-        # 构建 RAG 提示词模板
-        prompt_template = f"""你是AiCoin应用的智能聊天助手，会根据用户的问题和提供的相关知识给出准确、全面的回答。
-
-            ## 会话历史
-            {formatted_history}
-
-            ## 当前问题
-            {current_query}
-
-            ## 相关知识
-            {relevant_knowledge}
-
-            ## 回答要求
-            请基于以上信息提供专业、简洁且全面的回答。请遵循以下原则：
-
-            1. **内容准确性**：以提供的相关知识为主要依据，减少自主生成的信息
-            2. **关联性判断**：自行判断相关知识与用户问题的匹配度，优先选择最相关的内容
-            3. **补充完善**：如果相关知识不足以完整回答问题，可基于你的知识进行合理补充
-
-            ## 图片展示规则
-            当相关知识中包含图片URL时，请根据以下情况智能展示：
-
-            **需要展示图片的场景：**
-            - 用户询问操作步骤、使用方法、功能介绍
-            - 问题涉及界面、按钮、设置等可视化内容
-            - 回答中引用的知识点包含图片说明
-
-            **图片展示格式：**
-            - 如果知识点同时包含PC端和移动端图片，优先展示移动端图片（APP端图片）
-            - 使用markdown格式：`![图片描述](图片URL)`
-            - 图片描述应简洁明了，如"操作步骤图"、"界面示意图"、"设置页面"等
-            - 将图片放在回答的相关段落后或回答末尾
-
-            **示例：**
-            如果回答中使用了包含以下内容的知识点：
-            - APP端图片: https://example.com/app-guide.png
-            - PC端图片: https://example.com/pc-guide.png
-
-            请在回答适当位置添加：
-            ![操作指引](https://example.com/app-guide.png)
-
-            请注意，只有在回答操作类问题且相关知识中包含图片URL时才需要添加图片。
-            """
-        return prompt_template
+        Args:
+            full_history (list): 从 Redis 读取的最近会话历史（为空表示首轮对话）
+            limited_rounds (list): 最近几轮对话（按轮分组）
+            current_query (str): 当前查询
+            retrieval (dict): retrieve_knowledge 的返回值
+            summary (str, optional): 已压缩的早前对话摘要
+            
+        Returns:
+            dict: 格式同 build_rag_context
+        """
+        with metrics_service.stage("prompt_build"):
+            # 按令牌预算组装各部分：当前问题 > 相关知识 > 会话摘要 > 会话历史
+            budgeted = self.fit_to_token_budget(current_query, retrieval, limited_rounds, summary)
+            history = budgeted["history"]
+            formatted_history = self.format_conversation_history(history)
+            if budgeted["summary"]:
+                formatted_history = f"早前对话摘要: {budgeted['summary']}\n{formatted_history}".strip()
+            
+            logger.debug(f"🔄 使用了{len(history)}条历史消息构建RAG提示")
+            logger.debug(f"🧮 提示词令牌统计: {budgeted['token_usage']}")
+            
+            # 固定的系统提示词在前，可变部分只出现在用户消息中
+            user_prompt = self._render_user_prompt(
+                history=formatted_history,
+                knowledge=budgeted["knowledge"],
+                query=budgeted["query"]
+            )
+        return {
+            "full_history": full_history,
+            "history": history,
+            "query": current_query,
+            "faq_ids": retrieval["faq_ids"],
+            "faq_scores": retrieval["faq_scores"],
+            "faq_details": retrieval["faq_details"],
+            "knowledge": budgeted["knowledge"],
+            "prompt": user_prompt,
+            "messages": [
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt}
+            ],
+            "token_usage": budgeted["token_usage"]
+        }
+    
+    def _instruction_tokens(self):
+        """系统提示词和用户消息模板中固定部分的令牌数（只计算一次）"""
+        if self._template_tokens is None:
+            self._template_tokens = token_service.count(self.SYSTEM_PROMPT) + token_service.count(
+                self._render_user_prompt(history="", knowledge="", query="")
+            )
+        return self._template_tokens
+    
+    def _fit_knowledge(self, retrieval, budget):
+        """
+        将相关知识压缩到预算内：先截断过长的回答，再按排名从低到高丢弃FAQ
+        
+        Returns:
+            tuple: (知识文本, 丢弃的FAQ数量)
+        """
+        faq_details = retrieval["faq_details"]
+        if not faq_details:
+            return token_service.truncate(retrieval["knowledge"], budget), 0
+        
+        trimmed = []
+        for faq in faq_details:
+            faq = dict(faq)
+            faq["Response"] = token_service.truncate(
+                faq.get("Response") or "", settings.PROMPT_MAX_FAQ_RESPONSE_TOKENS
+            )
+            trimmed.append(faq)
+        
+        for keep in range(len(trimmed), 0, -1):
+            knowledge = self.strapi_service.format_faq_for_rag(trimmed[:keep])
+            if token_service.count(knowledge) <= budget:
+                return knowledge, len(trimmed) - keep
+        
+        # 只保留排名第一的FAQ仍超出预算时，直接截断
+        knowledge = self.strapi_service.format_faq_for_rag(trimmed[:1])
+        return token_service.truncate(knowledge, budget), len(trimmed) - 1
+    
+    def _fit_history(self, rounds, budget):
+        """
+        将会话历史压缩到预算内：截断过长的单条消息，从最早的轮次开始丢弃
+        
+        Returns:
+            tuple: (消息列表, 丢弃的轮次数)
+        """
+        kept_rounds = []
+        used = 0
+        for r in reversed(rounds):
+            messages = [
+                {**msg, "content": token_service.truncate(msg["content"], settings.PROMPT_MAX_MESSAGE_TOKENS)}
+                for msg in r
+            ]
+            cost = token_service.count(self.format_conversation_history(messages)) + 1  # 轮次之间的换行
+            if used + cost > budget:
+                break
+            kept_rounds.insert(0, messages)
+            used += cost
+        
+        history = [msg for r in kept_rounds for msg in r]
+        return history, len(rounds) - len(kept_rounds)
+    
+    def fit_to_token_budget(self, query, retrieval, rounds, summary=None):
+        """
+        按令牌预算组装提示词的可变部分
+        
+        优先级：当前问题 > 相关知识 > 会话摘要 > 会话历史。各部分先受自身上限约束，
+        再共享 PROMPT_TOKEN_BUDGET 扣除固定说明后的剩余预算；会话摘要和最近几轮共用历史预算。
+        
+        Args:
+            query (str): 当前问题
+            retrieval (dict): retrieve_knowledge 的返回值
+            rounds (list): 按轮次分组的会话历史
+            summary (str, optional): 已压缩的早前对话摘要
+            
+        Returns:
+            dict: {"query", "knowledge", "summary", "history", "token_usage"}
+        """
+        instruction_tokens = self._instruction_tokens()
+        
+        query = token_service.truncate(query, settings.PROMPT_MAX_QUERY_TOKENS)
+        query_tokens = token_service.count(query)
+        available = max(settings.PROMPT_TOKEN_BUDGET - instruction_tokens - query_tokens, 0)
+        
+        knowledge, dropped_faqs = self._fit_knowledge(
+            retrieval, min(settings.PROMPT_MAX_KNOWLEDGE_TOKENS, available)
+        )
+        knowledge_tokens = token_service.count(knowledge)
+        
+        history_budget = min(settings.PROMPT_MAX_HISTORY_TOKENS, max(available - knowledge_tokens, 0))
+        summary = token_service.truncate(summary or "", min(settings.HISTORY_SUMMARY_MAX_TOKENS, history_budget))
+        summary_tokens = token_service.count(summary) + 1 if summary else 0  # 摘要之后的换行
+        
+        history, dropped_rounds = self._fit_history(rounds, max(history_budget - summary_tokens, 0))
+        history_tokens = token_service.count(self.format_conversation_history(history))
+        
+        return {
+            "query": query,
+            "knowledge": knowledge,
+            "summary": summary,
+            "history": history,
+            "token_usage": {
+                "instructions": instruction_tokens,
+                "query": query_tokens,
+                "knowledge": knowledge_tokens,
+                "summary": summary_tokens,
+                "history": history_tokens,
+                "total": instruction_tokens + query_tokens + knowledge_tokens + summary_tokens + history_tokens,
+                "budget": settings.PROMPT_TOKEN_BUDGET,
+                "dropped_faqs": dropped_faqs,
+                "dropped_rounds": dropped_rounds,
+                "exact": token_service.is_exact
+            }
+        }
 
 # 创建 RAG 服务实例
 rag_service = RAGService()
@@ -0,0 +1,185 @@
+import json
+import logging
+import threading
+from typing import Any, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+class PayloadFormat:
+    """带版本字节的二进制格式：编码结果为 version(1字节) + body"""
+    version: int = 0
+    name: str = ""
+
+    def encode(self, obj: Any) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, body: bytes) -> Any:
+        raise NotImplementedError
+
+class MsgpackFormat(PayloadFormat):
+    version = 0x01
+    name = "msgpack"
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def encode(self, obj: Any) -> bytes:
+        return self._msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, body: bytes) -> Any:
+        return self._msgpack.unpackb(body, raw=False)
+
+class MsgpackZstdFormat(MsgpackFormat):
+    version = 0x02
+    name = "msgpack+zstd"
+
+    def __init__(self, level: int = 3):
+        super().__init__()
+        import zstandard
+        self._zstd = zstandard
+        self.level = level
+        # zstd 压缩/解压对象不能跨线程共用，线程池中的每个线程各持有一份
+        self._local = threading.local()
+
+    def _compressor(self):
+        if not hasattr(self._local, "compressor"):
+            self._local.compressor = self._zstd.ZstdCompressor(level=self.level)
+            self._local.decompressor = self._zstd.ZstdDecompressor()
+        return self._local.compressor, self._local.decompressor
+
+    def encode(self, obj: Any) -> bytes:
+        return self.compress(super().encode(obj))
+
+    def compress(self, packed: bytes) -> bytes:
+        """压缩已经 msgpack 编码的字节串，避免重复编码"""
+        compressor, _ = self._compressor()
+        return compressor.compress(packed)
+
+    def decode(self, body: bytes) -> Any:
+        _, decompressor = self._compressor()
+        return super().decode(decompressor.decompress(body))
+
+class SessionCodec:
+    """
+    会话数据（历史消息、摘要、反馈）的编解码层
+
+    - json: 写入紧凑 JSON 文本，与旧数据格式相同
+    - msgpack: 写入 0x01 + msgpack
+    - msgpack+zstd: 写入 0x02 + zstd(msgpack)，压缩后不更小（短消息）时改用 0x01
+
+    解码时按首字节识别格式：0x01/0x02 为二进制格式，其余按 JSON 文本读取，
+    因此旧的 JSON 数据和切换编码前写入的数据都可以直接读取，无需迁移。
+
+    与紧凑 JSON 相比节省的字节数按抽样估算（每 STATS_SAMPLE_EVERY 次编码计算一次 JSON 大小），不在每次写入时额外序列化。
+    """
+
+    STATS_SAMPLE_EVERY = 64
+
+    def __init__(self, name: str = "json", level: int = 3, min_compress_bytes: int = 128):
+        self.min_compress_bytes = min_compress_bytes
+        self._formats: Dict[int, PayloadFormat] = {}
+        self.name = self._load_formats(name.lower(), level)
+        self.encoded = 0
+        self.stored_bytes = 0
+        self.sampled_json_bytes = 0
+        self.sampled_stored_bytes = 0
+        self.legacy_reads = 0
+        self.binary_reads = 0
+
+    def _load_formats(self, name: str, level: int) -> str:
+        """加载可用的二进制格式；msgpack/zstandard 缺失时回退到 JSON"""
+        try:
+            self._register(MsgpackFormat())
+        except ImportError:
+            if name != "json":
+                logger.warning("⚠️ 未安装 msgpack，会话数据将使用 JSON 编码")
+            return "json"
+        try:
+            self._register(MsgpackZstdFormat(level))
+        except ImportError:
+            if name == "msgpack+zstd":
+                logger.warning("⚠️ 未安装 zstandard，会话数据将使用未压缩的 msgpack 编码")
+                return "msgpack"
+        if name not in ("json", "msgpack", "msgpack+zstd"):
+            logger.warning(f"⚠️ 未知的会话数据编码 {name}，使用 JSON 编码")
+            return "json"
+        return name
+
+    def _register(self, payload_format: PayloadFormat) -> None:
+        self._formats[payload_format.version] = payload_format
+
+    @staticmethod
+    def _to_json(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def encode(self, obj: Any) -> bytes:
+        """
+        按配置的格式编码
+
+        Args:
+            obj (Any): 可 JSON 序列化的对象
+
+        Returns:
+            bytes: 写入 Redis 的值
+        """
+        json_size = None
+        if self.name == "json":
+            value = self._to_json(obj)
+            json_size = len(value)
+        else:
+            # 只编码一次 msgpack，压缩时直接使用编码结果
+            packed = self._formats[MsgpackFormat.version].encode(obj)
+            value = bytes([MsgpackFormat.version]) + packed
+            if self.name == "msgpack+zstd" and len(value) >= self.min_compress_bytes:
+                compressed = self._formats[MsgpackZstdFormat.version]
+                candidate = bytes([compressed.version]) + compressed.compress(packed)
+                if len(candidate) < len(value):
+                    value = candidate
+
+        if self.encoded % self.STATS_SAMPLE_EVERY == 0:
+            self.sampled_json_bytes += json_size if json_size is not None else len(self._to_json(obj))
+            self.sampled_stored_bytes += len(value)
+        self.encoded += 1
+        self.stored_bytes += len(value)
+        return value
+
+    def decode(self, raw: Optional[Union[bytes, str]]) -> Any:
+        """
+        解码 Redis 中的值，兼容旧的 JSON 文本
+
+        Args:
+            raw (Optional[Union[bytes, str]]): Redis 返回的原始值
+
+        Returns:
+            Any: 解码后的对象，raw 为空时返回 None
+        """
+        if raw is None:
+            return None
+        if isinstance(raw, str):
+            self.legacy_reads += 1
+            return json.loads(raw)
+
+        payload_format = self._formats.get(raw[0]) if raw else None
+        if payload_format is None:
+            self.legacy_reads += 1
+            return json.loads(raw.decode("utf-8"))
+        self.binary_reads += 1
+        return payload_format.decode(raw[1:])
+
+    def get_stats(self) -> Dict[str, Any]:
+        """编码统计：与紧凑 JSON 相比节省的字节数（按抽样估算）"""
+        saved_ratio = 1 - self.sampled_stored_bytes / self.sampled_json_bytes if self.sampled_json_bytes else 0.0
+        json_bytes = round(self.stored_bytes / (1 - saved_ratio)) if saved_ratio < 1 else self.stored_bytes
+        return {
+            "codec": self.name,
+            "encoded_values": self.encoded,
+            "json_bytes": json_bytes,
+            "stored_bytes": self.stored_bytes,
+            "bytes_saved": json_bytes - self.stored_bytes,
+            "saved_ratio": round(saved_ratio, 4),
+            "sampled_json_bytes": self.sampled_json_bytes,
+            "sampled_stored_bytes": self.sampled_stored_bytes,
+            "legacy_reads": self.legacy_reads,
+            "binary_reads": self.binary_reads
+        }
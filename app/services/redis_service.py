@@ -1,7 +1,17 @@
+import asyncio
+import logging
 import json
+import time
 import redis
+import redis.asyncio
 import datetime
 from app.core.config import settings
+from app.services.executor_service import executor_service
+from app.services.redis_codec import SessionCodec
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.tracing_service import tracing_service
+
+logger = logging.getLogger(__name__)
 
 class RedisService:
     # 三个月的TTL时间（秒）
@@ -10,14 +20,137 @@ class RedisService:
     NAMESPACE = "ai-support"
     
     def __init__(self):
-        """初始化Redis客户端"""
-        self.redis_client = redis.Redis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            db=settings.REDIS_DB,
-            password=settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
-            decode_responses=True
+        """初始化Redis客户端：同步客户端供线程池中的调用使用，异步客户端在应用 lifespan 中创建和关闭"""
+        self.redis_client = redis.Redis(decode_responses=True, **self._connection_kwargs())
+        # 存储二进制数据（如 float32 embedding）的客户端，不做字符串解码
+        self.binary_client = redis.Redis(decode_responses=False, **self._connection_kwargs())
+        self._async_client = None
+        self._async_binary_client = None
+        # 会话数据（历史消息、摘要、反馈）的编解码层，读取时兼容旧的 JSON 文本
+        self.codec = SessionCodec(
+            settings.REDIS_CODEC,
+            level=settings.REDIS_CODEC_LEVEL,
+            min_compress_bytes=settings.REDIS_CODEC_MIN_COMPRESS_BYTES
+        )
+        # 请求路径上的异步操作经熔断器执行：超时或连接错误连续出现后直接失败，不再逐个等待超时
+        self.breaker = CircuitBreaker(
+            "Redis",
+            failure_threshold=settings.REDIS_BREAKER_FAILURE_THRESHOLD,
+            cooldown=settings.REDIS_BREAKER_COOLDOWN,
+            timeout=settings.REDIS_OP_TIMEOUT,
+            failure_types=(redis.exceptions.ConnectionError, redis.exceptions.TimeoutError, OSError)
         )
+        # Redis 不可用期间未能递增的知识库版本号，熔断器恢复后补上
+        self._knowledge_version_pending = False
+        self._knowledge_version_task = None
+        self.breaker.on_recovery(self._schedule_knowledge_version_bump)
+    
+    @staticmethod
+    def _connection_kwargs():
+        """同步和异步连接池共用的连接参数：连接池上限、超时和空闲连接健康检查"""
+        return {
+            "host": settings.REDIS_HOST,
+            "port": settings.REDIS_PORT,
+            "db": settings.REDIS_DB,
+            "password": settings.REDIS_PASSWORD if settings.REDIS_PASSWORD else None,
+            "max_connections": settings.REDIS_MAX_CONNECTIONS,
+            "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+            "socket_connect_timeout": settings.REDIS_CONNECT_TIMEOUT,
+            "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL,
+            "retry_on_timeout": True
+        }
+    
+    def _create_async_client(self, decode_responses):
+        pool = redis.asyncio.ConnectionPool(decode_responses=decode_responses, **self._connection_kwargs())
+        return redis.asyncio.Redis(connection_pool=pool)
+    
+    @property
+    def async_client(self):
+        """在事件循环中使用的异步客户端（未经 lifespan 启动时按需创建）"""
+        if self._async_client is None:
+            self._async_client = self._create_async_client(decode_responses=True)
+        return self._async_client
+    
+    @property
+    def async_binary_client(self):
+        """读写经 codec 编码的会话数据的异步客户端，不做字符串解码"""
+        if self._async_binary_client is None:
+            self._async_binary_client = self._create_async_client(decode_responses=False)
+        return self._async_binary_client
+    
+    async def startup(self):
+        """创建异步连接池并检查 Redis 是否可达，由 app.main.lifespan 调用"""
+        try:
+            await self.async_client.ping()
+            logger.info(f"✅ Redis 异步连接池已就绪 ({settings.REDIS_HOST}:{settings.REDIS_PORT})")
+        except Exception as e:
+            logger.error(f"❌ Redis 连接检查失败: {str(e)}")
+    
+    async def shutdown(self):
+        """关闭异步客户端，释放连接池中的所有连接"""
+        for client in (self._async_client, self._async_binary_client):
+            if client is not None:
+                await client.aclose()
+                await client.connection_pool.disconnect()
+        self._async_client = None
+        self._async_binary_client = None
+        logger.info("✅ Redis 连接池已关闭")
+    
+    async def call_async(self, fn, *args, **kwargs):
+        """
+        经熔断器执行异步 Redis 操作
+        
+        Args:
+            fn: 返回协程的函数（如 get_prompt_history_async）
+            *args, **kwargs: 传给 fn 的参数
+            
+        Returns:
+            fn 的结果
+            
+        Raises:
+            CircuitOpenError: 熔断器打开，调用方应使用降级数据
+        """
+        return await self.breaker.call(fn, *args, **kwargs)
+    
+    def call_sync(self, fn, *args, **kwargs):
+        """
+        经熔断器执行同步 Redis 操作（线程池中的调用使用），熔断器打开期间不访问 Redis
+        
+        Args:
+            fn: 同步函数（如 binary_client.get）
+            *args, **kwargs: 传给 fn 的参数
+            
+        Returns:
+            fn 的结果
+            
+        Raises:
+            CircuitOpenError: 熔断器打开，调用方应跳过该操作
+        """
+        return self.breaker.call_sync(fn, *args, **kwargs)
+    
+    async def health_check(self):
+        """
+        检查 Redis 连接状态
+        
+        Returns:
+            dict: {"healthy", "latency_ms", "error", "pool": 连接池使用情况, "breaker": 熔断器状态}
+        """
+        start = time.perf_counter()
+        result = {"healthy": True, "latency_ms": None, "error": None}
+        try:
+            await self.async_client.ping()
+            result["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        except Exception as e:
+            result["healthy"] = False
+            result["error"] = f"{type(e).__name__}: {str(e)}"
+        pool = self.async_client.connection_pool
+        result["pool"] = {
+            "max_connections": pool.max_connections,
+            "in_use": len(pool._in_use_connections),
+            "idle": len(pool._available_connections)
+        }
+        result["breaker"] = self.breaker.get_stats()
+        return result
     
     def _normalize_session_key(self, session_id, add_history_suffix=True):
         """
@@ -43,47 +176,421 @@ class RedisService:
             
         return normalized_key
     
-    def get_conversation_history(self, session_id):
-        """获取会话历史记录"""
-        history_key = self._normalize_session_key(session_id, add_history_suffix=True)
+    @staticmethod
+    def _is_wrong_type(error):
+        return isinstance(error, redis.exceptions.ResponseError) and "WRONGTYPE" in str(error)
+    
+    def _migrate_legacy_history(self, history_key):
+        """
+        把旧格式（整个历史存为一个 JSON 字符串）的会话历史转换为列表，保留剩余过期时间
+        
+        使用 WATCH/MULTI 保证并发迁移或写入时不会丢失消息。
+        
+        Args:
+            history_key (str): 标准化后的历史记录 key
+            
+        Returns:
+            bool: 是否执行了迁移
+        """
+        with self.redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(history_key)
+                if pipe.type(history_key) != "string":
+                    return False
+                raw = pipe.get(history_key)
+                ttl = pipe.ttl(history_key)
+                history = json.loads(raw) if raw else []
+                total = len(history)
+                history = history[-settings.HISTORY_MAX_MESSAGES:]
+                
+                pipe.multi()
+                pipe.delete(history_key)
+                if history:
+                    ttl = ttl if ttl > 0 else self.TTL_THREE_MONTHS
+                    pipe.rpush(history_key, *[self.codec.encode(msg) for msg in history])
+                    pipe.expire(history_key, ttl)
+                    # 超出上限未迁移的早前消息已在 Strapi 的会话记录中
+                    pipe.set(self._message_count_key(history_key), total, ex=ttl)
+                pipe.execute()
+                logger.info(f"🔄 已将会话历史迁移为列表格式: {history_key}（{len(history)}条消息）")
+                return True
+            except redis.WatchError:
+                # 其他进程在此期间迁移或写入了该 key，由调用方重试
+                return False
+    
+    def migrate_legacy_histories(self, batch_size=500):
+        """
+        扫描并迁移所有旧格式的会话历史（启动时在后台执行；未迁移的 key 在首次访问时也会自动迁移）
+        
+        整个集群只执行一次：持有锁的进程执行扫描，完成后写入完成标记，之后启动的进程直接跳过。
+        SCAN 只返回字符串类型的 key，已是列表的会话历史不需要逐个检查。
+        
+        Args:
+            batch_size (int): 每次 SCAN 返回的 key 数量
+            
+        Returns:
+            int: 迁移的会话数（已完成或其他进程正在执行时为 0）
+        """
+        done_key = f"{self.NAMESPACE}:migration:history-list:done"
+        lock_key = f"{self.NAMESPACE}:lock:migration:history-list"
+        if self.redis_client.exists(done_key):
+            logger.debug("ℹ️ 旧格式会话历史已迁移完成，跳过")
+            return 0
+        if not self.redis_client.set(lock_key, "1", nx=True, ex=settings.HISTORY_MIGRATION_LOCK_TTL):
+            logger.info("ℹ️ 其他进程正在迁移旧格式会话历史，跳过")
+            return 0
         
-        print(f"🔍 尝试从Redis获取历史记录，key: {history_key}")
-        history = self.redis_client.get(history_key)
-        return json.loads(history) if history else []
+        try:
+            migrated = 0
+            pattern = f"{self.NAMESPACE}:session:*:history"
+            for history_key in self.redis_client.scan_iter(match=pattern, count=batch_size, _type="string"):
+                if self._migrate_legacy_history(history_key):
+                    migrated += 1
+            self.redis_client.set(done_key, datetime.datetime.now().isoformat())
+            logger.info(f"✅ 旧格式会话历史迁移完成，共迁移 {migrated} 个会话")
+            return migrated
+        finally:
+            self.redis_client.delete(lock_key)
     
-    def update_conversation_history(self, session_id, history):
-        """更新会话历史记录"""
+    @staticmethod
+    def _message_count_key(history_key):
+        """会话累计写入的消息条数（含已移出历史列表的消息），与列表长度之差即为列表头部已移除的条数"""
+        return f"{history_key[:-len(':history')]}:message-count"
+    
+    @tracing_service.traced("redis.get_history")
+    async def get_conversation_history_async(self, session_id, max_messages=None):
+        """
+        获取会话历史记录（异步版本，不占用线程池）
+        
+        Args:
+            session_id (str): 会话 ID
+            max_messages (int, optional): 只读取最近的若干条消息，为 None 时读取全部
+            
+        Returns:
+            list: 按时间顺序排列的消息列表
+        """
         history_key = self._normalize_session_key(session_id, add_history_suffix=True)
+        start = -max_messages if max_messages else 0
+        try:
+            items = await self.async_binary_client.lrange(history_key, start, -1)
+        except redis.exceptions.ResponseError as e:
+            if not self._is_wrong_type(e):
+                raise
+            # 旧格式只需迁移一次，直接复用同步实现
+            await executor_service.run(self._migrate_legacy_history, history_key)
+            items = await self.async_binary_client.lrange(history_key, start, -1)
+        return [self.codec.decode(item) for item in items]
+    
+    async def append_messages_async(self, session_id, messages):
+        """
+        追加消息到会话历史：RPUSH、LTRIM、EXPIRE 和消息计数在同一个事务管道中执行，只需一次往返
         
-        print(f"✅ 更新会话历史记录: {history_key}")
-        # 设置数据并添加三个月的过期时间
-        self.redis_client.setex(history_key, self.TTL_THREE_MONTHS, json.dumps(history))
-    
-    def record_user_query(self, session_id, query):
-        """记录用户查询"""
-        history = self.get_conversation_history(session_id)
-        history.append({
-            "role": "user", 
-            "content": query,
-            "timestamp": datetime.datetime.now().isoformat()
-        })
-        self.update_conversation_history(session_id, history)
-    
-    def record_ai_response(self, session_id, response):
-        """记录AI响应"""
-        history = self.get_conversation_history(session_id)
-        history.append({
-            "role": "assistant", 
-            "content": response,
+        列表只保留最近 HISTORY_MAX_MESSAGES 条消息，更早的消息以 Strapi 中的会话记录为准。
+        
+        Args:
+            session_id (str): 会话 ID
+            messages (list): 要追加的消息列表
+            
+        Returns:
+            int: 追加后（截断前）的列表长度
+        """
+        history_key = self._normalize_session_key(session_id, add_history_suffix=True)
+        count_key = self._message_count_key(history_key)
+        items = [self.codec.encode(msg) for msg in messages]
+        
+        async def write():
+            async with self.async_binary_client.pipeline(transaction=True) as pipe:
+                pipe.rpush(history_key, *items)
+                pipe.ltrim(history_key, -settings.HISTORY_MAX_MESSAGES, -1)
+                pipe.expire(history_key, self.TTL_THREE_MONTHS)
+                pipe.incrby(count_key, len(items))
+                pipe.expire(count_key, self.TTL_THREE_MONTHS)
+                length, *_ = await pipe.execute()
+                return length
+        
+        try:
+            length = await write()
+        except redis.exceptions.ResponseError as e:
+            if not self._is_wrong_type(e):
+                raise
+            await executor_service.run(self._migrate_legacy_history, history_key)
+            length = await write()
+        logger.debug(f"✅ 追加{len(items)}条会话消息: {history_key}")
+        return length
+    
+    async def append_messages_once_async(self, session_id, messages, window=20):
+        """
+        重放暂存的写入时使用：列表最近 window 条消息中已有这批消息时不再追加
+        
+        写入超时的请求可能已在 Redis 中生效；同一批消息在一个事务中追加，每条消息带有写入时的时间戳，
+        只需检查第一条是否已在列表末尾附近。
+        
+        Args:
+            session_id (str): 会话 ID
+            messages (list): 要追加的消息列表
+            window (int): 检查的最近消息条数
+            
+        Returns:
+            int: 追加后（截断前）的列表长度，已存在时为 0
+        """
+        history_key = self._normalize_session_key(session_id, add_history_suffix=True)
+        try:
+            recent = await self.async_binary_client.lrange(history_key, -window, -1)
+        except redis.exceptions.ResponseError as e:
+            if not self._is_wrong_type(e):
+                raise
+            recent = []
+        if any(self.codec.decode(item) == messages[0] for item in recent):
+            logger.info(f"ℹ️ 暂存的会话写入已在 Redis 中生效，跳过重放: {history_key}")
+            return 0
+        return await self.append_messages_async(session_id, messages)
+    
+    @staticmethod
+    def _message(role, content):
+        return {
+            "role": role,
+            "content": content,
             "timestamp": datetime.datetime.now().isoformat()
-        })
-        self.update_conversation_history(session_id, history)
+        }
+    
+    def turn_messages(self, query, response):
+        """构建一轮对话的两条消息（用户查询和AI响应）"""
+        return [self._message("user", query), self._message("assistant", response)]
+    
+    @staticmethod
+    def summary_message(summary, omitted):
+        """
+        代替已移出 Redis 的早前消息的 system 消息（反馈记录中、或 Strapi 中也缺少原文时使用）
+        
+        Args:
+            summary (dict): 会话摘要，没有摘要时为 None
+            omitted (int): 代替的消息条数
+            
+        Returns:
+            dict: 消息字典，omitted 字段记录代替的条数
+        """
+        content = f"早前对话摘要（共{omitted}条消息）: {summary['content']}" if summary else f"（早前{omitted}条消息未保留原文）"
+        return {
+            "role": "system",
+            "content": content,
+            "timestamp": summary.get("updated_at") if summary else None,
+            "omitted": omitted
+        }
+    
+    def _summary_key(self, session_id):
+        """会话摘要的 key：较早的轮次被压缩为摘要后，原始消息从历史列表中移除"""
+        return f"{self._normalize_session_key(session_id, add_history_suffix=False)}:summary"
+    
+    async def get_prompt_history_async(self, session_id, max_messages):
+        """
+        在一次往返中读取会话摘要、最近的若干条消息和列表长度，供构建提示词使用
+        
+        Args:
+            session_id (str): 会话 ID
+            max_messages (int): 读取最近的消息条数，为 None 时读取整个列表
+            
+        Returns:
+            tuple: (摘要字典或 None, 按时间顺序排列的消息列表, 历史列表的长度)
+        """
+        history_key = self._normalize_session_key(session_id, add_history_suffix=True)
+        
+        async def read():
+            async with self.async_binary_client.pipeline(transaction=False) as pipe:
+                pipe.get(self._summary_key(session_id))
+                pipe.lrange(history_key, -max_messages if max_messages else 0, -1)
+                pipe.llen(history_key)
+                return await pipe.execute()
+        
+        try:
+            summary, items, length = await read()
+        except redis.exceptions.ResponseError as e:
+            if not self._is_wrong_type(e):
+                raise
+            await executor_service.run(self._migrate_legacy_history, history_key)
+            summary, items, length = await read()
+        return self.codec.decode(summary), [self.codec.decode(item) for item in items], length
+    
+    async def get_transcript_async(self, session_id):
+        """
+        读取 Redis 中的对话记录（写入 Strapi 和反馈）：历史列表中的全部消息，以及列表头部已移除的条数
+        
+        被压缩或超过 HISTORY_MAX_MESSAGES 条而移出列表的早前消息不在 Redis 中，完整对话记录以 Strapi 为准：
+        写入 Strapi 时保留记录中已有的前 offset 条消息，再接上 messages。
+        
+        Args:
+            session_id (str): 会话 ID
+            
+        Returns:
+            dict: {"messages": 按时间顺序排列的消息列表, "offset": 列表头部已移除的条数,
+                   "total": 累计消息条数, "summary": 摘要字典或 None}
+        """
+        history_key = self._normalize_session_key(session_id, add_history_suffix=True)
+        
+        async def read():
+            # 在同一个事务中读取，避免压缩正在移除消息时读到不一致的条数
+            async with self.async_binary_client.pipeline(transaction=True) as pipe:
+                pipe.get(self._summary_key(session_id))
+                pipe.lrange(history_key, 0, -1)
+                pipe.get(self._message_count_key(history_key))
+                return await pipe.execute()
+        
+        try:
+            summary, items, count = await read()
+        except redis.exceptions.ResponseError as e:
+            if not self._is_wrong_type(e):
+                raise
+            await executor_service.run(self._migrate_legacy_history, history_key)
+            summary, items, count = await read()
+        
+        offset = max(0, int(count) - len(items)) if count else 0
+        return {
+            "messages": [self.codec.decode(item) for item in items],
+            "offset": offset,
+            "total": offset + len(items),
+            "summary": self.codec.decode(summary)
+        }
+    
+    async def get_history_entries_async(self, session_id):
+        """
+        读取会话历史的原始条目，以及其中已写入 Strapi 的条数，供压缩时核对被折叠的消息
+        
+        Returns:
+            tuple: ([(原始值, 消息字典), ...], 列表头部已写入 Strapi 的条数)，旧格式的 key 尚未迁移时返回 ([], 0)
+        """
+        history_key = self._normalize_session_key(session_id, add_history_suffix=True)
+        try:
+            async with self.async_binary_client.pipeline(transaction=True) as pipe:
+                pipe.lrange(history_key, 0, -1)
+                pipe.get(self._message_count_key(history_key))
+                pipe.get(self._strapi_persisted_key(session_id))
+                items, count, persisted = await pipe.execute()
+        except redis.exceptions.ResponseError as e:
+            if not self._is_wrong_type(e):
+                raise
+            return [], 0
+        offset = max(0, int(count) - len(items)) if count else 0
+        persisted_in_list = min(max(0, int(persisted or 0) - offset), len(items))
+        return [(item, self.codec.decode(item)) for item in items], persisted_in_list
+    
+    async def get_history_summary_async(self, session_id):
+        """获取会话摘要，没有摘要时返回 None"""
+        return self.codec.decode(await self.async_binary_client.get(self._summary_key(session_id)))
+    
+    async def apply_history_compaction_async(self, session_id, folded_items, summary):
+        """
+        保存新的会话摘要，并从历史列表中删除已折叠的前 len(folded_items) 条消息（原文已在 Strapi 的会话记录中）
+        
+        摘要写入和 LTRIM 在同一个 WATCH/MULTI 事务中执行；事务前核对被折叠的最后一条消息仍在原位置，
+        避免在压缩期间历史被截断或替换时误删消息。
+        
+        Args:
+            session_id (str): 会话 ID
+            folded_items (list): 被折叠消息的原始值（从列表头部开始）
+            summary (dict): 新的摘要
+            
+        Returns:
+            bool: 是否成功应用
+        """
+        history_key = self._normalize_session_key(session_id, add_history_suffix=True)
+        folded_count = len(folded_items)
+        for _ in range(3):
+            async with self.async_binary_client.pipeline(transaction=True) as pipe:
+                try:
+                    await pipe.watch(history_key)
+                    if await pipe.lindex(history_key, folded_count - 1) != folded_items[-1]:
+                        return False
+                    pipe.multi()
+                    pipe.set(self._summary_key(session_id), self.codec.encode(summary), ex=self.TTL_THREE_MONTHS)
+                    pipe.ltrim(history_key, folded_count, -1)
+                    pipe.expire(history_key, self.TTL_THREE_MONTHS)
+                    await pipe.execute()
+                    return True
+                except redis.WatchError:
+                    # 事务期间有新消息追加，重新核对后再试
+                    continue
+        return False
+    
+    async def acquire_lock_async(self, name, ttl):
+        """获取跨进程的简单互斥锁（SET NX EX），锁在 ttl 秒后自动释放"""
+        return bool(await self.async_client.set(f"{self.NAMESPACE}:lock:{name}", "1", nx=True, ex=ttl))
+    
+    async def release_lock_async(self, name):
+        """释放 acquire_lock_async 获取的锁"""
+        await self.async_client.delete(f"{self.NAMESPACE}:lock:{name}")
+    
+    def _strapi_record_key(self, session_id):
+        """会话对应的 Strapi ai-support-sessions 记录 ID 的 key"""
+        return f"{self._normalize_session_key(session_id, add_history_suffix=False)}:strapi-id"
+    
+    async def get_strapi_record_id_async(self, session_id):
+        """获取缓存的 Strapi 会话记录 ID，未缓存时返回 None"""
+        return await self.async_client.get(self._strapi_record_key(session_id))
+    
+    def _strapi_persisted_key(self, session_id):
+        """已写入 Strapi 的累计消息条数（压缩只删除已写入 Strapi 的消息）"""
+        return f"{self._normalize_session_key(session_id, add_history_suffix=False)}:strapi-persisted"
+    
+    async def set_strapi_record_id_async(self, session_id, record_id, persisted):
+        """
+        写入 Strapi 成功后调用：缓存会话记录 ID 和已写入的累计消息条数，与会话历史使用相同的过期时间
+        
+        Args:
+            session_id (str): 会话 ID
+            record_id: Strapi 记录 ID
+            persisted (int): 本次写入的累计消息条数（get_transcript_async 返回的 total）
+        """
+        async with self.async_client.pipeline(transaction=False) as pipe:
+            pipe.set(self._strapi_record_key(session_id), str(record_id), ex=self.TTL_THREE_MONTHS)
+            pipe.set(self._strapi_persisted_key(session_id), persisted, ex=self.TTL_THREE_MONTHS)
+            await pipe.execute()
+    
+    def get_knowledge_version(self):
+        """获取知识库版本号（知识库每次变更后递增，用于使依赖知识库的缓存失效）"""
+        version = self.redis_client.get(f"{self.NAMESPACE}:kb:version")
+        return int(version) if version else 0
+    
+    async def get_knowledge_version_async(self):
+        """获取知识库版本号（异步版本）"""
+        version = await self.async_client.get(f"{self.NAMESPACE}:kb:version")
+        return int(version) if version else 0
+    
+    def incr_knowledge_version(self):
+        """
+        递增知识库版本号
+        
+        Redis 不可用时记录下来，熔断器恢复后再递增，避免回答缓存继续使用旧知识库的结果。
+        
+        Returns:
+            int: 新的版本号；Redis 不可用时为 None
+        """
+        try:
+            return self.call_sync(self.redis_client.incr, f"{self.NAMESPACE}:kb:version")
+        except (CircuitOpenError,) + self.breaker.failure_types as e:
+            self._knowledge_version_pending = True
+            logger.warning(f"⚠️ Redis 不可用，知识库版本将在恢复后递增: {type(e).__name__}")
+            return None
+    
+    def _schedule_knowledge_version_bump(self):
+        """熔断器恢复时调用（在事件循环中）：补上 Redis 不可用期间未能递增的知识库版本号"""
+        if not self._knowledge_version_pending:
+            return
+        if self._knowledge_version_task is None or self._knowledge_version_task.done():
+            self._knowledge_version_pending = False
+            self._knowledge_version_task = asyncio.get_running_loop().create_task(self._bump_pending_knowledge_version())
+    
+    async def _bump_pending_knowledge_version(self):
+        try:
+            version = await self.call_async(self.async_client.incr, f"{self.NAMESPACE}:kb:version")
+            logger.info(f"🔖 知识库版本已在 Redis 恢复后更新为 {version}")
+        except Exception as e:
+            self._knowledge_version_pending = True
+            logger.warning(f"⚠️ 恢复后更新知识库版本失败，下次恢复时重试: {str(e)}")
     
     def save_feedback(self, session_id, feedback):
         """保存用户反馈"""
         feedback_key = f"{self.NAMESPACE}:session:{session_id}:feedback"
         # 设置数据并添加三个月的过期时间
-        self.redis_client.setex(feedback_key, self.TTL_THREE_MONTHS, json.dumps(feedback))
+        self.binary_client.setex(feedback_key, self.TTL_THREE_MONTHS, self.codec.encode(feedback))
         return True
 
 redis_service = RedisService()
\ No newline at end of file
@@ -11,11 +11,7 @@ import threading
 import schedule
 import glob
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 日志处理器由 app.core.logging_config.setup_logging 统一配置
 logger = logging.getLogger(__name__)
 
 class SchedulerService:
@@ -23,42 +19,40 @@ class SchedulerService:
         """初始化调度服务"""
         self.running = False
         self.scheduler_thread = None
-        print("调度服务已创建")
+        logger.info("调度服务已创建")
     
     def update_knowledge_base(self):
         """定期更新知识库的任务"""
-        print("\n📅 执行定时任务：更新知识库...")
+        logger.info("📅 执行定时任务：更新知识库...")
         try:
             # 检查是否跳过Strapi数据抓取
             if settings.SKIP_STRAPI_FETCH:
-                print("⚠️ 调试模式：跳过Strapi数据抓取")
+                logger.warning("⚠️ 调试模式：跳过Strapi数据抓取")
             else:
                 # 使用incremental_update_knowledge_base方法，获取最近24小时的数据
                 strapi_service.incremental_update_knowledge_base(hours=24)
                 
-            print("✅ 知识库更新完成")
+            logger.info("✅ 知识库更新完成")
         except Exception as e:
-            print(f"❌ 知识库更新失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"❌ 知识库更新失败: {str(e)}")
     
     def run_scheduler(self):
         """运行调度器"""
-        print("调度线程启动")
+        logger.info("调度线程启动")
         
         # 如果在调试模式下跳过了所有操作，则不添加任务
         if settings.DEBUG_MODE and settings.SKIP_STRAPI_FETCH and settings.SKIP_CHROMA_UPDATE:
-            print("⚠️ 调试模式：所有数据操作已禁用，调度任务将不执行")
+            logger.warning("⚠️ 调试模式：所有数据操作已禁用，调度任务将不执行")
         else:
             # 每30分钟执行一次知识库更新
             schedule.every(30).minutes.do(self.update_knowledge_base)
-            print("已设置每30分钟更新一次知识库")
+            logger.info("已设置每30分钟更新一次知识库")
         
         while self.running:
             schedule.run_pending()
             time.sleep(1)
         
-        print("调度线程停止")
+        logger.info("调度线程停止")
     
     def start(self):
         """启动调度服务"""
@@ -67,9 +61,9 @@ class SchedulerService:
             self.scheduler_thread = threading.Thread(target=self.run_scheduler)
             self.scheduler_thread.daemon = True  # 设置为守护线程，主程序结束时自动退出
             self.scheduler_thread.start()
-            print("调度服务已启动")
+            logger.info("调度服务已启动")
         else:
-            print("调度服务已经在运行")
+            logger.info("调度服务已经在运行")
     
     def shutdown(self):
         """关闭调度服务"""
@@ -77,9 +71,9 @@ class SchedulerService:
             self.running = False
             if self.scheduler_thread:
                 self.scheduler_thread.join(timeout=2)  # 等待线程结束，最多等待2秒
-            print("调度服务已关闭")
+            logger.info("调度服务已关闭")
         else:
-            print("调度服务未在运行")
+            logger.info("调度服务未在运行")
             
     def get_jobs(self):
         """获取所有调度任务信息"""
@@ -0,0 +1,355 @@
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.redis_service import redis_service
+from app.services.circuit_breaker import CircuitOpenError
+from app.services.tracing_service import tracing_service
+
+logger = logging.getLogger(__name__)
+
+class SessionCacheService:
+    """
+    进程内的会话缓存（会话摘要 + 构建提示词所需的最近消息），按 LRU 淘汰并在 SESSION_CACHE_TTL 秒后过期
+
+    每个会话只读取和缓存最近 HISTORY_PROMPT_ROUNDS * 2 + 1 条消息；完整对话记录（写入 Strapi、反馈）
+    由 redis_service.get_transcript_async 读取，不经过缓存。
+
+    本进程写入会话时直接更新本地副本，并通过 Redis pub/sub 通知其他进程丢弃该会话的缓存。
+    订阅连接未建立或中断时不使用缓存（可能错过失效通知），每次都从 Redis 读取。
+
+    Redis 不可用（熔断器打开、超时或连接错误）时进入降级模式：读取使用最近会话的进程内副本
+    （REDIS_FALLBACK_SESSIONS 个，没有副本的会话按无历史处理），写入暂存在有界队列中，
+    Redis 恢复后按顺序重放。写入超时的请求可能已在 Redis 中生效，重放前检查列表末尾，已存在的写入不再追加。
+    """
+
+    def __init__(self):
+        self.enabled = settings.SESSION_CACHE_ENABLED
+        self.max_sessions = settings.SESSION_CACHE_SIZE
+        self.ttl = settings.SESSION_CACHE_TTL
+        # 每轮一问一答，多取一条以补齐可能未完成的轮次
+        self.window = settings.HISTORY_PROMPT_ROUNDS * 2 + 1
+        self.channel = f"{redis_service.NAMESPACE}:session-invalidate"
+        # 用于忽略本进程自己发布的失效通知
+        self.worker_id = uuid.uuid4().hex
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._listener_task: Optional[asyncio.Task] = None
+        self._subscribed = False
+        # 每收到一次失效通知递增；读取 Redis 期间收到通知时不缓存读到的（可能已过期的）数据
+        self._generation = 0
+        # 降级模式：最近会话的副本（不受 TTL 和订阅状态限制），以及等待重放的写入
+        self.fallback_size = settings.REDIS_FALLBACK_SESSIONS
+        self.write_buffer_size = settings.REDIS_WRITE_BUFFER_SIZE
+        self._fallback: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pending: Deque[Tuple[str, List[Dict[str, Any]]]] = deque()
+        self._pending_sessions: Dict[str, int] = {}
+        self._replay_task: Optional[asyncio.Task] = None
+        self._unavailable = (CircuitOpenError,) + redis_service.breaker.failure_types
+        redis_service.breaker.on_recovery(self._schedule_replay)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.fallback_reads = 0
+        self.buffered_writes = 0
+        self.replayed_writes = 0
+        self.dropped_writes = 0
+
+    @property
+    def active(self) -> bool:
+        """缓存是否可用：已启用且失效通知的订阅连接正常"""
+        return self.enabled and self._subscribed
+
+    def _lookup(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry["loaded_at"] > self.ttl:
+            del self._entries[session_id]
+            return None
+        self._entries.move_to_end(session_id)
+        return entry
+
+    def _store(self, session_id: str, summary: Optional[Dict[str, Any]], messages: List[Dict[str, Any]],
+               length: int) -> None:
+        # length 为读取时历史列表的长度，用于 append 时判断本地副本是否仍与 Redis 一致
+        self._entries[session_id] = {
+            "summary": summary, "messages": messages, "length": length, "loaded_at": time.monotonic()
+        }
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_sessions:
+            self._entries.popitem(last=False)
+
+    def _remember(self, session_id: str, summary: Optional[Dict[str, Any]], messages: List[Dict[str, Any]]) -> None:
+        """更新会话的降级副本"""
+        self._fallback[session_id] = {"summary": summary, "messages": messages}
+        self._fallback.move_to_end(session_id)
+        while len(self._fallback) > self.fallback_size:
+            self._fallback.popitem(last=False)
+
+    def _extend_fallback(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        entry = self._fallback.get(session_id)
+        summary = entry["summary"] if entry else None
+        previous = entry["messages"] if entry else []
+        self._remember(session_id, summary, (previous + list(messages))[-self.window:])
+
+    def _fallback_snapshot(self, session_id: str) -> Dict[str, Any]:
+        entry = self._fallback.get(session_id)
+        if entry is None:
+            return {"summary": None, "messages": []}
+        self._fallback.move_to_end(session_id)
+        return self._snapshot(entry)
+
+    @staticmethod
+    def _snapshot(entry: Dict[str, Any]) -> Dict[str, Any]:
+        # 返回浅拷贝，调用方修改消息列表不会影响缓存
+        return {"summary": entry["summary"], "messages": list(entry["messages"])}
+
+    @tracing_service.traced("session_cache.get")
+    async def get(self, session_id: str) -> Dict[str, Any]:
+        """
+        获取会话摘要和最近的消息（优先读取本地缓存），最多 HISTORY_PROMPT_ROUNDS * 2 + 1 条
+
+        Args:
+            session_id (str): 会话 ID
+
+        Returns:
+            Dict[str, Any]: {"summary": 摘要字典或 None, "messages": 按时间顺序排列的最近消息}，
+                            Redis 不可用时返回降级副本
+        """
+        if session_id in self._pending_sessions:
+            # Redis 中还缺少尚未重放的写入，以本地副本为准
+            self.fallback_reads += 1
+            return self._fallback_snapshot(session_id)
+
+        if self.active:
+            entry = self._lookup(session_id)
+            if entry is not None:
+                self.hits += 1
+                return self._snapshot(entry)
+            self.misses += 1
+
+        generation = self._generation
+        try:
+            summary, messages, length = await redis_service.call_async(
+                redis_service.get_prompt_history_async, session_id, self.window
+            )
+        except self._unavailable as e:
+            self.fallback_reads += 1
+            logger.debug(f"⚠️ Redis 不可用，使用会话的本地副本: session_id={session_id}, {type(e).__name__}")
+            return self._fallback_snapshot(session_id)
+
+        if self.active and generation == self._generation:
+            self._store(session_id, summary, messages, length)
+        self._remember(session_id, summary, messages)
+        return {"summary": summary, "messages": list(messages)}
+
+    async def append(self, session_id: str, messages: List[Dict[str, Any]]) -> int:
+        """
+        追加消息到会话历史，同步更新本地缓存并通知其他进程
+
+        Args:
+            session_id (str): 会话 ID
+            messages (List[Dict[str, Any]]): 要追加的消息
+
+        Returns:
+            int: 追加后（截断前）的列表长度；Redis 不可用、写入被暂存时返回 0
+        """
+        if session_id in self._pending_sessions:
+            # 保持同一会话的写入顺序：排在尚未重放的写入之后
+            self._buffer(session_id, messages)
+            return 0
+        try:
+            length = await redis_service.call_async(redis_service.append_messages_async, session_id, messages)
+        except self._unavailable as e:
+            logger.warning(f"⚠️ Redis 不可用，暂存会话写入: session_id={session_id}, {type(e).__name__}")
+            self._buffer(session_id, messages)
+            return 0
+        # 正在进行的读取可能读到追加之前的数据，不能再写入缓存
+        self._generation += 1
+        self._extend_fallback(session_id, messages)
+
+        entry = self._entries.get(session_id) if self.active else None
+        if entry is not None:
+            if entry["length"] + len(messages) == length:
+                entry["messages"] = (entry["messages"] + list(messages))[-self.window:]
+                entry["length"] = min(length, settings.HISTORY_MAX_MESSAGES)
+            else:
+                # 本地副本与 Redis 不一致（其他进程同时写入），下次重新读取
+                self._entries.pop(session_id, None)
+        await self._publish(session_id)
+        return length
+
+    async def invalidate(self, session_id: str) -> None:
+        """会话在 append 之外被修改（例如压缩）后调用：丢弃本地缓存并通知其他进程"""
+        self._generation += 1
+        self._entries.pop(session_id, None)
+        await self._publish(session_id)
+
+    def has_pending_writes(self, session_id: str) -> bool:
+        """会话是否还有暂存、尚未重放到 Redis 的写入"""
+        return session_id in self._pending_sessions
+
+    def _buffer(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """暂存写入并更新本地副本；队列已满时丢弃最早的写入"""
+        if len(self._pending) >= self.write_buffer_size:
+            dropped_session, _ = self._pending.popleft()
+            self._release_pending(dropped_session)
+            self.dropped_writes += 1
+            logger.error(f"❌ 会话写入暂存队列已满，丢弃最早的写入: session_id={dropped_session}")
+        self._pending.append((session_id, list(messages)))
+        self._pending_sessions[session_id] = self._pending_sessions.get(session_id, 0) + 1
+        self.buffered_writes += 1
+        self._extend_fallback(session_id, messages)
+        self._schedule_replay()
+
+    def _release_pending(self, session_id: str) -> None:
+        remaining = self._pending_sessions.get(session_id, 0) - 1
+        if remaining > 0:
+            self._pending_sessions[session_id] = remaining
+        else:
+            self._pending_sessions.pop(session_id, None)
+
+    def _schedule_replay(self) -> None:
+        """有暂存写入且没有进行中的重放任务时启动重放（熔断器恢复时也会调用）"""
+        if self._pending and (self._replay_task is None or self._replay_task.done()):
+            self._replay_task = asyncio.get_running_loop().create_task(self._replay_loop())
+
+    async def _replay(self) -> bool:
+        """
+        按顺序重放暂存的写入
+
+        Returns:
+            bool: 是否已全部重放（Redis 仍不可用时返回 False）
+        """
+        while self._pending:
+            session_id, messages = self._pending[0]
+            try:
+                await redis_service.call_async(redis_service.append_messages_once_async, session_id, messages)
+                self.replayed_writes += 1
+            except self._unavailable:
+                return False
+            except Exception as e:
+                self.dropped_writes += 1
+                logger.error(f"❌ 重放会话写入失败，已丢弃: session_id={session_id}, {str(e)}")
+            # 写入完成后才移出队列，期间同一会话的新写入继续排在后面
+            self._pending.popleft()
+            self._release_pending(session_id)
+            self._generation += 1
+            self._entries.pop(session_id, None)
+            await self._publish(session_id)
+        logger.info("✅ 暂存的会话写入已全部重放到 Redis")
+        return True
+
+    async def _replay_loop(self) -> None:
+        # 没有请求流量时熔断器不会自行试探，这里每个冷却周期重试一次
+        while not await self._replay():
+            await asyncio.sleep(max(redis_service.breaker.cooldown, 0.1))
+
+    async def _publish(self, session_id: str) -> None:
+        if not self.enabled:
+            return
+        try:
+            await redis_service.call_async(
+                redis_service.async_client.publish, self.channel, f"{self.worker_id}:{session_id}"
+            )
+        except CircuitOpenError:
+            # 订阅连接同样中断，其他进程此时不会使用缓存
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ 发布会话缓存失效通知失败: {str(e)}")
+
+    def _handle_message(self, data: str) -> None:
+        worker_id, _, session_id = data.partition(":")
+        if worker_id == self.worker_id:
+            return
+        self._generation += 1
+        if self._entries.pop(session_id, None) is not None:
+            self.invalidations += 1
+
+    async def _listen(self) -> None:
+        """订阅失效通知；连接中断后清空缓存并重新订阅"""
+        while True:
+            pubsub = redis_service.async_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                self._subscribed = True
+                logger.info(f"✅ 会话缓存已订阅失效通知: {self.channel}")
+                while True:
+                    # 使用带超时的轮询，避免阻塞读取触发 socket 超时
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message is not None:
+                        self._handle_message(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"⚠️ 会话缓存失效通知订阅中断，暂停使用缓存: {str(e)}")
+            finally:
+                self._subscribed = False
+                self._generation += 1
+                self._entries.clear()
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            await asyncio.sleep(1.0)
+
+    async def startup(self) -> None:
+        """启动失效通知订阅，由 app.main.lifespan 调用"""
+        if self.enabled and self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def shutdown(self) -> None:
+        """尝试重放暂存的写入，然后停止订阅并清空缓存"""
+        if self._replay_task is not None and not self._replay_task.done():
+            self._replay_task.cancel()
+            try:
+                await self._replay_task
+            except asyncio.CancelledError:
+                pass
+        self._replay_task = None
+        if self._pending and not await self._replay():
+            logger.error(f"❌ Redis 仍不可用，{len(self._pending)} 条暂存的会话写入未能保存")
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+        self._entries.clear()
+        self._fallback.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "active": self.active,
+            "sessions": len(self._entries),
+            "max_sessions": self.max_sessions,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "fallback": self.get_fallback_stats()
+        }
+
+    def get_fallback_stats(self) -> Dict[str, Any]:
+        """获取降级模式统计信息：本地副本、暂存和重放的写入"""
+        return {
+            "sessions": len(self._fallback),
+            "max_sessions": self.fallback_size,
+            "reads": self.fallback_reads,
+            "pending_writes": len(self._pending),
+            "max_pending_writes": self.write_buffer_size,
+            "buffered_writes": self.buffered_writes,
+            "replayed_writes": self.replayed_writes,
+            "dropped_writes": self.dropped_writes
+        }
+
+# 创建会话缓存服务实例
+session_cache_service = SessionCacheService()
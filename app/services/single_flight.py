@@ -0,0 +1,58 @@
+import logging
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    def __init__(self, name: str):
+        """
+        初始化请求合并器：相同键的并发调用只执行一次，共享同一个进行中的结果
+        
+        Args:
+            name (str): 用于日志和统计的名称
+        """
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行 fn 或加入相同键的进行中调用
+        
+        上游调用在独立的任务中运行，单个等待方被取消（例如客户端断开）不会影响其他等待方。
+        
+        Args:
+            key (str): 合并键
+            fn (Callable[[], Awaitable[Any]]): 返回协程的函数，只在没有进行中调用时执行
+            
+        Returns:
+            Any: fn 的结果（所有等待方共享同一个对象）
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+            logger.debug(f"🔗 {self.name}: 合并相同的进行中请求")
+        return await asyncio.shield(task)
+    
+    def _on_done(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有等待方都已取消时，避免出现未读取异常的警告
+        if not task.cancelled():
+            task.exception()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计信息"""
+        return {
+            "name": self.name,
+            "inflight": len(self._inflight),
+            "executions": self.executions,
+            "coalesced": self.coalesced
+        }
@@ -1,3 +1,4 @@
+import logging
 import os
 import json
 import requests
@@ -8,10 +9,18 @@ from chromadb.config import Settings
 from openai import OpenAI
 from tqdm import tqdm
 import time
+import threading
 import tempfile
 import shutil
 from datetime import datetime, timedelta
 from app.services.cleanup import delete_update_file
+from app.services.redis_service import redis_service
+from app.services.embedding_cache_service import embedding_cache_service
+from app.services.knowledge_index_service import knowledge_index_service
+from app.services.metrics_service import metrics_service
+from app.services.tracing_service import tracing_service
+
+logger = logging.getLogger(__name__)
 
 class StrapiService:
     def __init__(self):
@@ -33,12 +42,12 @@ class StrapiService:
         self.chroma_db_path = os.path.join(self.data_dir, "chroma_db")
         if not os.path.exists(self.chroma_db_path):
             os.makedirs(self.chroma_db_path)
-            print(f"✅ 创建 ChromaDB 数据目录: {self.chroma_db_path}")
+            logger.info(f"✅ 创建 ChromaDB 数据目录: {self.chroma_db_path}")
         os.chmod(self.chroma_db_path, 0o777)
             
         # 初始化 ChromaDB
-        print(f"\n🔧 初始化 ChromaDB 客户端...")
-        print(f"数据目录: {self.chroma_db_path}")
+        logger.info("🔧 初始化 ChromaDB 客户端...")
+        logger.info(f"数据目录: {self.chroma_db_path}")
         
         # 确保所有现有文件和目录都有正确的权限
         for root, dirs, files in os.walk(self.chroma_db_path):
@@ -56,16 +65,22 @@ class StrapiService:
                 is_persistent=True
             )
         )
-        print("✅ ChromaDB 客户端初始化成功")
+        logger.info("✅ ChromaDB 客户端初始化成功")
+        
+        # 缓存检索用的集合句柄和数据条数，只在集合变更时刷新
+        self.collection_name = "im-customer-service"
+        self._collection = None
+        self._collection_count = 0
+        self._collection_lock = threading.Lock()
         
         # 初始化 OpenAI 客户端
         self.openai_api_key = settings.OPENAI_API_KEY
         if not self.openai_api_key:
-            print("⚠️ 警告: 未设置 OPENAI_API_KEY 环境变量")
+            logger.warning("⚠️ 警告: 未设置 OPENAI_API_KEY 环境变量")
             
-        print(f"\n🔧 OpenAI 客户端初始化:")
-        print(f"OpenAI API Key 已设置: {'✅ 是' if self.openai_api_key else '❌ 否'}")
-        print(f"OpenAI API URL: {settings.OPENAI_API_URL}")
+        logger.info("🔧 OpenAI 客户端初始化:")
+        logger.info(f"OpenAI API Key 已设置: {'✅ 是' if self.openai_api_key else '❌ 否'}")
+        logger.info(f"OpenAI API URL: {settings.OPENAI_API_URL}")
         
         # 初始化 OpenAI 客户端
         self.openai_client = OpenAI(
@@ -78,12 +93,12 @@ class StrapiService:
         )
             
         # 打印配置信息（不包含敏感信息）
-        print(f"\nStrapi 服务初始化:")
-        print(f"API URL: {self.base_url}")
-        print(f"数据目录: {self.data_dir}")
-        print(f"API Token 已设置: {'✅ 是' if self.api_token else '❌ 否'}")
-        print(f"OpenAI API Key 已设置: {'✅ 是' if self.openai_api_key else '❌ 否'}")
-        print(f"ChromaDB 持久化目录: {self.chroma_db_path}")
+        logger.info("Strapi 服务初始化:")
+        logger.info(f"API URL: {self.base_url}")
+        logger.info(f"数据目录: {self.data_dir}")
+        logger.info(f"API Token 已设置: {'✅ 是' if self.api_token else '❌ 否'}")
+        logger.info(f"OpenAI API Key 已设置: {'✅ 是' if self.openai_api_key else '❌ 否'}")
+        logger.info(f"ChromaDB 持久化目录: {self.chroma_db_path}")
     
     def get_all_knowledge(self, endpoint="api/im-customer-service-knowledge-bases", params=None):  #当 endpoint 为空字符串时，URL 就只会使用 base_url，不会添加额外的路径
         """
@@ -117,8 +132,8 @@ class StrapiService:
                 base_url = self.base_url.rstrip('/')
                 endpoint = endpoint.lstrip('/')
                 url = f"{base_url}/{endpoint}"
-                print(f"\n尝试连接: {url}")
-                print(f"请求参数: {current_params}")
+                logger.info(f"尝试连接: {url}")
+                logger.info(f"请求参数: {current_params}")
                 
                 # 发送请求
                 response = requests.get(
@@ -130,8 +145,8 @@ class StrapiService:
                 )
                 
                 # 打印响应信息
-                print(f"响应状态码: {response.status_code}")
-                print(f"响应头: {dict(response.headers)}")
+                logger.debug(f"响应状态码: {response.status_code}")
+                logger.info(f"响应头: {dict(response.headers)}")
                 
                 response.raise_for_status()
                 
@@ -140,42 +155,42 @@ class StrapiService:
                 # 提取数据
                 if 'data' in result and isinstance(result['data'], list):
                     all_data.extend(result['data'])
-                    print(f"成功获取 {len(result['data'])} 条数据")
+                    logger.info(f"成功获取 {len(result['data'])} 条数据")
                 else:
-                    print("警告: 响应中没有找到 data 字段或不是列表类型")
-                    print(f"响应内容: {result}")
+                    logger.info("警告: 响应中没有找到 data 字段或不是列表类型")
+                    logger.info(f"响应内容: {result}")
                 
                 # 更新总页数
                 if 'meta' in result and 'pagination' in result['meta']:
                     pagination = result['meta']['pagination']
                     total_pages = pagination.get('pageCount', 1)
-                    print(f"获取第 {page}/{total_pages} 页，每页 {page_size} 条，总计 {pagination.get('total', 0)} 条数据")
+                    logger.info(f"获取第 {page}/{total_pages} 页，每页 {page_size} 条，总计 {pagination.get('total', 0)} 条数据")
                 else:
-                    print("警告: 响应中没有找到分页信息")
+                    logger.info("警告: 响应中没有找到分页信息")
                 
                 page += 1
                 
             except requests.exceptions.SSLError as e:
-                print(f"SSL 证书验证错误: {str(e)}")
-                print("请检查 API URL 是否正确，或确保服务器证书有效")
+                logger.error(f"SSL 证书验证错误: {str(e)}")
+                logger.info("请检查 API URL 是否正确，或确保服务器证书有效")
                 break
             except requests.exceptions.ConnectionError as e:
-                print(f"连接错误: {str(e)}")
-                print("请检查:")
-                print("1. Strapi 服务器是否正在运行")
-                print("2. API URL 是否正确")
-                print("3. 网络连接是否正常")
+                logger.error(f"连接错误: {str(e)}")
+                logger.info("请检查:")
+                logger.info("1. Strapi 服务器是否正在运行")
+                logger.info("2. API URL 是否正确")
+                logger.info("3. 网络连接是否正常")
                 break
             except requests.exceptions.Timeout as e:
-                print(f"请求超时: {str(e)}")
-                print("请检查网络连接或增加超时时间")
+                logger.info(f"请求超时: {str(e)}")
+                logger.info("请检查网络连接或增加超时时间")
                 break
             except requests.exceptions.RequestException as e:
-                print(f"请求错误: {str(e)}")
-                print(f"响应内容: {getattr(e.response, 'text', '无响应内容')}")
+                logger.error(f"请求错误: {str(e)}")
+                logger.info(f"响应内容: {getattr(e.response, 'text', '无响应内容')}")
                 break
             except Exception as e:
-                print(f"获取数据失败（页码 {page}）: {str(e)}")
+                logger.error(f"获取数据失败（页码 {page}）: {str(e)}")
                 break
         
         return all_data
@@ -196,7 +211,7 @@ class StrapiService:
         with open(filepath, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
         
-        print(f"数据已保存到: {filepath}")
+        logger.info(f"数据已保存到: {filepath}")
         return filepath
     
     def fetch_and_save_knowledge(self, endpoint="api/im-customer-service-knowledge-bases", params=None):
@@ -260,7 +275,7 @@ class StrapiService:
             with open(input_filepath, 'r', encoding='utf-8') as f:
                 data = json.load(f)
 
-            print(f"成功读取 {len(data)} 条数据")
+            logger.info(f"成功读取 {len(data)} 条数据")
             
             # 提取指定字段
             parsed_data = []
@@ -295,15 +310,20 @@ class StrapiService:
             with open(output_filepath, 'w', encoding='utf-8') as f:
                 json.dump(parsed_data, f, ensure_ascii=False, indent=2)
             
-            print(f"成功解析数据并保存到: {output_filepath}")
-            print(f"共处理 {len(parsed_data)} 条数据")
+            # 同步替换内存中的知识库索引
+            if output_filepath == knowledge_index_service.json_path:
+                knowledge_index_service.replace(parsed_data)
+            
+            logger.info(f"成功解析数据并保存到: {output_filepath}")
+            logger.info(f"共处理 {len(parsed_data)} 条数据")
             if empty_faq_count > 0:
-                print(f"⚠️ 警告: 有 {empty_faq_count} 条数据的FAQ字段为空")
+                logger.warning(f"⚠️ 警告: 有 {empty_faq_count} 条数据的FAQ字段为空")
             
+            self._bump_knowledge_version()
             return output_filepath
             
         except Exception as e:
-            print(f"解析 JSON 文件失败: {str(e)}")
+            logger.error(f"解析 JSON 文件失败: {str(e)}")
             return None
 
     def get_embedding(self, text):
@@ -317,7 +337,7 @@ class StrapiService:
             list: embedding 向量
         """
         if not self.openai_api_key:
-            print("❌ 错误: 未设置 OPENAI_API_KEY 环境变量")
+            logger.error("❌ 错误: 未设置 OPENAI_API_KEY 环境变量")
             return None
             
         max_retries = 5  # 增加重试次数
@@ -326,52 +346,110 @@ class StrapiService:
         
         for attempt in range(max_retries):
             try:
-                print(f"📡 正在获取文本 embedding (尝试 {attempt + 1}/{max_retries})...")
+                logger.debug(f"📡 正在获取文本 embedding (尝试 {attempt + 1}/{max_retries})...")
                 # 增加超时时间到 60 秒
                 response = self.openai_client.embeddings.create(
-                    model="text-embedding-ada-002",
+                    model=settings.EMBEDDING_MODEL,
                     input=text,
                     timeout=5  # 设置 5 秒超时
                 )
-                print("✅ 成功获取 embedding")
+                logger.debug("✅ 成功获取 embedding")
                 return response.data[0].embedding
             except Exception as e:
                 error_msg = str(e)
                 if "api_key" in error_msg.lower():
-                    print("❌ OpenAI API Key 无效或未正确设置")
-                    print("请检查 OPENAI_API_KEY 环境变量是否正确设置")
+                    logger.error("❌ OpenAI API Key 无效或未正确设置")
+                    logger.info("请检查 OPENAI_API_KEY 环境变量是否正确设置")
                     return None
                 elif "rate limit" in error_msg.lower():
-                    print("⚠️ API 调用频率超限")
+                    logger.warning("⚠️ API 调用频率超限")
                     if attempt < max_retries - 1:
                         current_delay = min(retry_delay * (2 ** attempt), max_delay)  # 指数退避，但不超过最大延迟
-                        print(f"等待 {current_delay} 秒后重试...")
+                        logger.info(f"等待 {current_delay} 秒后重试...")
                         time.sleep(current_delay)
                     continue
                 elif "timeout" in error_msg.lower():
-                    print("⚠️ 请求超时")
+                    logger.warning("⚠️ 请求超时")
                     if attempt < max_retries - 1:
                         current_delay = min(retry_delay * (2 ** attempt), max_delay)
-                        print(f"等待 {current_delay} 秒后重试...")
+                        logger.info(f"等待 {current_delay} 秒后重试...")
                         time.sleep(current_delay)
                     continue
                 else:
                     if attempt < max_retries - 1:
-                        print(f"❌ 获取 embedding 失败 (尝试 {attempt + 1}/{max_retries})")
-                        print(f"错误信息: {error_msg}")
+                        logger.error(f"❌ 获取 embedding 失败 (尝试 {attempt + 1}/{max_retries})")
+                        logger.error(f"错误信息: {error_msg}")
                         current_delay = min(retry_delay * (2 ** attempt), max_delay)
-                        print(f"等待 {current_delay} 秒后重试...")
+                        logger.info(f"等待 {current_delay} 秒后重试...")
                         time.sleep(current_delay)
                     else:
-                        print(f"❌ 获取 embedding 最终失败")
-                        print(f"错误信息: {error_msg}")
-                        print("请检查:")
-                        print("1. 网络连接是否正常")
-                        print("2. OpenAI API 服务是否可用")
-                        print("3. API Key 是否有足够的配额")
-                        print("4. 是否需要使用代理服务器")
+                        logger.error("❌ 获取 embedding 最终失败")
+                        logger.error(f"错误信息: {error_msg}")
+                        logger.info("请检查:")
+                        logger.info("1. 网络连接是否正常")
+                        logger.info("2. OpenAI API 服务是否可用")
+                        logger.info("3. API Key 是否有足够的配额")
+                        logger.info("4. 是否需要使用代理服务器")
                         return None
 
+    @tracing_service.traced("embedding.query")
+    def get_query_embedding(self, text):
+        """
+        获取查询文本的 embedding，优先使用两级缓存（进程内 LRU + Redis）  中间函数，被search_similar_faqs调用
+        
+        Args:
+            text (str): 预处理后的查询文本
+            
+        Returns:
+            list: embedding 向量
+        """
+        embedding = embedding_cache_service.get(settings.EMBEDDING_MODEL, text)
+        if embedding is not None:
+            logger.debug("✅ 命中 embedding 缓存")
+            return embedding
+        
+        embedding = self.get_embedding(text)
+        if embedding:
+            embedding_cache_service.set(settings.EMBEDDING_MODEL, text, embedding)
+        return embedding
+
+    @tracing_service.traced("embedding.query_batch")
+    def get_query_embeddings(self, texts):
+        """
+        批量获取查询文本的 embedding：先查缓存，未命中的文本合并为一次 API 调用
+        
+        Args:
+            texts (list): 预处理后的查询文本列表
+            
+        Returns:
+            list: 与 texts 一一对应的 embedding，获取失败的位置为 None
+        """
+        embeddings = [embedding_cache_service.get(settings.EMBEDDING_MODEL, text) for text in texts]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if not missing:
+            return embeddings
+        
+        batch_size = settings.BATCH_EMBEDDING_SIZE
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start:start + batch_size]
+            try:
+                response = self.openai_client.embeddings.create(
+                    model=settings.EMBEDDING_MODEL,
+                    input=[texts[i] for i in chunk],
+                    timeout=30
+                )
+            except Exception as e:
+                logger.error(f"❌ 批量获取 embedding 失败 ({len(chunk)} 条): {str(e)}")
+                continue
+            # 按 index 对齐返回结果
+            for item in response.data:
+                i = chunk[item.index]
+                embeddings[i] = item.embedding
+                embedding_cache_service.set(settings.EMBEDDING_MODEL, texts[i], item.embedding)
+        
+        logger.debug(f"✅ 批量获取 embedding: {len(texts) - len(missing)} 条命中缓存，{len(missing)} 条调用 API")
+        return embeddings
+
     def store_faq_in_chromadb(self, recreate_collection=True):
         """
         将FAQ信息存储到ChromaDB  主函数，被main.py调用
@@ -383,28 +461,31 @@ class StrapiService:
             bool: 是否成功存储
         """
         try:
-            print("\n📥 开始将FAQ数据存储到ChromaDB...")
+            logger.debug("📥 开始将FAQ数据存储到ChromaDB...")
             
             # 加载解析后的知识库数据
             json_path = os.path.join(self.data_dir, "strapi_knowledge_parsed.json")
             if not os.path.exists(json_path):
-                print(f"❌ 错误: 找不到知识库文件 {json_path}")
+                logger.error(f"❌ 错误: 找不到知识库文件 {json_path}")
                 return False
                 
             with open(json_path, 'r', encoding='utf-8') as f:
                 knowledge_data = json.load(f)
                 
-            print(f"📚 从 {json_path} 加载了 {len(knowledge_data)} 条问答数据")
+            logger.debug(f"📚 从 {json_path} 加载了 {len(knowledge_data)} 条问答数据")
+            # 全量重建时用同一份数据刷新内存中的知识库索引
+            knowledge_index_service.replace(knowledge_data)
             
             # 准备集合
             if recreate_collection:
-                print("🗑️ 重新创建集合 'im-customer-service'...")
+                logger.debug("🗑️ 重新创建集合 'im-customer-service'...")
                 # 如果集合已存在，则删除
+                self._invalidate_collection_cache()
                 try:
                     self.chroma_client.delete_collection('im-customer-service')
-                    print("✅ 成功删除现有集合")
+                    logger.debug("✅ 成功删除现有集合")
                 except Exception as e:
-                    print(f"ℹ️ 删除集合时出现消息: {str(e)}")
+                    logger.debug(f"ℹ️ 删除集合时出现消息: {str(e)}")
                 
                 # 创建新集合
                 collection = self.chroma_client.create_collection(
@@ -412,7 +493,7 @@ class StrapiService:
                     metadata={"description": "IM客服知识库，用于AI助手生成回答。"},
                     embedding_function=self._get_embedding_function()  # 使用自定义嵌入函数
                 )
-                print("✅ 成功创建新集合")
+                logger.debug("✅ 成功创建新集合")
             else:
                 # 获取或创建集合
                 try:
@@ -420,18 +501,18 @@ class StrapiService:
                         name='im-customer-service',
                         embedding_function=self._get_embedding_function()  # 使用自定义嵌入函数
                     )
-                    print("✅ 成功获取现有集合")
+                    logger.debug("✅ 成功获取现有集合")
                 except Exception as e:
-                    print(f"ℹ️ 获取集合时出现消息: {str(e)}")
+                    logger.debug(f"ℹ️ 获取集合时出现消息: {str(e)}")
                     collection = self.chroma_client.create_collection(
                         name='im-customer-service',
                         metadata={"description": "IM客服知识库，用于AI助手生成回答。"},
                         embedding_function=self._get_embedding_function()  # 使用自定义嵌入函数
                     )
-                    print("✅ 集合不存在，已创建新集合")
+                    logger.debug("✅ 集合不存在，已创建新集合")
             
             # 预处理数据：将知识数据转换为FAQ文本
-            print("🔍 正在预处理FAQ数据...")
+            logger.debug("🔍 正在预处理FAQ数据...")
             texts = []      # 存储FAQ文本
             metadatas = []  # 存储元数据
             ids = []        # 存储唯一ID
@@ -447,14 +528,14 @@ class StrapiService:
                 
                 # 记录可能的空值
                 if faq is None or faq == '':
-                    print(f"⚠️ 警告: ID为 {item_id} 的FAQ内容为空")
+                    logger.warning(f"⚠️ 警告: ID为 {item_id} 的FAQ内容为空")
                 
                 # 组合为完整的FAQ文本用于向量检索
                 # 注意：这里不包含Response，因为问答匹配主要基于问题和关键词
                 # 但在元数据中包含了完整信息
                 faq_text_list = self.preprocess_faq_text(faq)
                 if not faq_text_list:  # 检查列表是否为空
-                    print(f"⚠️ 警告: ID为 {item_id} 的FAQ处理后为空，跳过")
+                    logger.warning(f"⚠️ 警告: ID为 {item_id} 的FAQ处理后为空，跳过")
                     continue  # 跳过空内容
                 
                 # 将列表连接为字符串用于存储
@@ -479,10 +560,10 @@ class StrapiService:
                 ids.append(f"faq_{item_id}")
             
             if not texts:
-                print("❌ 错误: 没有有效的FAQ数据")
+                logger.error("❌ 错误: 没有有效的FAQ数据")
                 return False
                 
-            print(f"✅ 预处理完成，共有 {len(texts)} 条FAQ数据准备加入向量数据库")
+            logger.debug(f"✅ 预处理完成，共有 {len(texts)} 条FAQ数据准备加入向量数据库")
             
             # 分批处理，每批100条
             batch_size = 100
@@ -492,7 +573,7 @@ class StrapiService:
                 start_idx = i * batch_size
                 end_idx = min(start_idx + batch_size, len(texts))
                 
-                print(f"🔄 处理批次 {i+1}/{batches}，项目 {start_idx}-{end_idx-1}...")
+                logger.debug(f"🔄 处理批次 {i+1}/{batches}，项目 {start_idx}-{end_idx-1}...")
                 
                 batch_texts = texts[start_idx:end_idx]
                 batch_metadatas = metadatas[start_idx:end_idx]
@@ -505,24 +586,24 @@ class StrapiService:
                     ids=batch_ids
                 )
                 
-                print(f"✅ 批次 {i+1}/{batches} 处理完成")
+                logger.debug(f"✅ 批次 {i+1}/{batches} 处理完成")
             
-            print(f"\n🎉 成功将 {len(texts)} 条FAQ数据存储到ChromaDB")
+            logger.debug(f"🎉 成功将 {len(texts)} 条FAQ数据存储到ChromaDB")
+            self._refresh_collection_cache(collection)
+            self._bump_knowledge_version()
             
             # 刷新搜索提示列表
             try:
                 from app.services.hint_service import hint_service
                 hint_service.refresh()
-                print("✅ 搜索提示列表已刷新")
+                logger.debug("✅ 搜索提示列表已刷新")
             except Exception as e:
-                print(f"⚠️ 刷新搜索提示列表失败: {str(e)}")
+                logger.warning(f"⚠️ 刷新搜索提示列表失败: {str(e)}")
             
             return True
             
         except Exception as e:
-            print(f"❌ 存储FAQ数据到ChromaDB失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"❌ 存储FAQ数据到ChromaDB失败: {str(e)}")
             return False
 
     def preprocess_faq_text(self, text):
@@ -580,6 +661,7 @@ class StrapiService:
         # 返回匹配比例
         return matches / len(keyword_list) if keyword_list else 0.0
 
+    @tracing_service.traced("strapi.search_similar_faqs")
     def search_similar_faqs(self, query, n_results=3):
         """
         搜索与查询相似的问题  中间函数，被get_similar_faq_ids调用
@@ -592,143 +674,263 @@ class StrapiService:
             list: 相似问题列表
         """
         try:
-            print(f"\n开始搜索: {query}")
-            
-            # 定义正确的集合名称
-            collection_name = "im-customer-service"
-            
-            # 检查集合是否存在
-            collections = self.chroma_client.list_collections()
-            print(f"当前可用的集合: {[c.name for c in collections]}")
+            logger.debug(f"开始搜索: {query}")
             
-            # 检查集合名称是否在可用集合列表中
-            if not any(c.name == collection_name for c in collections):
-                print(f"❌ 错误: 找不到名为 '{collection_name}' 的集合")
-                print("请确保已经运行过 store_faq_in_chromadb() 来初始化数据")
+            # 使用缓存的集合句柄和数据条数，不再每次查询集合列表和条数
+            collection, collection_count = self._get_search_collection()
+            if not self._check_search_collection(collection, collection_count):
                 return []
             
-            try:
-                # 获取集合
-                collection = self.chroma_client.get_collection(collection_name)
-                print(f"✅ 成功获取 {collection_name} 集合")
-            except Exception as e:
-                print(f"❌ 获取集合失败: {str(e)}")
-                print("请确保已经运行过 store_faq_in_chromadb() 来初始化数据")
-                return []
-            
-            # 检查集合是否为空
-            collection_count = collection.count()
-            if collection_count == 0:
-                print("⚠️ 警告: 集合为空，没有可搜索的数据")
-                return []
-            
-            print(f"集合中包含 {collection_count} 条数据")
-            
             # 预处理查询文本
-            processed_queries = self.preprocess_faq_text(query)
-            if not processed_queries:
-                print("⚠️ 警告: 查询文本预处理后为空")
+            processed_query = self._preprocess_query(query)
+            if not processed_query:
+                logger.warning("⚠️ 警告: 查询文本预处理后为空")
                 return []
-                
-            processed_query = processed_queries[0]  # 防止索引越界
-            print(f"处理后的查询: {processed_query}")
             
             # 获取查询文本的 embedding
-            print("获取查询文本的 embedding...")
-            query_embedding = self.get_embedding(processed_query)
+            logger.debug("获取查询文本的 embedding...")
+            with metrics_service.stage("query_embedding"):
+                query_embedding = self.get_query_embedding(processed_query)
             if not query_embedding:
-                print("❌ 错误: 无法获取查询文本的 embedding")
+                logger.error("❌ 错误: 无法获取查询文本的 embedding")
                 return []
             
             # 搜索相似问题，获取更多结果用于重新排序
-            print("在 ChromaDB 中搜索相似问题...")
-            results = collection.query(
-                query_embeddings=[query_embedding],
-                n_results=min(n_results * 2, collection_count)  # 确保不超过集合中的数据数量
-            )
-            
-            # 检查结果是否为空
-            if not results or 'documents' not in results or not results['documents'] or len(results['documents'][0]) == 0:
-                print("⚠️ 警告: 未找到任何相似问题")
+            logger.debug("在 ChromaDB 中搜索相似问题...")
+            results = self._query_collection(collection, collection_count, [query_embedding], n_results)
+            if results is None:
                 return []
-                
-            # 结合向量相似度和关键词匹配重新排序
-            similar_faqs = []
-            for i in range(len(results['documents'][0])):
-                try:
-                    # 获取原始FAQ文本
-                    faq_text = results['documents'][0][i]
-                    
-                    # 检查元数据是否存在
-                    if 'metadatas' not in results or not results['metadatas'] or len(results['metadatas'][0]) <= i:
-                        print(f"⚠️ 警告: 索引 {i} 的元数据不存在")
-                        continue
-                        
-                    # 检查距离是否存在
-                    if 'distances' not in results or not results['distances'] or len(results['distances'][0]) <= i:
-                        print(f"⚠️ 警告: 索引 {i} 的距离不存在")
-                        continue
-                    
-                    # 预处理FAQ文本
-                    processed_faqs = self.preprocess_faq_text(faq_text)
-                    if not processed_faqs:
-                        processed_faqs = [faq_text]  # 如果预处理后为空，使用原始文本
-                    
-                    # 计算最佳匹配的FAQ文本的相似度
-                    best_semantic_score = results['distances'][0][i]  # 较小的距离表示更相似
-                    
-                    # 检查关键词字段是否存在
-                    keywords = results['metadatas'][0][i].get('keywords', '')
-                    
-                    # 计算关键词匹配分数
-                    keyword_score = self.calculate_keyword_similarity(
-                        processed_query,
-                        keywords
-                    )
-                    
-                    # 检查ID字段是否存在
-                    if 'id' not in results['metadatas'][0][i]:
-                        print(f"⚠️ 警告: 索引 {i} 的元数据中没有ID字段")
-                        continue
-                    
-                    # 综合得分 (将距离转换为相似度分数，并与关键词得分结合)
-                    combined_score = (1 - best_semantic_score) * 0.7 + keyword_score * 0.3
-                    
-                    similar_faqs.append({
-                        'id': results['metadatas'][0][i]['id'],
-                        'faq': faq_text,
-                        'keywords': keywords,
-                        'distance': best_semantic_score,
-                        'keyword_score': keyword_score,
-                        'combined_score': combined_score
-                    })
-                except Exception as e:
-                    print(f"❌ 处理索引 {i} 的结果时出错: {str(e)}")
-                    continue
             
-            # 检查是否有有效结果
-            if not similar_faqs:
-                print("⚠️ 警告: 处理后没有有效的相似问题")
-                return []
-                
-            # 根据综合得分重新排序
-            similar_faqs.sort(key=lambda x: x['combined_score'], reverse=True)
+            similar_faqs = self._rank_results(processed_query, results, 0, n_results)
+            logger.debug(f"✅ 找到 {len(similar_faqs)} 个相似问题")
+            return similar_faqs
+            
+        except Exception as e:
+            logger.exception(f"❌ 搜索相似问题失败: {str(e)}")
+            logger.info("请检查:")
+            logger.info("1. ChromaDB 服务是否正常运行")
+            logger.info("2. 数据库文件权限是否正确")
+            logger.info("3. 是否已经成功导入数据")
+            return []
+    
+    @tracing_service.traced("strapi.search_similar_faqs_batch")
+    def search_similar_faqs_batch(self, queries, n_results=3):
+        """
+        批量搜索相似问题：所有查询的 embedding 合并为一次 API 调用，ChromaDB 只查询一次
+        
+        Args:
+            queries (list): 查询文本列表
+            n_results (int): 每个查询返回的结果数量
             
-            # 只返回请求的数量
-            similar_faqs = similar_faqs[:n_results]
+        Returns:
+            list: 与 queries 一一对应的相似问题列表
+        """
+        similar = [[] for _ in queries]
+        try:
+            collection, collection_count = self._get_search_collection()
+            if not self._check_search_collection(collection, collection_count):
+                return similar
+            
+            processed = [self._preprocess_query(query) for query in queries]
+            valid = [i for i, processed_query in enumerate(processed) if processed_query]
+            if not valid:
+                return similar
+            
+            with metrics_service.stage("query_embedding"):
+                embeddings = self.get_query_embeddings([processed[i] for i in valid])
+            valid = [i for i, embedding in zip(valid, embeddings) if embedding]
+            embeddings = [embedding for embedding in embeddings if embedding]
+            if not valid:
+                logger.error("❌ 错误: 无法获取查询文本的 embedding")
+                return similar
+            
+            results = self._query_collection(collection, collection_count, embeddings, n_results)
+            if results is None:
+                return similar
+            
+            for row, i in enumerate(valid):
+                similar[i] = self._rank_results(processed[i], results, row, n_results)
+            logger.debug(f"✅ 批量搜索完成: {len(valid)}/{len(queries)} 个查询有效")
+            return similar
             
-            print(f"✅ 找到 {len(similar_faqs)} 个相似问题")
-            return similar_faqs
+        except Exception as e:
+            logger.exception(f"❌ 批量搜索相似问题失败: {str(e)}")
+            return similar
+    
+    def _check_search_collection(self, collection, collection_count):
+        """检查搜索用的集合是否存在且非空"""
+        if collection is None:
+            logger.error(f"❌ 错误: 找不到名为 '{self.collection_name}' 的集合")
+            logger.debug("请确保已经运行过 store_faq_in_chromadb() 来初始化数据")
+            return False
+        
+        # 检查集合是否为空
+        if collection_count == 0:
+            logger.warning("⚠️ 警告: 集合为空，没有可搜索的数据")
+            # 空集合不缓存，便于感知其他进程写入的数据
+            self._invalidate_collection_cache()
+            return False
+        return True
+    
+    def _preprocess_query(self, query):
+        """预处理查询文本，返回第一条处理结果，处理后为空时返回 None"""
+        with metrics_service.stage("preprocess"):
+            processed_queries = self.preprocess_faq_text(query)
+        if not processed_queries:
+            return None
+        processed_query = processed_queries[0]  # 防止索引越界
+        logger.debug(f"处理后的查询: {processed_query}")
+        return processed_query
+    
+    def _query_collection(self, collection, collection_count, query_embeddings, n_results):
+        """
+        在 ChromaDB 中查询，每个查询取 2 * n_results 条用于重新排序
+        
+        Args:
+            collection: 缓存的集合句柄
+            collection_count (int): 集合数据条数
+            query_embeddings (list): 查询向量列表
+            n_results (int): 每个查询最终需要的结果数量
             
+        Returns:
+            dict: ChromaDB 查询结果，集合不可用时为 None
+        """
+        try:
+            with metrics_service.stage("chroma_query"):
+                return collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=min(n_results * 2, collection_count)  # 确保不超过集合中的数据数量
+                )
         except Exception as e:
-            print(f"❌ 搜索相似问题失败: {str(e)}")
-            import traceback
-            traceback.print_exc()  # 打印完整的堆栈跟踪
-            print("请检查:")
-            print("1. ChromaDB 服务是否正常运行")
-            print("2. 数据库文件权限是否正确")
-            print("3. 是否已经成功导入数据")
+            # 集合可能已被其他进程重建，刷新句柄后重试一次
+            logger.warning(f"⚠️ 使用缓存的集合查询失败，刷新后重试: {str(e)}")
+            self._invalidate_collection_cache()
+            collection, collection_count = self._get_search_collection()
+            if collection is None or collection_count == 0:
+                return None
+            with metrics_service.stage("chroma_query"):
+                return collection.query(
+                    query_embeddings=query_embeddings,
+                    n_results=min(n_results * 2, collection_count)
+                )
+    
+    def _rank_results(self, processed_query, results, row, n_results):
+        """
+        结合向量相似度和关键词匹配，对第 row 个查询的 ChromaDB 结果重新排序
+        
+        Args:
+            processed_query (str): 预处理后的查询文本
+            results (dict): ChromaDB 查询结果
+            row (int): 查询在批量结果中的位置
+            n_results (int): 返回结果数量
+            
+        Returns:
+            list: 按综合得分从高到低排序的相似问题列表
+        """
+        # 检查结果是否为空
+        if not results or 'documents' not in results or not results['documents'] \
+                or len(results['documents']) <= row or len(results['documents'][row]) == 0:
+            logger.warning("⚠️ 警告: 未找到任何相似问题")
             return []
+        
+        documents = results['documents'][row]
+        metadatas = results['metadatas'][row] if results.get('metadatas') and len(results['metadatas']) > row else []
+        distances = results['distances'][row] if results.get('distances') and len(results['distances']) > row else []
+        
+        similar_faqs = []
+        for i in range(len(documents)):
+            try:
+                # 获取原始FAQ文本
+                faq_text = documents[i]
+                
+                # 检查元数据是否存在
+                if len(metadatas) <= i:
+                    logger.warning(f"⚠️ 警告: 索引 {i} 的元数据不存在")
+                    continue
+                    
+                # 检查距离是否存在
+                if len(distances) <= i:
+                    logger.warning(f"⚠️ 警告: 索引 {i} 的距离不存在")
+                    continue
+                
+                # 计算最佳匹配的FAQ文本的相似度
+                best_semantic_score = distances[i]  # 较小的距离表示更相似
+                
+                # 检查关键词字段是否存在
+                keywords = metadatas[i].get('keywords', '')
+                
+                # 计算关键词匹配分数
+                keyword_score = self.calculate_keyword_similarity(
+                    processed_query,
+                    keywords
+                )
+                
+                # 检查ID字段是否存在
+                if 'id' not in metadatas[i]:
+                    logger.warning(f"⚠️ 警告: 索引 {i} 的元数据中没有ID字段")
+                    continue
+                
+                # 综合得分 (将距离转换为相似度分数，并与关键词得分结合)
+                combined_score = (1 - best_semantic_score) * 0.7 + keyword_score * 0.3
+                
+                similar_faqs.append({
+                    'id': metadatas[i]['id'],
+                    'faq': faq_text,
+                    'keywords': keywords,
+                    'distance': best_semantic_score,
+                    'keyword_score': keyword_score,
+                    'combined_score': combined_score
+                })
+            except Exception as e:
+                logger.error(f"❌ 处理索引 {i} 的结果时出错: {str(e)}")
+                continue
+        
+        # 检查是否有有效结果
+        if not similar_faqs:
+            logger.warning("⚠️ 警告: 处理后没有有效的相似问题")
+            return []
+            
+        # 根据综合得分重新排序，只返回请求的数量
+        similar_faqs.sort(key=lambda x: x['combined_score'], reverse=True)
+        return similar_faqs[:n_results]
+
+    def _get_search_collection(self):
+        """
+        获取缓存的集合句柄和数据条数，首次使用时加载  中间函数，被search_similar_faqs调用
+        
+        Returns:
+            tuple: (集合句柄或None, 数据条数)
+        """
+        if self._collection is None:
+            with self._collection_lock:
+                if self._collection is None:
+                    self._refresh_collection_cache()
+        return self._collection, self._collection_count
+    
+    def _refresh_collection_cache(self, collection=None):
+        """
+        刷新缓存的集合句柄和数据条数
+        
+        Args:
+            collection: 刚写入数据的集合句柄，为 None 时从 ChromaDB 重新获取
+        """
+        try:
+            if collection is None:
+                collection = self.chroma_client.get_collection(self.collection_name)
+            count = collection.count()
+        except Exception as e:
+            logger.info(f"ℹ️ 刷新集合缓存时出现消息: {str(e)}")
+            self._invalidate_collection_cache()
+            return
+        
+        self._collection_count = count
+        self._collection = collection
+        logger.info(f"✅ 集合缓存已刷新: {self.collection_name} ({count} 条数据)")
+    
+    def _invalidate_collection_cache(self):
+        """使缓存的集合句柄失效，下次检索时重新获取"""
+        self._collection = None
+        self._collection_count = 0
 
     def get_similar_faq_ids(self, query, n_results=3):
         """
@@ -748,15 +950,14 @@ class StrapiService:
             # 提取ID并按综合得分排序
             faq_ids = [faq['id'] for faq in similar_faqs]
             
-            print(f"\n提取到 {len(faq_ids)} 个相似问题ID:")
-            for i, faq_id in enumerate(faq_ids, 1):
-                print(f"{i}. ID: {faq_id}")
+            logger.debug("提取到 %d 个相似问题ID: %s", len(faq_ids), faq_ids)
             return faq_ids
             
         except Exception as e:
-            print(f"❌ 提取相似问题ID失败: {str(e)}")
+            logger.error(f"❌ 提取相似问题ID失败: {str(e)}")
             return []
 
+    @tracing_service.traced("knowledge.get_faq_details")
     def get_faq_details_by_ids(self, faq_ids):
         """
         根据FAQ ID列表获取完整的知识库数据  中间函数，被format_faq_for_rag调用
@@ -768,59 +969,26 @@ class StrapiService:
             list: 包含完整FAQ数据的列表
         """
         try:
-            print(f"\n🔍 开始获取FAQ详细信息...")
-            
-            # 构建知识库JSON文件路径
-            json_path = os.path.join(self.data_dir, "strapi_knowledge_parsed.json")
-            
-            # 检查解析后的文件是否存在
-            if not os.path.exists(json_path):
-                print(f"❌ 错误: 找不到知识库文件 {json_path}")
-                return []
-            
-            # 读取知识库数据
-            with open(json_path, 'r', encoding='utf-8') as f:
-                knowledge_items = json.load(f)
-            
-            # 由于现在strapi_knowledge_parsed.json直接是数组格式，不需要检查格式
-            if not isinstance(knowledge_items, list):
-                print("❌ 错误: 知识库数据格式不正确，应为数组格式")
-                return []
-            
-            print(f"✅ 成功加载 {len(knowledge_items)} 条知识库数据")
-            
-            # 创建ID到数据的映射
-            id_to_data = {}
-            for item in knowledge_items:
-                if isinstance(item, dict) and 'id' in item:
-                    item_id = str(item['id'])
-                    id_to_data[item_id] = item
-            
-            # 获取指定ID的数据
-            faq_details = []
-            for faq_id in faq_ids:
-                faq_id_str = str(faq_id)
-                if faq_id_str in id_to_data:
-                    faq_details.append(id_to_data[faq_id_str])
-                else:
-                    print(f"⚠️ 警告: 未找到ID为 {faq_id} 的FAQ数据")
-            
-            # 打印结果
-            print(f"\n✅ 成功获取 {len(faq_details)} 条FAQ详细信息:")
-            for i, faq in enumerate(faq_details, 1):
-                print(f"\n{i}. ID: {faq.get('id')}")
-                print(f"   FAQ: {faq.get('FAQ', '')[:50]}...")
-                print(f"   Response: {faq.get('Response', '')[:50]}...")
-                print(f"   Keywords: {faq.get('Keywords', '')}")
-                print(f"   移动端图片: {'✅' if faq.get('Response_Pic_App_URL') else '❌'}")
-                print(f"   PC端图片: {'✅' if faq.get('Response_Pic_Pc_URL') else '❌'}")
+            logger.debug("🔍 开始获取FAQ详细信息...")
+            
+            # 从常驻内存的知识库索引中按ID查找，不再每次解析整个知识库文件
+            faq_details = [record.to_dict() for record in knowledge_index_service.get_many(faq_ids)]
+            
+            # 明细只在 DEBUG 级别输出，INFO 级别下不做任何格式化
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"✅ 成功获取 {len(faq_details)} 条FAQ详细信息:")
+                for i, faq in enumerate(faq_details, 1):
+                    logger.debug(
+                        f"{i}. ID: {faq.get('id')} | FAQ: {faq.get('FAQ', '')[:50]}... | "
+                        f"Response: {faq.get('Response', '')[:50]}... | Keywords: {faq.get('Keywords', '')} | "
+                        f"移动端图片: {'✅' if faq.get('Response_Pic_App_URL') else '❌'} | "
+                        f"PC端图片: {'✅' if faq.get('Response_Pic_Pc_URL') else '❌'}"
+                    )
             
             return faq_details
                 
         except Exception as e:
-            print(f"❌ 获取FAQ详细信息失败: {str(e)}")
-            import traceback
-            traceback.print_exc()  # 打印详细的堆栈跟踪
+            logger.exception(f"❌ 获取FAQ详细信息失败: {str(e)}")
             return []
 
     def format_faq_for_rag(self, faq_details, query=None):
@@ -835,7 +1003,7 @@ class StrapiService:
             str: 格式化后的文本
         """
         try:
-            print("\n📝 开始格式化FAQ信息为RAG文本...")
+            logger.debug("📝 开始格式化FAQ信息为RAG文本...")
             
             # 构建文本
             formatted_text = []
@@ -852,13 +1020,11 @@ class StrapiService:
                 app_image_url = faq.get('Response_Pic_App_URL', '')
                 pc_image_url = faq.get('Response_Pic_Pc_URL', '')
                 
-                # 打印出所有获取到的字段以便调试
-                print(f"\nFAQ {i} 字段:")
-                print(f"问题: {question}")
-                print(f"回答: {response}")
-                print(f"关键词: {keywords}")
-                print(f"APP图片: {app_image_url}")
-                print(f"PC图片: {pc_image_url}")
+                # 打印出所有获取到的字段以便调试（仅 DEBUG 级别）
+                logger.debug(
+                    "FAQ %d 字段: 问题=%s 回答=%s 关键词=%s APP图片=%s PC图片=%s",
+                    i, question, response, keywords, app_image_url, pc_image_url
+                )
                 
                 # 格式化每个FAQ条目
                 faq_text = f"FAQ {i}:\n"
@@ -880,13 +1046,11 @@ class StrapiService:
             # 合并所有文本
             result = "\n".join(formatted_text)
             
-            print("✅ FAQ信息格式化完成")
+            logger.debug("✅ FAQ信息格式化完成")
             return result
             
         except Exception as e:
-            print(f"❌ 格式化FAQ信息失败: {str(e)}")
-            import traceback
-            traceback.print_exc()  # 打印详细的堆栈跟踪
+            logger.exception(f"❌ 格式化FAQ信息失败: {str(e)}")
             return ""
     
     def _extract_large_image_url(self, pic_data):
@@ -925,7 +1089,7 @@ class StrapiService:
                 
             return ""
         except Exception as e:
-            print(f"⚠️ 提取图片URL失败: {str(e)}")
+            logger.warning(f"⚠️ 提取图片URL失败: {str(e)}")
             return ""
 
     def inspect_chromadb(self):
@@ -936,7 +1100,7 @@ class StrapiService:
             dict: 包含 ChromaDB 状态信息的字典
         """
         try:
-            print("\n🔍 开始检查 ChromaDB 状态...")
+            logger.info("🔍 开始检查 ChromaDB 状态...")
             
             # 检查数据目录
             db_path = os.path.join(self.data_dir, "chroma_db")
@@ -952,10 +1116,10 @@ class StrapiService:
             
             # 获取所有集合
             collections = self.chroma_client.list_collections()
-            print(f"\n📚 当前可用的集合: {[c.name for c in collections]}")
+            logger.info(f"📚 当前可用的集合: {[c.name for c in collections]}")
             
             if not collections:
-                print("⚠️ 警告: 没有找到任何集合")
+                logger.warning("⚠️ 警告: 没有找到任何集合")
                 return {
                     "status": "empty",
                     "collections": [],
@@ -993,22 +1157,22 @@ class StrapiService:
                     collections_info.append(collection_info)
                     
                     # 打印集合信息
-                    print(f"\n📊 集合 '{collection.name}' 信息:")
-                    print(f"- 数据条数: {count}")
+                    logger.info(f"📊 集合 '{collection.name}' 信息:")
+                    logger.info(f"- 数据条数: {count}")
                     if dimension:
-                        print(f"- 向量维度: {dimension}")
-                    print(f"- 元数据: {metadata}")
+                        logger.info(f"- 向量维度: {dimension}")
+                    logger.info(f"- 元数据: {metadata}")
                     
                 except Exception as e:
-                    print(f"❌ 获取集合 '{collection.name}' 信息失败: {str(e)}")
+                    logger.error(f"❌ 获取集合 '{collection.name}' 信息失败: {str(e)}")
                     collections_info.append({
                         "name": collection.name,
                         "error": str(e)
                     })
             
-            print(f"\n💾 数据库存储信息:")
-            print(f"- 存储路径: {db_path}")
-            print(f"- 总大小: {size_str}")
+            logger.info("💾 数据库存储信息:")
+            logger.info(f"- 存储路径: {db_path}")
+            logger.info(f"- 总大小: {size_str}")
             
             return {
                 "status": "success",
@@ -1019,7 +1183,7 @@ class StrapiService:
             }
             
         except Exception as e:
-            print(f"\n❌ 检查 ChromaDB 状态失败: {str(e)}")
+            logger.error(f"❌ 检查 ChromaDB 状态失败: {str(e)}")
             return {
                 "status": "error",
                 "error": str(e),
@@ -1037,19 +1201,19 @@ class StrapiService:
             bool: 操作是否成功
         """
         try:
-            print("\n🔧 开始更新知识库文件，添加Response字段...")
+            logger.info("🔧 开始更新知识库文件，添加Response字段...")
             
             # 构建知识库文件路径
             json_path = os.path.join(self.data_dir, "strapi_knowledge_parsed.json")
             if not os.path.exists(json_path):
-                print(f"❌ 错误: 找不到知识库文件 {json_path}")
+                logger.error(f"❌ 错误: 找不到知识库文件 {json_path}")
                 return False
                 
             # 读取现有知识库数据
             with open(json_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
                 
-            print(f"✅ 成功读取 {len(data)} 条数据")
+            logger.info(f"✅ 成功读取 {len(data)} 条数据")
             
             # 为每条数据添加Response字段（如果尚不存在）
             updated_count = 0
@@ -1061,17 +1225,16 @@ class StrapiService:
             # 保存更新后的数据
             with open(json_path, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
+            knowledge_index_service.replace(data)
                 
-            print(f"✅ 成功更新知识库文件")
-            print(f"- 总条目数: {len(data)}")
-            print(f"- 更新条目数: {updated_count}")
+            logger.info("✅ 成功更新知识库文件")
+            logger.info(f"- 总条目数: {len(data)}")
+            logger.info(f"- 更新条目数: {updated_count}")
             
             return True
             
         except Exception as e:
-            print(f"❌ 更新知识库文件失败: {str(e)}")
-            import traceback
-            traceback.print_exc()  # 打印详细的堆栈跟踪
+            logger.exception(f"❌ 更新知识库文件失败: {str(e)}")
             return False
 
     def get_recently_updated_knowledge(self, endpoint="api/im-customer-service-knowledge-bases", hours=1, params=None):
@@ -1107,9 +1270,9 @@ class StrapiService:
         recent_data = self.get_all_knowledge(endpoint, query_params)
         
         if recent_data:
-            print(f"✅ 发现 {len(recent_data)} 条最近 {hours} 小时内更新的数据")
+            logger.info(f"✅ 发现 {len(recent_data)} 条最近 {hours} 小时内更新的数据")
         else:
-            print(f"ℹ️ 没有发现最近 {hours} 小时内更新的数据")
+            logger.info(f"ℹ️ 没有发现最近 {hours} 小时内更新的数据")
             
         return recent_data
     
@@ -1153,7 +1316,7 @@ class StrapiService:
         output_file = f"{endpoint.replace('/', '_')}_update_{timestamp}.json"
         filepath = self.save_to_json(update_data, output_file)
         
-        print(f"✅ 新增/更新的数据已保存到: {filepath}")
+        logger.info(f"✅ 新增/更新的数据已保存到: {filepath}")
         return True, filepath
     
     def update_chromadb_with_new_data(self, input_file, recreate_collection=False):
@@ -1184,7 +1347,7 @@ class StrapiService:
                 for item in update_data['data']:
                     item_id = str(item.get('id', ''))
                     if not item_id:
-                        print(f"⚠️ 跳过没有ID的更新记录")
+                        logger.warning("⚠️ 跳过没有ID的更新记录")
                         continue
 
                     if 'attributes' in item:
@@ -1197,7 +1360,7 @@ class StrapiService:
                             # 使用与 store_faq_in_chromadb 类似的预处理和文档构建
                             faq_text_list = self.preprocess_faq_text(faq)
                             if not faq_text_list:
-                                print(f"⚠️ 警告: ID为 {item_id} 的更新FAQ处理后为空，跳过")
+                                logger.warning(f"⚠️ 警告: ID为 {item_id} 的更新FAQ处理后为空，跳过")
                                 continue
                             faq_text = "\n".join(faq_text_list)
 
@@ -1214,13 +1377,13 @@ class StrapiService:
                                 'metadata': metadata
                             })
                         else:
-                             print(f"⚠️ 警告: ID为 {item_id} 的更新记录缺少FAQ内容，跳过")
+                             logger.warning(f"⚠️ 警告: ID为 {item_id} 的更新记录缺少FAQ内容，跳过")
 
             if not faqs_to_update:
-                print("没有可更新的FAQ内容") # 修改日志消息
+                logger.info("没有可更新的FAQ内容")
                 return False
 
-            print(f"解析得到 {len(faqs_to_update)} 条待更新的FAQ")
+            logger.info(f"解析得到 {len(faqs_to_update)} 条待更新的FAQ")
 
             # 获取或创建集合
             collection_name = "im-customer-service"
@@ -1229,14 +1392,14 @@ class StrapiService:
                     name=collection_name,
                     embedding_function=self._get_embedding_function() # 确保使用嵌入函数
                 )
-                print(f"获取到已存在的集合: {collection_name}")
+                logger.info(f"获取到已存在的集合: {collection_name}")
             except Exception as e:
-                print(f"获取集合时出错，尝试创建: {str(e)}")
+                logger.info(f"获取集合时出错，尝试创建: {str(e)}")
                 collection = self.chroma_client.create_collection(
                     name=collection_name,
                     embedding_function=self._get_embedding_function()
                 )
-                print(f"创建新集合: {collection_name}")
+                logger.info(f"创建新集合: {collection_name}")
 
             # 嵌入并更新数据
             successful_updates = 0
@@ -1252,17 +1415,17 @@ class StrapiService:
                     metadatas=metadatas_to_upsert
                 )
                 successful_updates = len(faqs_to_update)
-                print(f"✅ 成功更新/添加 {successful_updates} 条FAQ到 ChromaDB")
+                logger.info(f"✅ 成功更新/添加 {successful_updates} 条FAQ到 ChromaDB")
+                self._refresh_collection_cache(collection)
+                self._bump_knowledge_version()
             except Exception as e:
-                print(f"❌ 更新/添加 ChromaDB 时出错: {str(e)}")
+                logger.error(f"❌ 更新/添加 ChromaDB 时出错: {str(e)}")
                 # 可以在这里添加更详细的错误处理或重试逻辑
 
             return successful_updates > 0
 
         except Exception as e:
-            print(f"❌ 更新 ChromaDB 失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"❌ 更新 ChromaDB 失败: {str(e)}")
             return False
     
     def incremental_update_knowledge_base(self, hours=1):
@@ -1276,7 +1439,7 @@ class StrapiService:
             bool: 是否成功更新
         """
         try:
-            print(f"开始增量更新知识库（获取最近 {hours} 小时的更新）...")
+            logger.info(f"开始增量更新知识库（获取最近 {hours} 小时的更新）...")
             
             # 1. 获取最近更新的数据
             has_updates, update_file = self.fetch_and_save_updated_knowledge(  #返回新存的json文件路径
@@ -1285,14 +1448,14 @@ class StrapiService:
             )
             
             if not has_updates:
-                print("没有新的更新数据，无需更新向量数据库")
+                logger.info("没有新的更新数据，无需更新向量数据库")
                 return False
                 
             # 2. 更新向量数据库
             updated = self.update_chromadb_with_new_data(update_file)
             
             if updated:
-                print("✅ 知识库增量更新成功")
+                logger.info("✅ 知识库增量更新成功")
                 
                 # 3. 更新主知识库文件 (strapi_knowledge_parsed.json)
                 kb_updated_success = False # Flag to track if KB file update was successful
@@ -1300,12 +1463,12 @@ class StrapiService:
                     # 调用 update_knowledge_base_file 使用临时 update 文件更新主文件
                     kb_updated = self.update_knowledge_base_file(update_file) # <--- 更新主知识库文件
                     if kb_updated:
-                        print("✅ 主知识库文件已更新")
+                        logger.info("✅ 主知识库文件已更新")
                         kb_updated_success = True
                     else:
-                        print("⚠️ 主知识库文件更新失败")
+                        logger.warning("⚠️ 主知识库文件更新失败")
                 except Exception as e:
-                    print(f"⚠️ 更新主知识库文件失败: {str(e)}")
+                    logger.warning(f"⚠️ 更新主知识库文件失败: {str(e)}")
 
                 # 4. 如果主知识库文件更新成功，则重新生成并加载搜索提示
                 if kb_updated_success:
@@ -1313,26 +1476,26 @@ class StrapiService:
                         from app.services.hint_service import hint_service
                         # hint_service.refresh() # <--- 不再调用 refresh
                         if hint_service.generate_and_load_hints(): # <-- 调用 generate_and_load_hints
-                            print(f"✅ 已根据更新后的知识库重新生成并加载了 {len(hint_service.hint_list)} 条搜索提示。")
+                            logger.info(f"✅ 已根据更新后的知识库重新生成并加载了 {len(hint_service.hint_list)} 条搜索提示。")
                         else:
-                             print("❌ 重新生成搜索提示失败。")
+                             logger.error("❌ 重新生成搜索提示失败。")
                     except Exception as e:
-                        print(f"⚠️ 重新生成搜索提示列表失败: {str(e)}")
+                        logger.warning(f"⚠️ 重新生成搜索提示列表失败: {str(e)}")
                 else:
-                    print("ℹ️ 由于主知识库文件更新失败，跳过搜索提示生成步骤。")
+                    logger.info("ℹ️ 由于主知识库文件更新失败，跳过搜索提示生成步骤。")
             else:
-                print("❌ 知识库增量更新失败或无更新")
+                logger.error("❌ 知识库增量更新失败或无更新")
             
             # 5. 清理临时文件
             try:
                 delete_update_file(update_file, self.data_dir)
             except Exception as e:
-                print(f"⚠️ 删除临时文件时出错: {str(e)}")
+                logger.warning(f"⚠️ 删除临时文件时出错: {str(e)}")
             
             return updated
             
         except Exception as e:
-            print(f"❌ 增量更新知识库失败: {str(e)}")
+            logger.error(f"❌ 增量更新知识库失败: {str(e)}")
             return False
 
     def update_knowledge_base_file(self, new_data_file):
@@ -1346,37 +1509,37 @@ class StrapiService:
             bool: 是否成功更新
         """
         try:
-            print(f"🔄 开始更新主知识库文件...")
+            logger.info("🔄 开始更新主知识库文件...")
             
             # 主知识库文件路径
             main_knowledge_file = os.path.join(self.data_dir, "strapi_knowledge_parsed.json")
             
             # 检查主知识库文件是否存在
             if not os.path.exists(main_knowledge_file):
-                print(f"⚠️ 主知识库文件不存在: {main_knowledge_file}")
+                logger.warning(f"⚠️ 主知识库文件不存在: {main_knowledge_file}")
                 # 如果不存在，尝试从full文件解析
                 try:
                     full_file_path = os.path.join(self.data_dir, "strapi_knowledge_full.json")
                     if os.path.exists(full_file_path):
-                        print(f"尝试解析全量文件: {full_file_path}")
+                        logger.info(f"尝试解析全量文件: {full_file_path}")
                         self.parse_knowledge_json()
                     else:
-                        print(f"❌ 找不到全量知识库文件: {full_file_path}")
+                        logger.error(f"❌ 找不到全量知识库文件: {full_file_path}")
                         return False
                 except Exception as e:
-                    print(f"❌ 解析全量文件失败: {str(e)}")
+                    logger.error(f"❌ 解析全量文件失败: {str(e)}")
                     return False
             
             # 再次检查主知识库文件是否存在
             if not os.path.exists(main_knowledge_file):
-                print(f"❌ 无法创建主知识库文件")
+                logger.error("❌ 无法创建主知识库文件")
                 return False
         
             # 读取主知识库文件
             with open(main_knowledge_file, 'r', encoding='utf-8') as f:
                 main_data = json.load(f)
         
-            print(f"📚 从主知识库加载了 {len(main_data)} 条记录")
+            logger.info(f"📚 从主知识库加载了 {len(main_data)} 条记录")
         
             # 读取新增数据文件
             new_data_path = new_data_file if os.path.isabs(new_data_file) else os.path.join(self.data_dir, new_data_file)
@@ -1388,10 +1551,10 @@ class StrapiService:
             if 'data' in new_data_full and isinstance(new_data_full['data'], list):
                 new_items = new_data_full['data']
             else:
-                print(f"❌ 新增数据文件格式不正确")
+                logger.error("❌ 新增数据文件格式不正确")
                 return False
             
-            print(f"�� 从增量文件加载了 {len(new_items)} 条记录")
+            logger.info(f"�� 从增量文件加载了 {len(new_items)} 条记录")
         
             # 创建ID到数据的映射，便于快速查找和更新
             id_to_index = {}
@@ -1407,7 +1570,7 @@ class StrapiService:
                 item_id = str(item.get('id'))
                 
                 if not item_id:
-                    print(f"⚠️ 跳过没有ID的记录")
+                    logger.warning("⚠️ 跳过没有ID的记录")
                     continue
                 
                 # 转换数据格式
@@ -1433,14 +1596,14 @@ class StrapiService:
             # 保存更新后的主知识库文件
             with open(main_knowledge_file, 'w', encoding='utf-8') as f:
                 json.dump(main_data, f, ensure_ascii=False, indent=2)
+            knowledge_index_service.replace(main_data)
         
-            print(f"✅ 知识库文件更新成功: 更新 {updated_count} 条, 新增 {new_count} 条")
+            logger.info(f"✅ 知识库文件更新成功: 更新 {updated_count} 条, 新增 {new_count} 条")
+            self._bump_knowledge_version()
             return True
         
         except Exception as e:
-            print(f"❌ 更新知识库文件失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"❌ 更新知识库文件失败: {str(e)}")
             return False
 
     def submit_feedback(self, feedback_id, good_or_bad, session_history, session_id):
@@ -1471,13 +1634,13 @@ class StrapiService:
             url = f"{local_strapi_url}/{endpoint}"
             
             # 记录接收到的会话历史信息
-            print(f"\n📋 在strapi_service中收到的会话历史:")
-            print(f"类型: {type(session_history)}")
+            logger.debug("📋 在strapi_service中收到的会话历史:")
+            logger.debug(f"类型: {type(session_history)}")
             if isinstance(session_history, str):
-                print(f"已是JSON字符串，长度: {len(session_history)}")
+                logger.debug(f"已是JSON字符串，长度: {len(session_history)}")
                 session_history_str = session_history
             else:
-                print(f"Python对象，长度: {len(session_history) if hasattr(session_history, '__len__') else 'N/A'}")
+                logger.debug(f"Python对象，长度: {len(session_history) if hasattr(session_history, '__len__') else 'N/A'}")
                 session_history_str = json.dumps(session_history)
             
             # 构建反馈数据
@@ -1490,9 +1653,9 @@ class StrapiService:
                 }
             }
             
-            print(f"\n📤 提交反馈到本地Strapi: {url}")
-            print(f"反馈数据: {feedback_data}")
-            print(f"请求头: {local_headers}")
+            logger.debug(f"📤 提交反馈到本地Strapi: {url}")
+            logger.debug(f"反馈数据: {feedback_data}")
+            logger.debug(f"请求头: {local_headers}")
             
             # 发送POST请求到Strapi，使用本地认证令牌
             response = requests.post(
@@ -1503,8 +1666,8 @@ class StrapiService:
             )
             
             # 打印完整的响应内容以便调试
-            print(f"响应状态码: {response.status_code}")
-            print(f"响应内容: {response.text}")
+            logger.debug(f"响应状态码: {response.status_code}")
+            logger.debug(f"响应内容: {response.text}")
             
             # 检查响应状态
             response.raise_for_status()
@@ -1512,20 +1675,31 @@ class StrapiService:
             # 解析响应
             result = response.json()
             
-            print(f"✅ 反馈提交成功: {result}")
+            logger.info(f"✅ 反馈提交成功: {result}")
             return True, "反馈提交成功"
             
         except requests.exceptions.RequestException as e:
             error_message = f"提交反馈失败: {str(e)}"
             if hasattr(e, 'response') and e.response:
                 error_message += f" - 响应状态码: {e.response.status_code}, 响应内容: {e.response.text}"
-            print(f"❌ {error_message}")
+            logger.error(f"❌ {error_message}")
             return False, error_message
         except Exception as e:
             error_message = f"提交反馈失败: {str(e)}"
-            print(f"❌ {error_message}")
+            logger.error(f"❌ {error_message}")
             return False, error_message
 
+    def _bump_knowledge_version(self):
+        """
+        知识库数据变更后递增版本号，使回答缓存等依赖知识库的缓存失效
+        """
+        try:
+            version = redis_service.incr_knowledge_version()
+            if version is not None:
+                logger.info(f"🔖 知识库版本已更新为 {version}")
+        except Exception as e:
+            logger.warning(f"⚠️ 更新知识库版本失败: {str(e)}")
+
     def _get_embedding_function(self):
         """
         获取使用 OpenAI 的 embedding 函数
@@ -1533,7 +1707,7 @@ class StrapiService:
         Returns:
             callable: 用于嵌入的函数
         """
-        print("创建 OpenAI 嵌入函数...")
+        logger.info("创建 OpenAI 嵌入函数...")
         
         class OpenAIEmbeddingFunction:
             def __init__(self, parent):
@@ -1553,22 +1727,22 @@ class StrapiService:
                     try:
                         start_time = time.time()
                         response = self.openai_client.embeddings.create(
-                            model="text-embedding-ada-002",
+                            model=settings.EMBEDDING_MODEL,
                             input=batch,
                             timeout=5  # 减少超时时间到5秒
                         )
                         embeddings = [item.embedding for item in response.data]
                         processing_time = time.time() - start_time
-                        print(f"✅ 批次处理完成，耗时: {processing_time:.2f}秒")
+                        logger.info(f"✅ 批次处理完成，耗时: {processing_time:.2f}秒")
                         return embeddings
                     except Exception as e:
                         # 检查是否是超时错误
                         if "timeout" in str(e).lower() and retry < max_retries - 1:
                             wait_time = (retry + 1) * 5  # 逐步增加等待时间
-                            print(f"⚠️ 批次处理超时 (尝试 {retry+1}/{max_retries})，等待 {wait_time} 秒后重试...")
+                            logger.warning(f"⚠️ 批次处理超时 (尝试 {retry+1}/{max_retries})，等待 {wait_time} 秒后重试...")
                             time.sleep(wait_time)
                         else:
-                            print(f"❌ 批次处理失败: {str(e)}")
+                            logger.error(f"❌ 批次处理失败: {str(e)}")
                             # 返回零向量作为替代
                             return [[0.0] * 1536 for _ in batch]
                 return [[0.0] * 1536 for _ in batch]  # 所有重试都失败时返回零向量
@@ -1584,10 +1758,10 @@ class StrapiService:
                     list: 嵌入向量列表
                 """
                 if not input:
-                    print("没有输入文本，返回空列表")
+                    logger.info("没有输入文本，返回空列表")
                     return []
                     
-                print(f"使用 OpenAI API 生成 {len(input)} 个文本的嵌入向量...")
+                logger.info(f"使用 OpenAI API 生成 {len(input)} 个文本的嵌入向量...")
                 
                 # 批处理，尝试折中大小以平衡速度和稳定性
                 batch_size = 50  # 从100减少到50
@@ -1609,10 +1783,10 @@ class StrapiService:
                 # 过滤出需要处理的新文本
                 texts_to_process = list(unique_texts.keys())
                 if not texts_to_process:
-                    print("所有文本都在缓存中，无需调用API")
+                    logger.info("所有文本都在缓存中，无需调用API")
                     return all_embeddings
                 
-                print(f"去重后需要处理 {len(texts_to_process)} 个唯一文本")
+                logger.info(f"去重后需要处理 {len(texts_to_process)} 个唯一文本")
                 
                 try:
                     # 分批处理
@@ -1621,7 +1795,7 @@ class StrapiService:
                         batch = texts_to_process[i:i+batch_size]
                         batch_num = i//batch_size + 1
                         total_batches = (len(texts_to_process)-1)//batch_size + 1
-                        print(f"提交批次 {batch_num}/{total_batches}，文本数量：{len(batch)}")
+                        logger.info(f"提交批次 {batch_num}/{total_batches}，文本数量：{len(batch)}")
                         
                         # 并行提交处理任务
                         future = self.executor.submit(self.process_batch, batch)
@@ -1639,7 +1813,7 @@ class StrapiService:
                                 for idx in unique_texts[text]:
                                     all_embeddings[idx] = embedding
                         except Exception as e:
-                            print(f"获取批次结果失败: {str(e)}")
+                            logger.warning(f"获取批次结果失败: {str(e)}")
                             # 对失败的批次使用零向量
                             for text in batch:
                                 zero_vector = [0.0] * 1536
@@ -1650,19 +1824,19 @@ class StrapiService:
                     # 确保所有嵌入都已生成
                     for i, embedding in enumerate(all_embeddings):
                         if embedding is None:
-                            print(f"警告: 索引 {i} 的嵌入未生成，使用零向量")
+                            logger.warning(f"警告: 索引 {i} 的嵌入未生成，使用零向量")
                             all_embeddings[i] = [0.0] * 1536
                     
-                    print(f"✅ 成功生成 {len(all_embeddings)} 个嵌入向量")
+                    logger.info(f"✅ 成功生成 {len(all_embeddings)} 个嵌入向量")
                     return all_embeddings
                     
                 except Exception as e:
-                    print(f"❌ 嵌入生成过程失败: {str(e)}")
-                    print("返回零向量作为备选方案")
+                    logger.error(f"❌ 嵌入生成过程失败: {str(e)}")
+                    logger.warning("返回零向量作为备选方案")
                     # 出错时返回零向量作为备选方案
                     return [[0.0] * 1536 for _ in input]
         
-        print("✅ 成功创建 OpenAI 嵌入函数")
+        logger.info("✅ 成功创建 OpenAI 嵌入函数")
         return OpenAIEmbeddingFunction(self)
 
     def clear_chromadb(self):
@@ -1673,41 +1847,42 @@ class StrapiService:
             bool: 是否成功清空
         """
         try:
-            print("\n🗑️ 开始清空 ChromaDB 中的所有数据...")
+            logger.info("🗑️ 开始清空 ChromaDB 中的所有数据...")
+            self._invalidate_collection_cache()
             
             # 1. 首先通过API删除所有集合
             collections = self.chroma_client.list_collections()
             
             if collections:
-                print(f"📊 发现 {len(collections)} 个集合: {[col.name for col in collections]}")
+                logger.info(f"📊 发现 {len(collections)} 个集合: {[col.name for col in collections]}")
                 
                 for collection in collections:
                     collection_name = collection.name
-                    print(f"🗑️ 删除集合 '{collection_name}'...")
+                    logger.info(f"🗑️ 删除集合 '{collection_name}'...")
                     
                     try:
                         self.chroma_client.delete_collection(collection_name)
-                        print(f"✅ 成功删除集合 '{collection_name}'")
+                        logger.info(f"✅ 成功删除集合 '{collection_name}'")
                     except Exception as e:
-                        print(f"⚠️ 删除集合 '{collection_name}' 出现警告: {str(e)}")
+                        logger.warning(f"⚠️ 删除集合 '{collection_name}' 出现警告: {str(e)}")
             else:
-                print("ℹ️ ChromaDB 中没有集合")
+                logger.info("ℹ️ ChromaDB 中没有集合")
             
             # 2. 使用reset方法重置数据库，而不是直接删除文件
-            print("📤 重置 ChromaDB 数据库...")
+            logger.info("📤 重置 ChromaDB 数据库...")
             try:
                 # 尝试使用reset API
                 self.chroma_client.reset()
-                print("✅ 成功使用API重置ChromaDB")
+                logger.info("✅ 成功使用API重置ChromaDB")
             except Exception as e:
-                print(f"⚠️ 重置API失败，将尝试手动清理: {str(e)}")
+                logger.warning(f"⚠️ 重置API失败，将尝试手动清理: {str(e)}")
                 
             # 3. 关闭客户端连接
-            print("📤 关闭 ChromaDB 客户端连接...")
+            logger.info("📤 关闭 ChromaDB 客户端连接...")
             del self.chroma_client
             
             # 4. 只删除UUID目录，保留sqlite数据库文件
-            print("🧹 清理 ChromaDB 向量存储目录...")
+            logger.info("🧹 清理 ChromaDB 向量存储目录...")
             
             if os.path.exists(self.chroma_db_path):
                 for item in os.listdir(self.chroma_db_path):
@@ -1716,18 +1891,18 @@ class StrapiService:
                         # 只删除目录，保留sqlite文件
                         if os.path.isdir(item_path):
                             shutil.rmtree(item_path)
-                            print(f"  ✓ 删除目录: {item}")
+                            logger.info(f"  ✓ 删除目录: {item}")
                         # 不删除sqlite文件
                         elif item != "chroma.sqlite3":
                             os.unlink(item_path)
-                            print(f"  ✓ 删除文件: {item}")
+                            logger.info(f"  ✓ 删除文件: {item}")
                         else:
-                            print(f"  ⚠️ 保留数据库文件: {item}")
+                            logger.warning(f"  ⚠️ 保留数据库文件: {item}")
                     except Exception as e:
-                        print(f"  ✗ 无法删除 {item}: {str(e)}")
+                        logger.warning(f"  ✗ 无法删除 {item}: {str(e)}")
                 
                 # 5. 确保目录权限正确
-                print("🔒 设置正确的目录权限...")
+                logger.info("🔒 设置正确的目录权限...")
                 os.chmod(self.chroma_db_path, 0o777)
                 sqlite_path = os.path.join(self.chroma_db_path, "chroma.sqlite3")
                 if os.path.exists(sqlite_path):
@@ -1737,7 +1912,7 @@ class StrapiService:
                 time.sleep(1)
             
             # 6. 重新初始化客户端
-            print("🔄 重新初始化 ChromaDB 客户端...")
+            logger.info("🔄 重新初始化 ChromaDB 客户端...")
             self.chroma_client = chromadb.PersistentClient(
                 path=self.chroma_db_path,
                 settings=Settings(
@@ -1748,17 +1923,16 @@ class StrapiService:
                 )
             )
             
-            print("✅ 成功清空 ChromaDB 数据")
+            logger.info("✅ 成功清空 ChromaDB 数据")
+            self._bump_knowledge_version()
             return True
             
         except Exception as e:
-            print(f"❌ 清空 ChromaDB 失败: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception(f"❌ 清空 ChromaDB 失败: {str(e)}")
             
             # 尝试重新初始化客户端
             try:
-                print("🔄 尝试重新初始化 ChromaDB 客户端...")
+                logger.info("🔄 尝试重新初始化 ChromaDB 客户端...")
                 time.sleep(2)  # 等待2秒
                 self.chroma_client = chromadb.PersistentClient(
                     path=self.chroma_db_path,
@@ -1769,9 +1943,9 @@ class StrapiService:
                         is_persistent=True
                     )
                 )
-                print("✅ 重新初始化 ChromaDB 客户端成功")
+                logger.info("✅ 重新初始化 ChromaDB 客户端成功")
             except Exception as e2:
-                print(f"❌ 重新初始化 ChromaDB 客户端失败: {str(e2)}")
+                logger.error(f"❌ 重新初始化 ChromaDB 客户端失败: {str(e2)}")
             
             return False
 
@@ -0,0 +1,186 @@
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set
+from app.core.config import settings
+from app.services.metrics_service import metrics_service
+
+logger = logging.getLogger(__name__)
+
+class StrapiWriterService:
+    """
+    会话历史写入 Strapi 的合并写入队列（write-behind）
+
+    每轮对话只把会话标记为待写入；同一会话在静默期（STRAPI_WRITE_QUIET_PERIOD）内没有新的对话，
+    或距首次标记已超过 STRAPI_WRITE_MAX_DELAY 时，才把当时的完整历史写入 Strapi 一次。
+    同时进行的写入不超过 STRAPI_WRITE_CONCURRENCY 个，同一会话不会并发写入。
+    写入失败时重新排队（最多 STRAPI_WRITE_MAX_RETRIES 次），应用关闭时立即写入所有待写入的会话。
+    """
+
+    def __init__(self):
+        self.quiet_period = settings.STRAPI_WRITE_QUIET_PERIOD
+        self.max_delay = max(settings.STRAPI_WRITE_MAX_DELAY, self.quiet_period)
+        self.concurrency = max(1, settings.STRAPI_WRITE_CONCURRENCY)
+        self.max_retries = settings.STRAPI_WRITE_MAX_RETRIES
+        # session_id -> {"first_at", "last_at", "attempts", "since": 最早未保存的变更时间（重试时保留）}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._inflight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.scheduled = 0
+        self.coalesced = 0
+        self.flushed = 0
+        self.retried = 0
+        self.failed = 0
+
+    def schedule(self, session_id: str) -> None:
+        """
+        标记会话需要写入 Strapi（在追加会话历史之后调用）
+
+        Args:
+            session_id (str): 会话 ID
+        """
+        now = time.monotonic()
+        self.scheduled += 1
+        entry = self._pending.get(session_id)
+        if entry is not None:
+            # 已在等待中：推迟静默期，首次标记时间不变，最长等待不超过 max_delay
+            entry["last_at"] = now
+            self.coalesced += 1
+            return
+        self._pending[session_id] = {"first_at": now, "last_at": now, "attempts": 0, "since": now}
+        if not self._closing:
+            # 关闭过程中加入的会话由 flush_all 写入
+            self._ensure_runner()
+            self._wakeup.set()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # 在事件循环中首次使用时创建
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def _ensure_runner(self) -> None:
+        if self._runner_task is None or self._runner_task.done():
+            self._wakeup = asyncio.Event()
+            self._runner_task = asyncio.get_running_loop().create_task(self._run())
+
+    def _due_at(self, entry: Dict[str, Any]) -> float:
+        return min(entry["last_at"] + self.quiet_period, entry["first_at"] + self.max_delay)
+
+    async def _run(self) -> None:
+        """按到期时间启动写入，并休眠到下一个会话到期或有新会话加入"""
+        while True:
+            now = time.monotonic()
+            next_due = None
+            for session_id, entry in list(self._pending.items()):
+                if session_id in self._inflight:
+                    continue
+                due_at = self._due_at(entry)
+                if due_at <= now:
+                    self._start(session_id)
+                elif next_due is None or due_at < next_due:
+                    next_due = due_at
+
+            self._wakeup.clear()
+            try:
+                timeout = None if next_due is None else next_due - now
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, session_id: str) -> None:
+        entry = self._pending.pop(session_id)
+        self._inflight.add(session_id)
+        task = asyncio.get_running_loop().create_task(self._flush(session_id, entry))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, session_id: str, entry: Dict[str, Any]) -> None:
+        # 延迟导入，避免与 openai_service 形成循环导入
+        from app.services.openai_service import openai_service
+
+        try:
+            async with self._get_semaphore():
+                saved = await openai_service.save_conversation_to_strapi(session_id)
+        finally:
+            self._inflight.discard(session_id)
+
+        if saved:
+            self.flushed += 1
+            metrics_service.record_strapi_write_lag(time.monotonic() - entry["since"])
+        elif session_id in self._pending:
+            # 写入期间又有新的对话，失败的内容随下一次写入一起保存
+            self._pending[session_id]["since"] = entry["since"]
+        elif entry["attempts"] < self.max_retries:
+            # 等待一个静默期后重试
+            now = time.monotonic()
+            self._pending[session_id] = {
+                "first_at": now, "last_at": now, "attempts": entry["attempts"] + 1, "since": entry["since"]
+            }
+            self.retried += 1
+        else:
+            self.failed += 1
+            logger.error(f"❌ 会话写入Strapi失败{entry['attempts'] + 1}次，已放弃: session_id={session_id}")
+
+        # 写入期间同一会话有新的对话时，需要重新计算到期时间
+        if self._wakeup is not None and session_id in self._pending:
+            self._wakeup.set()
+
+    async def flush_all(self) -> None:
+        """立即写入所有待写入的会话，并等待进行中的写入完成（不重试失败的写入）"""
+        retries = self.max_retries
+        self.max_retries = 0
+        try:
+            while self._pending or self._tasks:
+                for session_id in list(self._pending):
+                    if session_id not in self._inflight:
+                        self._start(session_id)
+                if self._tasks:
+                    await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        finally:
+            self.max_retries = retries
+
+    async def shutdown(self) -> None:
+        """停止定时写入并在 STRAPI_WRITE_SHUTDOWN_TIMEOUT 秒内写入所有待写入的会话，由 app.main.lifespan 调用"""
+        self._closing = True
+        if self._runner_task is not None:
+            self._runner_task.cancel()
+            try:
+                await self._runner_task
+            except asyncio.CancelledError:
+                pass
+            self._runner_task = None
+
+        count = len(self._pending) + len(self._inflight)
+        if count:
+            logger.info(f"💾 应用关闭前写入 {count} 个会话到Strapi...")
+        try:
+            await asyncio.wait_for(self.flush_all(), settings.STRAPI_WRITE_SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"❌ 关闭前写入Strapi超时，{len(self._pending) + len(self._inflight)} 个会话未保存")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取写入队列统计信息：队列深度、最长等待时间和合并情况"""
+        now = time.monotonic()
+        oldest = min((entry["since"] for entry in self._pending.values()), default=None)
+        return {
+            "quiet_period": self.quiet_period,
+            "max_delay": self.max_delay,
+            "concurrency": self.concurrency,
+            "pending": len(self._pending),
+            "inflight": len(self._inflight),
+            "queue_depth": len(self._pending) + len(self._inflight),
+            "oldest_pending_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+            "scheduled": self.scheduled,
+            "coalesced": self.coalesced,
+            "flushed": self.flushed,
+            "retried": self.retried,
+            "failed": self.failed
+        }
+
+# 创建 Strapi 会话写入队列实例
+strapi_writer_service = StrapiWriterService()
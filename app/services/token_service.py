@@ -0,0 +1,96 @@
+import logging
+import math
+from typing import Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class TokenService:
+    def __init__(self, encoding_name: Optional[str] = None):
+        """
+        初始化令牌计数服务
+        
+        优先使用 tiktoken 精确计数；未安装或编码文件不可用时，按字符估算
+        （中日韩字符约 1 个令牌，其他字符约 4 个一个令牌）。
+        """
+        self.encoding_name = encoding_name or settings.PROMPT_TOKEN_ENCODING
+        self._encoding = None
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            logger.warning(f"⚠️ tiktoken 不可用，使用字符估算令牌数: {str(e)}")
+    
+    @property
+    def is_exact(self) -> bool:
+        """是否使用精确的分词器计数"""
+        return self._encoding is not None
+    
+    @staticmethod
+    def _is_cjk(char: str) -> bool:
+        code = ord(char)
+        return (
+            0x4E00 <= code <= 0x9FFF or    # 中日韩统一表意文字
+            0x3400 <= code <= 0x4DBF or    # 扩展A
+            0x3000 <= code <= 0x303F or    # 中日韩符号和标点
+            0xFF00 <= code <= 0xFFEF or    # 全角字符
+            0x3040 <= code <= 0x30FF or    # 日文假名
+            0xAC00 <= code <= 0xD7AF       # 韩文
+        )
+    
+    def _estimate(self, text: str) -> int:
+        cjk = sum(1 for char in text if self._is_cjk(char))
+        return cjk + math.ceil((len(text) - cjk) / 4)
+    
+    def count(self, text: str) -> int:
+        """
+        计算文本的令牌数
+        
+        Args:
+            text (str): 文本
+            
+        Returns:
+            int: 令牌数
+        """
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return self._estimate(text)
+    
+    def truncate(self, text: str, max_tokens: int, suffix: str = "…") -> str:
+        """
+        将文本截断到不超过 max_tokens 个令牌（包含省略后缀）
+        
+        Args:
+            text (str): 文本
+            max_tokens (int): 令牌上限
+            suffix (str): 被截断时追加的后缀
+            
+        Returns:
+            str: 截断后的文本，未超限时原样返回
+        """
+        if not text or max_tokens <= 0:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        
+        limit = max_tokens - self.count(suffix)
+        if limit <= 0:
+            return ""
+        
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text)
+            return self._encoding.decode(tokens[:limit]) + suffix
+        
+        # 按估算规则逐字累加，非中日韩字符每 4 个计 1 个令牌
+        used = 0.0
+        end = 0
+        for end, char in enumerate(text):
+            used += 1 if self._is_cjk(char) else 0.25
+            if math.ceil(used) > limit:
+                break
+        return text[:end] + suffix
+
+# 创建令牌计数服务实例
+token_service = TokenService()
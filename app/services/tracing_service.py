@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import uuid
+import queue
+import inspect
+import logging
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 当前正在执行的 span；asyncio.create_task 和 executor_service.run 都会复制上下文，
+# 因此后台任务和线程池中的调用会自动挂在发起它们的请求之下
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_time", "duration", "attributes", "status", "error",
+                 "_start")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self) -> None:
+        """结束计时（只有第一次调用生效），span 在离开 tracing_service.span 时导出"""
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+class SpanExporter:
+    """span 导出器接口：span 结束时调用 export，应用关闭时调用 shutdown"""
+
+    def export(self, span: Span) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+class InMemoryExporter(SpanExporter):
+    """把结束的 span 保存在内存中，用于测试和本地排查"""
+
+    def __init__(self, max_spans: int = 10000):
+        self.max_spans = max_spans
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+            if len(self._spans) > self.max_spans:
+                del self._spans[:len(self._spans) - self.max_spans]
+
+    def get_finished_spans(self, trace_id: Optional[str] = None) -> List[Span]:
+        with self._lock:
+            return [s for s in self._spans if trace_id is None or s.trace_id == trace_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+class JsonLinesExporter(SpanExporter):
+    """每个 span 写成文件中的一行 JSON；写文件在后台线程中进行，不阻塞请求"""
+
+    def __init__(self, path: str, max_queue: int = 10000):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        try:
+            self._queue.put_nowait(span.to_dict())
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                f.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+                # 队列暂时清空时才刷盘，批量写入
+                if self._queue.empty():
+                    f.flush()
+
+    def shutdown(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+class TracingService:
+    def __init__(self):
+        """初始化链路追踪：按 TRACING_EXPORTER 选择导出器（jsonl / memory / none），没有导出器时不创建 span"""
+        self.exporter = self._create_exporter(settings.TRACING_EXPORTER) if settings.TRACING_ENABLED else None
+        self.enabled = self.exporter is not None
+        if settings.TRACING_ENABLED and not self.enabled:
+            logger.warning("⚠️ TRACING_ENABLED=true 但未配置导出器 (TRACING_EXPORTER=none)，链路追踪已关闭")
+
+    def _create_exporter(self, name: str) -> Optional[SpanExporter]:
+        name = (name or "none").lower()
+        if name == "jsonl":
+            logger.info(f"🧭 链路追踪已启用，span 写入 {settings.TRACING_FILE}")
+            return JsonLinesExporter(settings.TRACING_FILE)
+        if name == "memory":
+            return InMemoryExporter()
+        return None
+
+    def set_exporter(self, exporter: Optional[SpanExporter]) -> None:
+        """替换导出器（例如测试中使用 InMemoryExporter），导出器为 None 时关闭追踪"""
+        if self.exporter is not None and self.exporter is not exporter:
+            self.exporter.shutdown()
+        self.exporter = exporter
+        self.enabled = exporter is not None
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        return _current_span.get()
+
+    @staticmethod
+    def current_trace_id() -> Optional[str]:
+        span = _current_span.get()
+        return span.trace_id if span else None
+
+    @contextmanager
+    def span(self, name: str, trace_id: Optional[str] = None, **attributes) -> Iterator[Optional[Span]]:
+        """
+        开始一个 span：有当前 span 时作为其子 span，否则开始新的追踪
+
+        Args:
+            name (str): span 名称，如 rag.build_context、llm.upstream
+            trace_id (Optional[str]): 新追踪使用的 trace id（例如来自请求头），仅在没有当前 span 时生效
+            **attributes: span 属性
+
+        Yields:
+            Optional[Span]: 当前 span，追踪关闭时为 None
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        parent = _current_span.get()
+        span = Span(
+            name,
+            trace_id=parent.trace_id if parent else (trace_id or uuid.uuid4().hex),
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes
+        )
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.status = "error"
+            span.error = f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            span.end()
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # 异步生成器可能在其他上下文中被关闭
+                _current_span.set(parent)
+            if self.exporter is not None:
+                self.exporter.export(span)
+
+    def traced(self, name: str) -> Callable:
+        """
+        装饰器：为同步或异步函数的每次调用创建一个 span
+
+        Args:
+            name (str): span 名称
+        """
+        def decorator(func: Callable) -> Callable:
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def shutdown(self) -> None:
+        """关闭导出器，写出剩余的 span"""
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+# 创建链路追踪服务实例
+tracing_service = TracingService()
@@ -0,0 +1,65 @@
+import os
+import pytest
+
+# app.core.config 在导入时读取环境变量，测试中不需要真实的上游凭据
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ.setdefault("OPENAI_API_URL", "http://llm.test/v1/chat/completions")
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """把 redis_service 的同步和异步客户端替换为共用同一个 FakeServer 的 fakeredis 客户端"""
+    fakeredis = pytest.importorskip("fakeredis")
+    from app.services.redis_service import redis_service
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis_service, "redis_client", fakeredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(redis_service, "binary_client", fakeredis.FakeRedis(server=server))
+    monkeypatch.setattr(redis_service, "_async_client", fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(redis_service, "_async_binary_client", fakeredis.aioredis.FakeRedis(server=server))
+    yield server
+
+class FakeStrapi:
+    """内存中的 Strapi ai-support-sessions 接口，记录收到的请求"""
+
+    def __init__(self):
+        self.records = {}
+        self.requests = []
+        self._next_id = 1
+
+    def handler(self, request):
+        import json
+        import httpx
+
+        self.requests.append((request.method, request.url.path))
+        parts = request.url.path.rstrip("/").split("/")
+        if parts[-1] == "ai-support-sessions":
+            if request.method == "GET":
+                session_id = request.url.params.get("filters[session_id][$eq]")
+                data = [
+                    {"id": record_id, "attributes": {"session_id": record["session_id"]}}
+                    for record_id, record in self.records.items() if record["session_id"] == session_id
+                ]
+                return httpx.Response(200, json={"data": data})
+            record_id = self._next_id
+            self._next_id += 1
+            self.records[record_id] = json.loads(request.content)["data"]
+            return httpx.Response(200, json={"data": {"id": record_id, "attributes": self.records[record_id]}})
+
+        record_id = int(parts[-1])
+        if record_id not in self.records:
+            return httpx.Response(404, json={"error": {"status": 404}})
+        if request.method == "PUT":
+            self.records[record_id] = json.loads(request.content)["data"]
+        return httpx.Response(200, json={"data": {"id": record_id, "attributes": self.records[record_id]}})
+
+@pytest.fixture
+def fake_strapi(monkeypatch):
+    """把共享的 Strapi 客户端替换为指向 FakeStrapi 的 httpx.MockTransport 客户端"""
+    import httpx
+    from app.services.http_client_service import http_client_service
+    from app.services.openai_service import openai_service
+
+    strapi = FakeStrapi()
+    monkeypatch.setattr(openai_service, "strapi_url", "http://strapi.test")
+    monkeypatch.setattr(http_client_service, "_strapi_client", httpx.AsyncClient(transport=httpx.MockTransport(strapi.handler)))
+    return strapi
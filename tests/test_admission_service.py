@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.routes import router
+from app.core.config import settings
+from app.services.admission_service import AdmissionController, OverloadedError
+from app.services.openai_service import openai_service
+
+async def hold(controller, release):
+    async with controller.slot():
+        await release.wait()
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected_with_429():
+    controller = AdmissionController("LLM", max_concurrency=1, max_queue=1, queue_timeout=1.0)
+    release = asyncio.Event()
+    holders = [asyncio.ensure_future(hold(controller, release)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(OverloadedError) as info:
+        async with controller.slot():
+            pass
+
+    assert info.value.status_code == 429
+    assert info.value.retry_after >= settings.LLM_RETRY_AFTER
+    stats = controller.get_stats()
+    assert (stats["active"], stats["queue_depth"], stats["rejected"]) == (1, 1, 1)
+
+    release.set()
+    await asyncio.gather(*holders)
+    assert controller.get_stats()["admitted"] == 2
+
+@pytest.mark.asyncio
+async def test_queue_timeout_is_rejected_with_503():
+    controller = AdmissionController("LLM", max_concurrency=1, max_queue=5, queue_timeout=0.02)
+    release = asyncio.Event()
+    holder = asyncio.ensure_future(hold(controller, release))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(OverloadedError) as info:
+        async with controller.slot():
+            pass
+
+    assert info.value.status_code == 503
+    assert controller.get_stats()["timed_out"] == 1
+    assert controller.get_stats()["queue_depth"] == 0
+    release.set()
+    await holder
+
+@pytest.mark.asyncio
+async def test_concurrency_is_capped():
+    controller = AdmissionController("LLM", max_concurrency=2, max_queue=10, queue_timeout=1.0)
+    active = []
+
+    async def call():
+        async with controller.slot():
+            active.append(controller.active)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*[call() for _ in range(6)])
+
+    assert max(active) == 2
+    assert controller.get_stats()["max_wait_seconds"] > 0
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+def overloaded():
+    return OverloadedError("LLM 当前请求过多，请稍后重试", status_code=429, retry_after=7)
+
+def test_chat_returns_retry_after_when_overloaded(client, monkeypatch):
+    async def generate(session_id, query):
+        raise overloaded()
+
+    monkeypatch.setattr(openai_service, "generate_rag_response", generate)
+
+    response = client.post("/chat", json={"session_id": "s1", "query": "如何修改密码"})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+
+def test_stream_returns_status_before_headers_when_overloaded(client, monkeypatch):
+    async def stream(session_id, query):
+        raise OverloadedError("LLM 排队超时，请稍后重试", status_code=503, retry_after=3)
+        yield
+
+    monkeypatch.setattr(openai_service, "generate_rag_response_stream", stream)
+
+    response = client.post("/chat/stream", json={"session_id": "s1", "query": "如何修改密码"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
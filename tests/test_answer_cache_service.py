@@ -0,0 +1,50 @@
+import pytest
+from app.core.config import settings
+from app.services.redis_service import redis_service
+from app.services.answer_cache_service import AnswerCacheService
+
+@pytest.fixture
+def cache(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "KB_VERSION_REFRESH_SECONDS", 0.0)
+    cache = AnswerCacheService()
+    cache.enabled = True
+    return cache
+
+def test_normalize_query_ignores_width_case_spacing_and_trailing_punctuation():
+    cache = AnswerCacheService()
+
+    assert cache.normalize_query("  如何  修改ＰＡＳＳＷＯＲＤ？？ ") == "如何 修改password"
+    assert cache.normalize_query("如何修改密码!") == cache.normalize_query("如何修改密码")
+
+@pytest.mark.asyncio
+async def test_answer_is_cached_per_normalized_query_and_ordered_faq_ids(cache):
+    await cache.set("如何修改密码？", ["12", "34"], {"content": "在设置页修改", "model": "m"})
+
+    assert (await cache.get(" 如何修改密码", ["12", "34"]))["content"] == "在设置页修改"
+    # 检索结果不同（或顺序不同）时视为不同的问题
+    assert await cache.get("如何修改密码", ["34", "12"]) is None
+    assert await cache.get("如何修改密码", []) is None
+    assert cache.get_stats()["hits"] == 1 and cache.get_stats()["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_knowledge_update_invalidates_cached_answers(cache):
+    await cache.set("如何修改密码", ["12"], {"content": "旧回答"})
+
+    redis_service.incr_knowledge_version()
+
+    assert await cache.get("如何修改密码", ["12"]) is None
+
+@pytest.mark.asyncio
+async def test_error_responses_are_not_cached(cache):
+    await cache.set("如何修改密码", ["12"], {"content": "抱歉，请求出错", "error": True})
+
+    assert await cache.get("如何修改密码", ["12"]) is None
+
+@pytest.mark.asyncio
+async def test_coalescing_key_follows_knowledge_version(cache):
+    before = await cache.coalescing_key_async("如何修改密码")
+
+    redis_service.incr_knowledge_version()
+
+    # 知识库更新后的检索不会合并到旧版本的进行中检索上
+    assert await cache.coalescing_key_async("如何修改密码") != before
@@ -0,0 +1,86 @@
+import json
+import asyncio
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.routes import router
+from app.core.config import settings
+from app.services.admission_service import OverloadedError
+from app.services.openai_service import openai_service
+
+def empty_retrieval(query):
+    return {"knowledge": "", "faq_ids": [], "faq_scores": [], "faq_details": []}
+
+@pytest.fixture
+def answers(monkeypatch):
+    """按问题中的秒数延迟回答，记录调用次数和最大并发数"""
+    state = {"calls": [], "active": 0, "peak": 0}
+
+    async def answer_from_context(context):
+        state["calls"].append(context["query"])
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        try:
+            query = context["query"]
+            if query == "过载":
+                raise OverloadedError("LLM 当前请求过多，请稍后重试", status_code=429, retry_after=1)
+            await asyncio.sleep(float(query.split()[-1]))
+            return {"content": f"回答: {query}", "source": "llm"}
+        finally:
+            state["active"] -= 1
+
+    monkeypatch.setattr(openai_service.rag_service, "retrieve_knowledge_batch", lambda queries: [empty_retrieval(q) for q in queries])
+    monkeypatch.setattr(openai_service, "answer_from_context", answer_from_context)
+    return state
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+def lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+def test_results_stream_in_completion_order_with_indices(client, answers):
+    queries = ["慢 0.1", "快 0.01", "中 0.05"]
+
+    response = client.post("/chat/batch", json={"queries": queries, "concurrency": 3})
+
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    results = lines(response)
+    assert [r["index"] for r in results] == [1, 2, 0]
+    assert all(r["query"] == queries[r["index"]] and r["content"] == f"回答: {r['query']}" for r in results)
+
+def test_duplicate_queries_are_answered_once(client, answers):
+    response = client.post("/chat/batch", json={"queries": ["如何改密码 0", "如何改密码 0！", "其他 0"]})
+
+    results = lines(response)
+    assert sorted(r["index"] for r in results) == [0, 1, 2]
+    # 归一化后相同的问题共享同一个回答
+    assert sorted(answers["calls"]) == sorted(["如何改密码 0", "其他 0"])
+    assert {r["content"] for r in results if r["index"] < 2} == {"回答: 如何改密码 0"}
+
+def test_concurrency_is_capped(client, answers, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_CONCURRENCY", 4)
+
+    client.post("/chat/batch", json={"queries": [f"问题{i} 0.02" for i in range(8)], "concurrency": 2})
+    assert answers["peak"] == 2
+
+    answers["peak"] = 0
+    # 请求的并发数不能超过 BATCH_CONCURRENCY
+    client.post("/chat/batch", json={"queries": [f"问题{i} 0.02" for i in range(8)], "concurrency": 100})
+    assert answers["peak"] == 4
+
+def test_overloaded_item_is_reported_without_failing_the_batch(client, answers):
+    results = lines(client.post("/chat/batch", json={"queries": ["过载", "正常 0"]}))
+
+    by_index = {r["index"]: r for r in results}
+    assert by_index[0]["error"] is True
+    assert by_index[1]["error"] is False
+
+def test_batch_size_is_validated(client, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_QUERIES", 2)
+
+    assert client.post("/chat/batch", json={"queries": []}).status_code == 400
+    assert client.post("/chat/batch", json={"queries": ["a", "b", "c"]}).status_code == 413
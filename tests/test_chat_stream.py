@@ -0,0 +1,84 @@
+import json
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.routes import router
+from app.services.http_client_service import http_client_service
+from app.services.openai_service import openai_service
+
+def sse_events(text):
+    """把 SSE 响应体解析为 (event, data) 列表"""
+    events = []
+    for block in text.strip().split("\n\n"):
+        event, data = None, None
+        for line in block.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+@pytest.fixture
+def client(monkeypatch):
+    persisted = []
+    monkeypatch.setattr(openai_service, "schedule_persist", lambda **turn: persisted.append(turn))
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    client.persisted = persisted
+    return client
+
+def test_stream_sends_chunks_then_done_and_persists_full_answer(client, monkeypatch):
+    async def stream(session_id, query):
+        for chunk in ["请在", "设置页", "修改密码"]:
+            yield chunk
+
+    monkeypatch.setattr(openai_service, "generate_rag_response_stream", stream)
+
+    response = client.post("/chat/stream", json={"session_id": "s1", "query": "如何修改密码"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert sse_events(response.text) == [
+        (None, {"content": "请在"}),
+        (None, {"content": "设置页"}),
+        (None, {"content": "修改密码"}),
+        ("done", {"session_id": "s1"})
+    ]
+    assert client.persisted == [{"session_id": "s1", "query": "如何修改密码", "response": "请在设置页修改密码"}]
+
+def test_stream_error_after_first_chunk_sends_error_event(client, monkeypatch):
+    async def stream(session_id, query):
+        yield "请在"
+        raise RuntimeError("上游断开")
+
+    monkeypatch.setattr(openai_service, "generate_rag_response_stream", stream)
+
+    response = client.post("/chat/stream", json={"session_id": "s1", "query": "如何修改密码"})
+
+    assert sse_events(response.text) == [(None, {"content": "请在"}), ("error", {"detail": "上游断开"})]
+    # 未完整输出的回答不写入会话历史
+    assert client.persisted == []
+
+@pytest.mark.asyncio
+async def test_upstream_deltas_are_forwarded_as_they_arrive(monkeypatch):
+    lines = [
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}',
+        'data: {"choices": [{"delta": {"content": "你好"}}]}',
+        ": keep-alive",
+        "data: not-json",
+        'data: {"choices": [{"delta": {"content": "，世界"}}]}',
+        "data: [DONE]",
+        'data: {"choices": [{"delta": {"content": "不应输出"}}]}'
+    ]
+
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        return httpx.Response(200, text="\n".join(lines) + "\n")
+
+    monkeypatch.setattr(http_client_service, "_openai_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    chunks = [chunk async for chunk in openai_service.generate_response_stream([{"role": "user", "content": "hi"}])]
+
+    assert chunks == ["你好", "，世界"]
@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+class Unavailable(Exception):
+    pass
+
+def make_breaker(threshold=2, cooldown=60.0):
+    return CircuitBreaker("test", failure_threshold=threshold, cooldown=cooldown, timeout=0.5,
+                          failure_types=(Unavailable,))
+
+async def fail():
+    raise Unavailable("down")
+
+async def ok():
+    return "ok"
+
+async def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(Unavailable):
+            await breaker.call(fail)
+
+@pytest.mark.asyncio
+async def test_opens_after_consecutive_failures():
+    breaker = make_breaker(threshold=2)
+
+    with pytest.raises(Unavailable):
+        await breaker.call(fail)
+    assert breaker.state == breaker.CLOSED
+    with pytest.raises(Unavailable):
+        await breaker.call(fail)
+
+    assert breaker.state == breaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(ok)
+    assert breaker.rejected == 1
+
+@pytest.mark.asyncio
+async def test_other_errors_do_not_count_as_failures():
+    breaker = make_breaker(threshold=1)
+
+    async def wrong_type():
+        raise ValueError("WRONGTYPE")
+
+    with pytest.raises(ValueError):
+        await breaker.call(wrong_type)
+    assert breaker.state == breaker.CLOSED
+
+@pytest.mark.asyncio
+async def test_timeout_counts_as_failure():
+    breaker = make_breaker(threshold=1)
+    breaker.timeout = 0.01
+
+    with pytest.raises(asyncio.TimeoutError):
+        await breaker.call(asyncio.sleep, 1)
+    assert breaker.state == breaker.OPEN
+
+@pytest.mark.asyncio
+async def test_half_open_trial_success_closes_and_notifies():
+    breaker = make_breaker(cooldown=0.0)
+    recovered = []
+    breaker.on_recovery(lambda: recovered.append(True))
+    await open_breaker(breaker)
+
+    assert await breaker.call(ok) == "ok"
+
+    assert breaker.state == breaker.CLOSED
+    assert recovered == [True]
+
+@pytest.mark.asyncio
+async def test_half_open_trial_failure_reopens():
+    breaker = make_breaker(cooldown=0.0)
+    await open_breaker(breaker)
+    opens = breaker.opens
+
+    with pytest.raises(Unavailable):
+        await breaker.call(fail)
+
+    assert breaker.state == breaker.OPEN
+    assert breaker.opens == opens + 1
+
+@pytest.mark.asyncio
+async def test_sync_calls_are_rejected_while_open():
+    breaker = make_breaker(cooldown=0.0)
+    await open_breaker(breaker)
+    calls = []
+
+    # 同步调用不发起试探，冷却期已过也直接拒绝
+    with pytest.raises(CircuitOpenError):
+        breaker.call_sync(calls.append, 1)
+    assert calls == []
+    assert breaker.state == breaker.OPEN
+
+def test_sync_failures_open_the_breaker():
+    breaker = make_breaker(threshold=2)
+
+    def down():
+        raise Unavailable("down")
+
+    for _ in range(2):
+        with pytest.raises(Unavailable):
+            breaker.call_sync(down)
+
+    assert breaker.state == breaker.OPEN
+
+def test_sync_calls_from_threads_keep_consistent_counts():
+    from concurrent.futures import ThreadPoolExecutor
+
+    breaker = make_breaker(threshold=10000)
+
+    def down():
+        raise Unavailable("down")
+
+    def worker():
+        for _ in range(200):
+            try:
+                breaker.call_sync(down)
+            except Unavailable:
+                pass
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for future in [pool.submit(worker) for _ in range(8)]:
+            future.result()
+
+    assert breaker.calls == breaker.failures == breaker.consecutive_failures == 1600
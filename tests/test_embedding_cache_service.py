@@ -0,0 +1,50 @@
+import pytest
+import numpy as np
+from app.services.embedding_cache_service import EmbeddingCacheService
+from app.services.redis_service import redis_service
+
+EMBEDDING = [0.1, 0.2, 0.3]
+
+@pytest.fixture
+def cache(fake_redis):
+    cache = EmbeddingCacheService()
+    cache.enabled = True
+    cache.max_size = 2
+    return cache
+
+def test_local_hit_after_set(cache):
+    cache.set("model", "如何修改密码", EMBEDDING)
+
+    assert cache.get("model", "如何修改密码") == pytest.approx(EMBEDDING)
+    assert cache.get_stats()["l1_hits"] == 1
+
+def test_other_worker_hits_redis_and_fills_local_cache(cache):
+    cache.set("model", "如何修改密码", EMBEDDING)
+    other = EmbeddingCacheService()
+    other.enabled = True
+
+    embedding = other.get("model", "如何修改密码")
+
+    # Redis 中保存 float32，两级缓存返回相同的值
+    assert embedding == np.asarray(EMBEDDING, dtype=np.float32).tolist()
+    assert other.get("model", "如何修改密码") == embedding
+    assert (other.l1_hits, other.l2_hits, other.misses) == (1, 1, 0)
+
+def test_model_is_part_of_the_key(cache):
+    cache.set("model-a", "如何修改密码", EMBEDDING)
+
+    assert cache.get("model-b", "如何修改密码") is None
+    assert cache.get_stats()["misses"] == 1
+
+def test_local_cache_evicts_least_recently_used(cache):
+    for text in ["a", "b"]:
+        cache.set("model", text, EMBEDDING)
+    cache.get("model", "a")
+    cache.set("model", "c", EMBEDDING)
+
+    redis_service.binary_client.flushall()
+    # 清空 Redis 后只有本地 LRU 中的条目可以命中，"b" 最久未使用已被淘汰
+    assert cache.get("model", "a") is not None
+    assert cache.get("model", "c") is not None
+    assert cache.get("model", "b") is None
+    assert cache.get_stats()["size"] == 2
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.services.executor_service import ExecutorService
+
+def make_executor(max_workers=2, max_pending=1):
+    service = ExecutorService()
+    service.max_workers = max_workers
+    service.max_pending = max_pending
+    return service
+
+@pytest.mark.asyncio
+async def test_blocking_call_does_not_block_event_loop():
+    service = make_executor()
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    result, _ = await asyncio.gather(service.run(time.sleep, 0.1), ticker())
+
+    assert result is None
+    # 阻塞调用执行期间事件循环仍在调度其他协程
+    assert ticks[-1] - ticks[0] < 0.1
+    service.shutdown()
+
+@pytest.mark.asyncio
+async def test_runs_in_worker_thread_with_arguments():
+    service = make_executor()
+
+    name = await service.run(lambda prefix, suffix="": prefix + threading.current_thread().name + suffix, "t:", suffix="!")
+
+    assert name.startswith("t:blocking-io") and name.endswith("!")
+    service.shutdown()
+
+@pytest.mark.asyncio
+async def test_queued_tasks_are_bounded():
+    service = make_executor(max_workers=1, max_pending=1)
+    queued = []
+
+    def work():
+        queued.append(service.executor._work_queue.qsize())
+        time.sleep(0.01)
+
+    await asyncio.gather(*[service.run(work) for _ in range(6)])
+
+    # 其余任务在事件循环中等待名额，线程池队列中最多 max_pending 个
+    assert len(queued) == 6
+    assert max(queued) <= 1
+    service.shutdown()
@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+from app.core.config import settings
+from app.services.redis_service import redis_service
+from app.services.history_summary_service import HistorySummaryService
+
+def turns(count, start=0):
+    messages = []
+    for i in range(start, start + count):
+        messages += redis_service.turn_messages(f"q{i}", f"a{i}")
+    return messages
+
+@pytest.fixture
+def summarizer(monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_SUMMARY_ENABLED", True)
+    monkeypatch.setattr(settings, "HISTORY_SUMMARY_TRIGGER_MESSAGES", 8)
+    monkeypatch.setattr(settings, "HISTORY_SUMMARY_KEEP_ROUNDS", 2)
+    monkeypatch.setattr(settings, "HISTORY_PROMPT_ROUNDS", 2)
+    service = HistorySummaryService()
+    prompts = []
+
+    async def summarize(previous, folded):
+        prompts.append((previous, folded))
+        return "摘要: " + ",".join(m["content"] for m in folded)
+
+    monkeypatch.setattr(service, "_summarize", summarize)
+    service.prompts = prompts
+    return service
+
+async def mark_persisted(session_id, total):
+    await redis_service.set_strapi_record_id_async(session_id, 1, total)
+
+@pytest.mark.asyncio
+async def test_compaction_removes_persisted_messages(fake_redis, summarizer):
+    length = await redis_service.append_messages_async("s1", turns(5))
+    await mark_persisted("s1", length)
+
+    assert await summarizer.maybe_compact("s1", length)
+
+    summary, recent, _ = await redis_service.get_prompt_history_async("s1", None)
+    assert summary["folded_messages"] == 6
+    assert [m["content"] for m in recent] == ["q3", "a3", "q4", "a4"]
+    # 折叠的原文从 Redis 中删除，写入 Strapi 时从已保存的记录中保留
+    transcript = await redis_service.get_transcript_async("s1")
+    assert (transcript["offset"], transcript["total"]) == (6, 10)
+
+@pytest.mark.asyncio
+async def test_compaction_only_folds_messages_written_to_strapi(fake_redis, summarizer):
+    length = await redis_service.append_messages_async("s1", turns(5))
+
+    assert not await summarizer.maybe_compact("s1", length)
+
+    await mark_persisted("s1", 4)
+    assert await summarizer.maybe_compact("s1", length)
+    _, folded = summarizer.prompts[-1]
+    assert [m["content"] for m in folded] == ["q0", "a0", "q1", "a1"]
+
+@pytest.mark.asyncio
+async def test_repeated_compaction_extends_summary(fake_redis, summarizer):
+    await redis_service.append_messages_async("s1", turns(5))
+    await mark_persisted("s1", 10)
+    await summarizer.maybe_compact("s1")
+    length = await redis_service.append_messages_async("s1", turns(3, start=5))
+    await mark_persisted("s1", 16)
+
+    assert await summarizer.maybe_compact("s1", length)
+
+    previous, folded = summarizer.prompts[-1]
+    assert previous["folded_messages"] == 6
+    assert [m["content"] for m in folded] == ["q3", "a3", "q4", "a4", "q5", "a5"]
+    transcript = await redis_service.get_transcript_async("s1")
+    assert transcript["offset"] == 12
+    assert [m["content"] for m in transcript["messages"]] == ["q6", "a6", "q7", "a7"]
+
+@pytest.mark.asyncio
+async def test_below_trigger_does_not_compact(fake_redis, summarizer):
+    length = await redis_service.append_messages_async("s1", turns(4))
+    await mark_persisted("s1", length)
+
+    assert not await summarizer.maybe_compact("s1", length)
+    assert summarizer.prompts == []
+
+@pytest.mark.asyncio
+async def test_compaction_is_abandoned_when_history_changed(fake_redis, summarizer, monkeypatch):
+    await redis_service.append_messages_async("s1", turns(5))
+    await mark_persisted("s1", 10)
+    history_key = f"{redis_service.NAMESPACE}:session:s1:history"
+
+    async def summarize_while_history_is_replaced(previous, folded):
+        redis_service.binary_client.delete(history_key)
+        redis_service.binary_client.rpush(history_key, *[redis_service.codec.encode(m) for m in turns(5, start=100)])
+        return "摘要"
+
+    monkeypatch.setattr(summarizer, "_summarize", summarize_while_history_is_replaced)
+
+    assert not await summarizer.maybe_compact("s1")
+    assert await redis_service.get_history_summary_async("s1") is None
+    assert len((await redis_service.get_transcript_async("s1"))["messages"]) == 10
+
+@pytest.mark.asyncio
+async def test_schedule_runs_compaction_in_background(fake_redis, summarizer):
+    length = await redis_service.append_messages_async("s1", turns(5))
+    await mark_persisted("s1", length)
+
+    summarizer.schedule("s1", length)
+    # 同一会话已有进行中的压缩时不重复创建任务
+    summarizer.schedule("s1", length)
+    assert len(summarizer._tasks) == 1
+    await asyncio.gather(*summarizer._tasks.values())
+
+    assert summarizer.compactions == 1
+    assert not summarizer._tasks
+
+@pytest.mark.asyncio
+async def test_persist_schedules_strapi_write_before_compaction(fake_redis, summarizer, monkeypatch):
+    from app.services import openai_service as module
+
+    calls = []
+    monkeypatch.setattr(module.strapi_writer_service, "schedule", lambda session_id: calls.append("strapi"))
+    monkeypatch.setattr(module.history_summary_service, "schedule", lambda session_id, length: calls.append(("compact", length)))
+    await redis_service.append_messages_async("s1", turns(4))
+
+    await module.openai_service.persist_conversation_turn("s1", "q4", "a4")
+
+    assert calls == ["strapi", ("compact", 10)]
@@ -0,0 +1,39 @@
+import pytest
+from app.core.config import settings
+from app.services.http_client_service import HTTPClientService
+
+@pytest.mark.asyncio
+async def test_clients_are_shared_until_shutdown():
+    service = HTTPClientService()
+
+    openai_client = service.openai_client
+    assert service.openai_client is openai_client
+    assert service.strapi_client is not openai_client
+
+    await service.shutdown()
+    assert openai_client.is_closed
+
+    # 关闭后再次访问时按需重新创建
+    recreated = service.openai_client
+    assert recreated is not openai_client and not recreated.is_closed
+    await service.shutdown()
+
+def test_http2_falls_back_when_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP2_ENABLED", False)
+
+    assert HTTPClientService().http2 is False
+
+@pytest.mark.asyncio
+async def test_prewarm_opens_configured_connections(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_PREWARM_CONNECTIONS", 3)
+    service = HTTPClientService()
+    calls = []
+
+    class Client:
+        async def head(self, url):
+            calls.append(url)
+
+    await service._prewarm(Client(), "http://llm.test", "OpenAI")
+    await service._prewarm(Client(), None, "Strapi")
+
+    assert calls == ["http://llm.test"] * 3
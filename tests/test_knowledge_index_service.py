@@ -0,0 +1,50 @@
+import json
+import os
+from app.services.knowledge_index_service import KnowledgeIndexService
+
+ITEMS = [
+    {"id": 1, "FAQ": "如何重置密码？", "Response": "点击忘记密码"},
+    {"id": 2, "FAQ": "如何注销账号？", "Response": "联系客服"}
+]
+
+def write(path, content, mtime_ns):
+    path.write_text(content, encoding="utf-8")
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def test_loads_once_and_keeps_requested_order(tmp_path):
+    path = tmp_path / "knowledge.json"
+    write(path, json.dumps(ITEMS), 1_000_000_000)
+    index = KnowledgeIndexService(str(path))
+
+    assert [record.id for record in index.get_many([2, 3, 1])] == ["2", "1"]
+    assert index.get_many([1])[0].to_dict()["FAQ"] == "如何重置密码？"
+
+def test_reloads_when_file_changes(tmp_path):
+    path = tmp_path / "knowledge.json"
+    write(path, json.dumps(ITEMS), 1_000_000_000)
+    index = KnowledgeIndexService(str(path))
+    index.get_many([1])
+
+    write(path, json.dumps([{"id": 3, "FAQ": "新问题"}]), 2_000_000_000)
+
+    assert [record.id for record in index.get_many([1, 3])] == ["3"]
+
+def test_failed_reload_keeps_last_good_index_until_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / "knowledge.json"
+    write(path, json.dumps(ITEMS), 1_000_000_000)
+    index = KnowledgeIndexService(str(path))
+    index.get_many([1])
+
+    write(path, '[{"id": 3', 2_000_000_000)
+    reloads = []
+    reload = index.reload
+    monkeypatch.setattr(index, "reload", lambda: reloads.append(1) or reload())
+
+    assert [record.id for record in index.get_many([1])] == ["1"]
+    assert [record.id for record in index.get_many([2])] == ["2"]
+    assert len(reloads) == 1
+
+    write(path, json.dumps([{"id": 3, "FAQ": "新问题"}]), 3_000_000_000)
+
+    assert [record.id for record in index.get_many([3])] == ["3"]
+    assert len(reloads) == 2
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from app.core.config import settings
+from app.services.llm_router_service import LLMRouterService, UpstreamEndpoint, UpstreamError
+
+def make_router(monkeypatch, names):
+    monkeypatch.setattr(settings, "OPENAI_UPSTREAMS", "")
+    router = LLMRouterService()
+    router.endpoints = [UpstreamEndpoint(name=name, url=f"http://{name}/v1/chat/completions") for name in names]
+    return router
+
+@pytest.mark.asyncio
+async def test_failover_skips_endpoint_already_used_as_hedge(monkeypatch):
+    router = make_router(monkeypatch, ["a", "b"])
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "LLM_FAILOVER_ATTEMPTS", 3)
+    monkeypatch.setattr(router, "_hedge_delay", lambda endpoint: 0.01)
+    calls = []
+
+    async def failing_post(endpoint, payload):
+        calls.append(endpoint.name)
+        # 主请求比对冲延迟慢，触发对冲后两个请求都失败
+        await asyncio.sleep(0.05 if len(calls) == 1 else 0)
+        raise UpstreamError(f"{endpoint.name} 返回 503", reason="503")
+
+    monkeypatch.setattr(router, "_post", failing_post)
+
+    with pytest.raises(UpstreamError):
+        await router.complete({"messages": []})
+    assert sorted(calls) == ["a", "b"]
+
+@pytest.mark.asyncio
+async def test_failover_moves_to_next_endpoint(monkeypatch):
+    router = make_router(monkeypatch, ["a", "b"])
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", False)
+    monkeypatch.setattr(settings, "LLM_FAILOVER_ATTEMPTS", 2)
+    calls = []
+
+    async def post(endpoint, payload):
+        calls.append(endpoint.name)
+        if len(calls) == 1:
+            raise UpstreamError(f"{endpoint.name} 返回 502", reason="502")
+        return {"choices": []}
+
+    monkeypatch.setattr(router, "_post", post)
+
+    result, endpoint = await router.complete({"messages": []})
+    assert result == {"choices": []}
+    assert len(set(calls)) == 2 and endpoint.name == calls[-1]
+
+@pytest.mark.asyncio
+async def test_hedge_returns_first_success(monkeypatch):
+    router = make_router(monkeypatch, ["a", "b"])
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(router, "_hedge_delay", lambda endpoint: 0.01)
+
+    async def post(endpoint, payload):
+        # 主端点很慢，对冲端点立即返回
+        if endpoint is router.endpoints[0]:
+            await asyncio.sleep(1)
+        return {"from": endpoint.name}
+
+    monkeypatch.setattr(router, "_post", post)
+    monkeypatch.setattr(router, "select", lambda exclude=(): next(e for e in router.endpoints if e not in exclude))
+
+    result, endpoint = await router.complete({"messages": []})
+    assert result == {"from": "b"} and endpoint.name == "b"
+    assert endpoint.hedges == 1
+
+def test_least_latency_scores_unsampled_endpoint_with_median_prior(monkeypatch):
+    router = make_router(monkeypatch, ["fast", "slow", "new"])
+    router.strategy = "least_latency"
+    fast, slow, new = router.endpoints
+    fast.ewma_latency = 0.2
+    slow.ewma_latency = 3.0
+
+    # 新端点按已知延迟的中位数 (1.6s) 计分，不会抢走最快端点的流量
+    assert router.select() is fast
+    assert router.select(exclude=[fast]) is new
+
+    slow.weight = 4.0
+    assert router.select(exclude=[fast]) is slow
@@ -0,0 +1,50 @@
+import json
+import queue
+import logging
+from app.core import logging_config
+from app.core.config import settings
+from app.core.logging_config import DroppingQueueHandler, JsonFormatter
+
+def make_record(message, level=logging.INFO, **extra):
+    record = logging.LogRecord("app.test", level, __file__, 1, message, None, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_json_formatter_merges_extra_fields():
+    line = JsonFormatter().format(make_record("✅ 回答完成", session_id="s1", latency=0.25))
+
+    data = json.loads(line)
+    assert data["message"] == "✅ 回答完成"
+    assert data["level"] == "INFO" and data["logger"] == "app.test"
+    assert data["session_id"] == "s1" and data["latency"] == 0.25
+    assert "msg" not in data and "args" not in data
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+
+    for i in range(3):
+        handler.handle(make_record(f"日志 {i}"))
+
+    assert handler.queue.qsize() == 1
+    assert handler.queue.get_nowait().getMessage() == "日志 0"
+    assert handler.dropped == 2
+
+def test_setup_routes_root_logger_through_queue(monkeypatch):
+    root = logging.getLogger()
+    httpx_logger = logging.getLogger("httpx")
+    levels = (root.level, httpx_logger.level)
+    monkeypatch.setattr(root, "handlers", list(root.handlers))
+    monkeypatch.setattr(logging_config, "_listener", None)
+    monkeypatch.setattr(logging_config, "_queue_handler", None)
+    monkeypatch.setattr(settings, "LOG_LEVEL", "INFO")
+    try:
+        logging_config.setup_logging()
+
+        assert root.handlers == [logging_config._queue_handler]
+        assert root.level == logging.INFO
+        # 每个请求一行的 httpx 日志只在 DEBUG 级别输出
+        assert httpx_logger.level == logging.WARNING
+    finally:
+        logging_config.shutdown_logging()
+        root.setLevel(levels[0])
+        httpx_logger.setLevel(levels[1])
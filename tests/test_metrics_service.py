@@ -0,0 +1,55 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.routes import router
+from app.services.metrics_service import MetricsService
+
+def sample(metrics, name, **labels):
+    return metrics.registry.get_sample_value(name, labels) or 0
+
+def test_stage_records_latency_and_errors():
+    metrics = MetricsService()
+
+    with metrics.stage("chroma_query"):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.stage("chroma_query"):
+            raise RuntimeError("查询失败")
+
+    assert sample(metrics, "ai_support_stage_latency_seconds_count", stage="chroma_query") == 2
+    assert sample(metrics, "ai_support_stage_errors_total", stage="chroma_query") == 1
+
+def test_request_counts_success_and_error():
+    metrics = MetricsService()
+
+    with metrics.request("chat"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.request("chat"):
+            raise ValueError()
+
+    assert sample(metrics, "ai_support_requests_total", endpoint="chat", status="success") == 1
+    assert sample(metrics, "ai_support_requests_total", endpoint="chat", status="error") == 1
+    assert sample(metrics, "ai_support_request_latency_seconds_count", endpoint="chat") == 2
+
+def test_answer_sources_and_upstream_errors_are_labelled():
+    metrics = MetricsService()
+
+    metrics.record_answer("answer_cache")
+    metrics.record_answer(None)
+    metrics.record_upstream_error("primary", "503")
+
+    assert sample(metrics, "ai_support_answers_total", source="answer_cache") == 1
+    assert sample(metrics, "ai_support_answers_total", source="unknown") == 1
+    assert sample(metrics, "ai_support_upstream_errors_total", upstream="primary", reason="503") == 1
+
+def test_metrics_endpoint_exports_prometheus_text():
+    app = FastAPI()
+    app.include_router(router)
+
+    response = TestClient(app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE ai_support_stage_latency_seconds histogram" in response.text
+    assert "ai_support_cache_lookups_total" in response.text
@@ -0,0 +1,96 @@
+import pytest
+from app.core.config import settings
+from app.services.openai_service import openai_service
+from app.services.redis_service import redis_service
+from app.services.session_cache_service import session_cache_service
+
+def direct_answer_context():
+    return {
+        "query": "如何修改密码",
+        "full_history": [],
+        "faq_ids": ["12", "34"],
+        "faq_scores": [0.95, 0.6],
+        "faq_details": [{"id": 12, "Response": "在设置页面修改密码", "Response_Pic_App_URL": ""}],
+        "messages": []
+    }
+
+@pytest.mark.asyncio
+async def test_stream_returns_direct_answer_without_llm(monkeypatch):
+    monkeypatch.setattr(settings, "DIRECT_ANSWER_ENABLED", True)
+    monkeypatch.setattr(settings, "DIRECT_ANSWER_MIN_SCORE", 0.85)
+    monkeypatch.setattr(settings, "DIRECT_ANSWER_MIN_MARGIN", 0.1)
+
+    async def build_rag_context(session_id, query):
+        return direct_answer_context()
+
+    async def llm_stream(messages):
+        raise AssertionError("高置信度命中时不应调用 LLM")
+        yield
+
+    monkeypatch.setattr(openai_service.rag_service, "build_rag_context", build_rag_context)
+    monkeypatch.setattr(openai_service, "generate_response_stream", llm_stream)
+
+    chunks = [chunk async for chunk in openai_service.generate_rag_response_stream("s1", "如何修改密码")]
+    assert chunks == ["在设置页面修改密码"]
+
+def contents(messages):
+    return [m["content"] for m in messages]
+
+@pytest.mark.asyncio
+async def test_strapi_record_id_is_cached_after_first_write(fake_redis, fake_strapi):
+    await redis_service.append_messages_async("s1", redis_service.turn_messages("q0", "a0"))
+
+    assert await openai_service.save_conversation_to_strapi("s1")
+    fake_strapi.requests.clear()
+    await redis_service.append_messages_async("s1", redis_service.turn_messages("q1", "a1"))
+    assert await openai_service.save_conversation_to_strapi("s1")
+
+    # 记录 ID 已缓存，之后每次只需一次 PUT
+    assert fake_strapi.requests == [("PUT", "/api/ai-support-sessions/1")]
+    assert contents(fake_strapi.records[1]["history"]) == ["q0", "a0", "q1", "a1"]
+
+@pytest.mark.asyncio
+async def test_deleted_strapi_record_is_looked_up_again(fake_redis, fake_strapi):
+    await redis_service.append_messages_async("s1", redis_service.turn_messages("q0", "a0"))
+    assert await openai_service.save_conversation_to_strapi("s1")
+    fake_strapi.records.clear()
+
+    assert await openai_service.save_conversation_to_strapi("s1")
+
+    assert contents(fake_strapi.records[2]["history"]) == ["q0", "a0"]
+    assert await redis_service.get_strapi_record_id_async("s1") == "2"
+
+@pytest.mark.asyncio
+async def test_messages_trimmed_from_redis_are_kept_in_strapi(fake_redis, fake_strapi, monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_MAX_MESSAGES", 4)
+    for i in range(2):
+        await redis_service.append_messages_async("s1", redis_service.turn_messages(f"q{i}", f"a{i}"))
+    assert await openai_service.save_conversation_to_strapi("s1")
+
+    for i in range(2, 4):
+        await redis_service.append_messages_async("s1", redis_service.turn_messages(f"q{i}", f"a{i}"))
+    assert await openai_service.save_conversation_to_strapi("s1")
+
+    assert contents(fake_strapi.records[1]["history"]) == ["q0", "a0", "q1", "a1", "q2", "a2", "q3", "a3"]
+
+def test_missing_earlier_messages_are_replaced_by_summary():
+    transcript = {
+        "messages": [{"role": "user", "content": "q5"}],
+        "offset": 5,
+        "total": 6,
+        "summary": {"content": "摘要", "folded_messages": 4, "updated_at": None}
+    }
+    saved = [{"role": "system", "content": "早前", "omitted": 3}, {"role": "user", "content": "q3"}]
+
+    history = openai_service._merge_transcript(saved, transcript)
+
+    # 已保存的占位消息按代替的条数对齐，仍缺少的一条以摘要代替
+    assert contents(history) == ["早前", "q3", "早前对话摘要（共1条消息）: 摘要", "q5"]
+    assert history[2]["omitted"] == 1
+
+@pytest.mark.asyncio
+async def test_strapi_write_waits_for_buffered_redis_writes(fake_redis, fake_strapi, monkeypatch):
+    monkeypatch.setattr(session_cache_service, "_pending_sessions", {"s1": 1})
+
+    assert not await openai_service.save_conversation_to_strapi("s1")
+    assert fake_strapi.requests == []
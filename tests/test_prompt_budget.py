@@ -0,0 +1,71 @@
+import pytest
+from app.core.config import settings
+from app.services.rag_service import rag_service
+from app.services.token_service import TokenService, token_service
+
+def faq(faq_id, response):
+    return {"id": faq_id, "FAQ": f"问题{faq_id}", "Keywords": "", "Response": response}
+
+def retrieval(*faqs):
+    return {
+        "knowledge": rag_service.strapi_service.format_faq_for_rag(list(faqs)),
+        "faq_ids": [f["id"] for f in faqs],
+        "faq_scores": [0.9] * len(faqs),
+        "faq_details": list(faqs)
+    }
+
+def rounds(n):
+    return [
+        [{"role": "user", "content": f"第{i}轮问题" * 10}, {"role": "assistant", "content": f"第{i}轮回答" * 10}]
+        for i in range(n)
+    ]
+
+@pytest.fixture
+def budget(monkeypatch):
+    def set_budget(total, knowledge=2500, history=1200):
+        monkeypatch.setattr(settings, "PROMPT_TOKEN_BUDGET", total)
+        monkeypatch.setattr(settings, "PROMPT_MAX_KNOWLEDGE_TOKENS", knowledge)
+        monkeypatch.setattr(settings, "PROMPT_MAX_HISTORY_TOKENS", history)
+    return set_budget
+
+def test_estimated_truncate_stays_within_limit():
+    service = TokenService()
+    service._encoding = None
+
+    assert service.count("你好world") == 2 + 2
+    assert service.truncate("一二三四五", 3) == "一二…"
+    assert service.count(service.truncate("一二三四五", 3)) <= 3
+    assert service.truncate("一二三", 3) == "一二三"
+    assert service.truncate("一二三", 0) == ""
+
+def test_prompt_fits_budget_and_drops_oldest_rounds_first(budget):
+    fixed = rag_service._instruction_tokens()
+    budget(fixed + 300)
+
+    result = rag_service.fit_to_token_budget("如何修改密码", retrieval(faq("12", "在设置页修改")), rounds(10))
+
+    usage = result["token_usage"]
+    assert usage["total"] <= settings.PROMPT_TOKEN_BUDGET
+    assert 0 < usage["dropped_rounds"] < 10
+    # 保留的是最近的轮次
+    assert result["history"][-1]["content"].startswith("第9轮回答")
+    assert usage["dropped_faqs"] == 0
+
+def test_lower_ranked_faqs_are_dropped_before_the_top_match(budget):
+    top = faq("12", "在设置页修改密码")
+    others = [faq(str(i), "很长的回答" * 100) for i in range(2)]
+    budget(10000, knowledge=token_service.count(rag_service.strapi_service.format_faq_for_rag([top])) + 5)
+
+    result = rag_service.fit_to_token_budget("如何修改密码", retrieval(top, *others), [])
+
+    assert result["token_usage"]["dropped_faqs"] == 2
+    assert "在设置页修改密码" in result["knowledge"]
+
+def test_overlong_query_is_truncated(budget, monkeypatch):
+    budget(10000)
+    monkeypatch.setattr(settings, "PROMPT_MAX_QUERY_TOKENS", 5)
+
+    result = rag_service.fit_to_token_budget("密码" * 50, retrieval(), [])
+
+    assert result["token_usage"]["query"] <= 5
+    assert result["query"].endswith("…")
@@ -0,0 +1,38 @@
+from app.services.openai_service import OpenAIService
+from app.services.rag_service import RAGService, compile_template, rag_service
+
+def retrieval(*faqs):
+    return {
+        "knowledge": rag_service.strapi_service.format_faq_for_rag(list(faqs)),
+        "faq_ids": [f["id"] for f in faqs],
+        "faq_scores": [0.9] * len(faqs),
+        "faq_details": list(faqs)
+    }
+
+def test_compiled_template_matches_str_format():
+    render = compile_template(RAGService.USER_PROMPT_TEMPLATE)
+    fields = {"history": "用户: 你好", "knowledge": "【语料库知识】{不是字段}", "query": "如何修改密码"}
+
+    assert render(**fields) == RAGService.USER_PROMPT_TEMPLATE.format(**fields)
+
+def test_system_prefix_is_identical_across_requests():
+    first = rag_service.assemble_context([], [], "如何修改密码", retrieval({"id": "12", "FAQ": "修改密码", "Response": "在设置页修改"}))
+    rounds = [[{"role": "user", "content": "你好"}, {"role": "assistant", "content": "您好"}]]
+    second = rag_service.assemble_context(rounds[0], rounds, "如何注销账号", retrieval())
+
+    assert first["messages"][0] == second["messages"][0] == {"role": "system", "content": RAGService.SYSTEM_PROMPT}
+    assert "{" not in RAGService.SYSTEM_PROMPT
+    # 可变内容只出现在用户消息中，当前问题在最后
+    assert first["messages"][1]["content"].endswith("## 当前问题\n如何修改密码")
+    assert "用户: 你好" in second["messages"][1]["content"]
+
+def test_usage_reports_cached_prompt_tokens():
+    usage = OpenAIService._normalize_usage({
+        "prompt_tokens": 1200,
+        "completion_tokens": 80,
+        "total_tokens": 1280,
+        "prompt_tokens_details": {"cached_tokens": 1024}
+    })
+
+    assert usage == {"prompt_tokens": 1200, "cached_tokens": 1024, "completion_tokens": 80, "total_tokens": 1280}
+    assert OpenAIService._normalize_usage(None)["cached_tokens"] == 0
@@ -0,0 +1,37 @@
+import pytest
+from app.core.config import settings
+from app.services.redis_service import RedisService, redis_service
+
+@pytest.mark.asyncio
+async def test_async_client_pool_is_shared_and_released_on_shutdown(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_MAX_CONNECTIONS", 7)
+    service = RedisService()
+
+    client = service.async_client
+    assert service.async_client is client
+    assert client.connection_pool.max_connections == 7
+    assert service.async_binary_client.connection_pool is not client.connection_pool
+
+    await service.shutdown()
+    assert service._async_client is None and service._async_binary_client is None
+
+@pytest.mark.asyncio
+async def test_health_check_reports_latency_and_pool(fake_redis):
+    health = await redis_service.health_check()
+
+    assert health["healthy"] is True
+    assert health["latency_ms"] is not None
+    assert set(health["pool"]) == {"max_connections", "in_use", "idle"}
+
+@pytest.mark.asyncio
+async def test_health_check_reports_unreachable_redis(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_HOST", "127.0.0.1")
+    monkeypatch.setattr(settings, "REDIS_PORT", 1)
+    monkeypatch.setattr(settings, "REDIS_CONNECT_TIMEOUT", 0.2)
+    service = RedisService()
+
+    health = await service.health_check()
+
+    assert health["healthy"] is False
+    assert health["error"].startswith("ConnectionError")
+    await service.shutdown()
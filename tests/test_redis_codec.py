@@ -0,0 +1,72 @@
+import json
+import pytest
+from app.services.redis_codec import SessionCodec
+
+pytest.importorskip("msgpack")
+pytest.importorskip("zstandard")
+
+MESSAGES = [
+    {"role": "user", "content": "如何重置密码？"},
+    {"role": "assistant", "content": "请在登录页点击“忘记密码”，按提示完成验证。" * 20}
+]
+
+@pytest.mark.parametrize("name", ["json", "msgpack", "msgpack+zstd"])
+def test_round_trip(name):
+    codec = SessionCodec(name, min_compress_bytes=0)
+
+    assert codec.decode(codec.encode(MESSAGES)) == MESSAGES
+    assert codec.name == name
+
+def test_binary_formats_carry_version_byte():
+    assert SessionCodec("json").encode(MESSAGES)[:1] == b"["
+    assert SessionCodec("msgpack").encode(MESSAGES)[0] == 0x01
+    assert SessionCodec("msgpack+zstd", min_compress_bytes=0).encode(MESSAGES)[0] == 0x02
+
+def test_short_values_are_not_compressed():
+    codec = SessionCodec("msgpack+zstd", min_compress_bytes=4096)
+
+    value = codec.encode(MESSAGES[0])
+
+    assert value[0] == 0x01
+    assert codec.decode(value) == MESSAGES[0]
+
+def test_legacy_json_is_readable_by_every_codec():
+    legacy = json.dumps(MESSAGES)
+    codec = SessionCodec("msgpack+zstd")
+
+    assert codec.decode(legacy) == MESSAGES
+    assert codec.decode(legacy.encode("utf-8")) == MESSAGES
+    assert codec.decode(None) is None
+    assert codec.legacy_reads == 2
+
+def test_unknown_codec_falls_back_to_json():
+    codec = SessionCodec("protobuf")
+
+    assert codec.name == "json"
+    assert codec.decode(codec.encode(MESSAGES)) == MESSAGES
+
+def test_stats_report_bytes_saved():
+    codec = SessionCodec("msgpack+zstd", min_compress_bytes=0)
+    codec.encode(MESSAGES)
+
+    stats = codec.get_stats()
+
+    assert stats["encoded_values"] == 1
+    assert stats["bytes_saved"] > 0
+
+def test_zstd_packs_once_and_samples_json_size(monkeypatch):
+    codec = SessionCodec("msgpack+zstd", min_compress_bytes=0)
+    packs, dumps = [], []
+    pack = codec._formats[0x01].encode
+    to_json = codec._to_json
+    monkeypatch.setattr(codec._formats[0x01], "encode", lambda obj: packs.append(1) or pack(obj))
+    monkeypatch.setattr(codec, "_to_json", lambda obj: dumps.append(1) or to_json(obj))
+
+    for _ in range(SessionCodec.STATS_SAMPLE_EVERY + 1):
+        codec.encode(MESSAGES)
+
+    assert len(packs) == SessionCodec.STATS_SAMPLE_EVERY + 1
+    assert len(dumps) == 2
+    stats = codec.get_stats()
+    assert stats["stored_bytes"] == stats["sampled_stored_bytes"] * (SessionCodec.STATS_SAMPLE_EVERY + 1) // 2
+    assert stats["json_bytes"] > stats["stored_bytes"]
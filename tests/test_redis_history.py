@@ -0,0 +1,96 @@
+import json
+import pytest
+from app.core.config import settings
+from app.services.redis_service import redis_service
+
+def legacy_key(session_id):
+    return f"{redis_service.NAMESPACE}:session:{session_id}:history"
+
+def write_legacy(session_id, messages, ttl=3600):
+    redis_service.redis_client.set(legacy_key(session_id), json.dumps(messages), ex=ttl)
+
+def messages(count):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"} for i in range(count)]
+
+@pytest.mark.asyncio
+async def test_legacy_history_is_migrated_on_first_read(fake_redis):
+    write_legacy("s1", messages(4))
+
+    history = await redis_service.get_conversation_history_async("s1")
+
+    assert [m["content"] for m in history] == ["m0", "m1", "m2", "m3"]
+    assert redis_service.redis_client.type(legacy_key("s1")) == "list"
+    # 迁移保留原有的剩余过期时间
+    assert 0 < redis_service.redis_client.ttl(legacy_key("s1")) <= 3600
+
+@pytest.mark.asyncio
+async def test_migration_counts_messages_beyond_max(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_MAX_MESSAGES", 3)
+    write_legacy("s1", messages(5))
+
+    transcript = await redis_service.get_transcript_async("s1")
+
+    assert [m["content"] for m in transcript["messages"]] == ["m2", "m3", "m4"]
+    assert transcript["offset"] == 2
+    assert transcript["total"] == 5
+
+@pytest.mark.asyncio
+async def test_append_trims_to_max_messages_in_one_transaction(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_MAX_MESSAGES", 5)
+    await redis_service.append_messages_async("s1", messages(4))
+
+    length = await redis_service.append_messages_async("s1", messages(4))
+
+    # 返回截断前的长度，列表中只保留最近的消息
+    assert length == 8
+    history = await redis_service.get_conversation_history_async("s1")
+    assert [m["content"] for m in history] == ["m3", "m0", "m1", "m2", "m3"]
+    assert await redis_service.get_conversation_history_async("s1", max_messages=2) == history[-2:]
+    transcript = await redis_service.get_transcript_async("s1")
+    assert (transcript["offset"], transcript["total"]) == (3, 8)
+
+@pytest.mark.asyncio
+async def test_append_async_returns_length_and_migrates(fake_redis):
+    write_legacy("s1", messages(2))
+
+    length = await redis_service.append_messages_async("s1", messages(2))
+
+    assert length == 4
+    assert len(await redis_service.get_conversation_history_async("s1")) == 4
+
+def test_bulk_migration_runs_once_per_cluster(fake_redis):
+    write_legacy("s1", messages(2))
+    write_legacy("s2", messages(2))
+    redis_service.redis_client.rpush(legacy_key("s3"), "{}")
+
+    assert redis_service.migrate_legacy_histories(batch_size=10) == 2
+    assert redis_service.redis_client.type(legacy_key("s2")) == "list"
+
+    # 完成标记存在后，之后启动的进程不再扫描（遗留的 key 在首次访问时迁移）
+    write_legacy("s4", messages(2))
+    assert redis_service.migrate_legacy_histories(batch_size=10) == 0
+    assert redis_service.redis_client.type(legacy_key("s4")) == "string"
+
+def test_bulk_migration_skips_while_another_worker_holds_the_lock(fake_redis):
+    write_legacy("s1", messages(2))
+    redis_service.redis_client.set(f"{redis_service.NAMESPACE}:lock:migration:history-list", "1", ex=60)
+
+    assert redis_service.migrate_legacy_histories() == 0
+    assert redis_service.redis_client.type(legacy_key("s1")) == "string"
+
+@pytest.mark.asyncio
+async def test_knowledge_version_bump_is_deferred_while_breaker_is_open(fake_redis, monkeypatch):
+    breaker = redis_service.breaker
+    monkeypatch.setattr(breaker, "state", breaker.OPEN)
+    monkeypatch.setattr(breaker, "opened_at", 0.0)
+    monkeypatch.setattr(breaker, "cooldown", 0.0)
+    monkeypatch.setattr(redis_service, "_knowledge_version_pending", False)
+
+    assert redis_service.incr_knowledge_version() is None
+    assert redis_service.redis_client.get(f"{redis_service.NAMESPACE}:kb:version") is None
+
+    # 下一次异步调用作为试探调用成功，熔断器关闭并补上递增
+    await redis_service.call_async(redis_service.async_client.ping)
+    await redis_service._knowledge_version_task
+
+    assert await redis_service.get_knowledge_version_async() == 1
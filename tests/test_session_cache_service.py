@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+from app.core.config import settings
+from app.services.redis_service import redis_service
+from app.services.session_cache_service import SessionCacheService
+
+def turns(count, start=0):
+    messages = []
+    for i in range(start, start + count):
+        messages += redis_service.turn_messages(f"q{i}", f"a{i}")
+    return messages
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_PROMPT_ROUNDS", 2)
+    service = SessionCacheService()
+    # 视为失效通知已订阅，使用本地缓存
+    service._subscribed = True
+    return service
+
+@pytest.mark.asyncio
+async def test_get_reads_only_prompt_window(fake_redis, cache):
+    await redis_service.append_messages_async("s1", turns(10))
+
+    session = await cache.get("s1")
+
+    assert [m["content"] for m in session["messages"]] == ["a7", "q8", "a8", "q9", "a9"]
+    assert cache._entries["s1"]["length"] == 20
+
+@pytest.mark.asyncio
+async def test_append_keeps_cached_window(fake_redis, cache):
+    await redis_service.append_messages_async("s1", turns(10))
+    await cache.get("s1")
+
+    assert await cache.append("s1", turns(1, start=10)) == 22
+
+    session = await cache.get("s1")
+    assert cache.hits == 1
+    assert [m["content"] for m in session["messages"]] == ["a8", "q9", "a9", "q10", "a10"]
+
+@pytest.mark.asyncio
+async def test_append_drops_cache_after_concurrent_write(fake_redis, cache):
+    await redis_service.append_messages_async("s1", turns(10))
+    await cache.get("s1")
+    # 其他进程写入的消息不在本地副本中
+    await redis_service.append_messages_async("s1", turns(1, start=10))
+
+    await cache.append("s1", turns(1, start=11))
+
+    assert "s1" not in cache._entries
+    session = await cache.get("s1")
+    assert [m["content"] for m in session["messages"]] == ["a9", "q10", "a10", "q11", "a11"]
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = redis_service.breaker
+    for name, value in (("state", breaker.CLOSED), ("consecutive_failures", 0), ("opened_at", 0.0),
+                        ("failure_threshold", 1), ("cooldown", 0.05)):
+        monkeypatch.setattr(breaker, name, value)
+    return breaker
+
+async def wait_for_replay(cache):
+    for _ in range(50):
+        if not cache._pending:
+            return
+        await asyncio.sleep(0.05)
+
+@pytest.mark.asyncio
+async def test_degraded_reads_use_local_copy(fake_redis, cache, breaker):
+    await cache.append("s1", turns(1))
+    fake_redis.connected = False
+
+    session = await cache.get("s1")
+
+    assert breaker.state == breaker.OPEN
+    assert [m["content"] for m in session["messages"]] == ["q0", "a0"]
+    # 没有本地副本的会话按无历史处理
+    assert await cache.get("s2") == {"summary": None, "messages": []}
+    assert cache.fallback_reads == 2
+
+@pytest.mark.asyncio
+async def test_buffered_writes_are_replayed_after_recovery(fake_redis, cache, breaker):
+    await cache.append("s1", turns(1))
+    fake_redis.connected = False
+
+    assert await cache.append("s1", turns(1, start=1)) == 0
+    assert cache.has_pending_writes("s1")
+    session = await cache.get("s1")
+    assert [m["content"] for m in session["messages"]] == ["q0", "a0", "q1", "a1"]
+
+    fake_redis.connected = True
+    await wait_for_replay(cache)
+
+    assert breaker.state == breaker.CLOSED
+    assert not cache.has_pending_writes("s1")
+    assert cache.replayed_writes == 1
+    _, messages, _ = await redis_service.get_prompt_history_async("s1", None)
+    assert [m["content"] for m in messages] == ["q0", "a0", "q1", "a1"]
+    await cache.shutdown()
+
+@pytest.mark.asyncio
+async def test_write_buffer_drops_oldest_when_full(fake_redis, cache, breaker):
+    cache.write_buffer_size = 2
+    fake_redis.connected = False
+
+    for i in range(3):
+        await cache.append(f"s{i}", turns(1, start=i))
+
+    assert cache.dropped_writes == 1
+    assert not cache.has_pending_writes("s0")
+    assert cache.has_pending_writes("s2")
+    cache._replay_task.cancel()
+
+@pytest.mark.asyncio
+async def test_replay_skips_write_that_already_reached_redis(fake_redis, cache, breaker):
+    await cache.append("s1", turns(1))
+    # 写入超时但实际已在 Redis 中生效
+    messages = turns(1, start=1)
+    await redis_service.append_messages_async("s1", messages)
+    cache._buffer("s1", messages)
+
+    await wait_for_replay(cache)
+
+    assert not cache.has_pending_writes("s1")
+    history = await redis_service.get_conversation_history_async("s1")
+    assert [m["content"] for m in history] == ["q0", "a0", "q1", "a1"]
+    await cache.shutdown()
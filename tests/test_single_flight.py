@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from app.services.single_flight import SingleFlight
+
+def make_call(calls, result="answer", delay=0.05, error=None):
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if error:
+            raise error
+        return {"content": result}
+    return call
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_with_same_key_run_once():
+    flight = SingleFlight("test")
+    calls = []
+
+    results = await asyncio.gather(*[flight.do("k", make_call(calls)) for _ in range(5)])
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.get_stats() == {"name": "test", "inflight": 0, "executions": 1, "coalesced": 4}
+
+@pytest.mark.asyncio
+async def test_different_keys_and_later_calls_are_not_coalesced():
+    flight = SingleFlight("test")
+    calls = []
+
+    await asyncio.gather(flight.do("a", make_call(calls)), flight.do("b", make_call(calls)))
+    await flight.do("a", make_call(calls))
+
+    assert len(calls) == 3
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_shared_call():
+    flight = SingleFlight("test")
+    calls = []
+    first = asyncio.ensure_future(flight.do("k", make_call(calls)))
+    second = asyncio.ensure_future(flight.do("k", make_call(calls)))
+    await asyncio.sleep(0.01)
+
+    first.cancel()
+
+    assert (await second)["content"] == "answer"
+    assert first.cancelled() and len(calls) == 1
+
+@pytest.mark.asyncio
+async def test_error_is_shared_and_not_cached():
+    flight = SingleFlight("test")
+    calls = []
+
+    results = await asyncio.gather(
+        *[flight.do("k", make_call(calls, error=RuntimeError("上游失败"))) for _ in range(3)],
+        return_exceptions=True
+    )
+
+    assert len(calls) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert (await flight.do("k", make_call(calls)))["content"] == "answer"
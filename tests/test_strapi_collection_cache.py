@@ -0,0 +1,82 @@
+import pytest
+from app.services.strapi_service import strapi_service
+
+class FakeCollection:
+    def __init__(self, count=2, fail_queries=0):
+        self.items = count
+        self.fail_queries = fail_queries
+        self.count_calls = 0
+
+    def count(self):
+        self.count_calls += 1
+        return self.items
+
+    def query(self, query_embeddings, n_results):
+        if self.fail_queries:
+            self.fail_queries -= 1
+            raise RuntimeError("collection does not exist")
+        return {
+            "documents": [["如何修改密码", "如何注销账号"][:n_results]],
+            "metadatas": [[{"id": "12", "keywords": "密码"}, {"id": "34", "keywords": "注销"}][:n_results]],
+            "distances": [[0.1, 0.6][:n_results]]
+        }
+
+class FakeChroma:
+    def __init__(self, *collections):
+        self.collections = list(collections)
+        self.get_calls = 0
+
+    def get_collection(self, name):
+        self.get_calls += 1
+        return self.collections[min(self.get_calls, len(self.collections)) - 1]
+
+    def list_collections(self):
+        raise AssertionError("检索时不应列出集合")
+
+@pytest.fixture
+def chroma(monkeypatch):
+    def install(*collections):
+        client = FakeChroma(*collections)
+        monkeypatch.setattr(strapi_service, "chroma_client", client)
+        monkeypatch.setattr(strapi_service, "_collection", None)
+        monkeypatch.setattr(strapi_service, "_collection_count", 0)
+        monkeypatch.setattr(strapi_service, "preprocess_faq_text", lambda text: [text])
+        monkeypatch.setattr(strapi_service, "get_query_embedding", lambda text: [0.1, 0.2])
+        return client
+    return install
+
+def test_collection_handle_and_count_are_fetched_once(chroma):
+    collection = FakeCollection()
+    client = chroma(collection)
+
+    for _ in range(3):
+        assert [faq["id"] for faq in strapi_service.search_similar_faqs("如何修改密码密码", n_results=1)] == ["12"]
+
+    assert client.get_calls == 1
+    assert collection.count_calls == 1
+
+def test_stale_handle_is_refreshed_and_query_retried_once(chroma):
+    stale = FakeCollection(fail_queries=1)
+    fresh = FakeCollection()
+    client = chroma(stale, fresh)
+
+    assert [faq["id"] for faq in strapi_service.search_similar_faqs("如何修改密码", n_results=1)] == ["12"]
+    assert client.get_calls == 2
+    assert strapi_service._collection is fresh
+
+def test_empty_collection_is_not_cached(chroma):
+    client = chroma(FakeCollection(count=0), FakeCollection())
+
+    assert strapi_service.search_similar_faqs("如何修改密码") == []
+    # 其他进程写入数据后，下一次检索重新获取集合
+    assert len(strapi_service.search_similar_faqs("如何修改密码")) == 2
+    assert client.get_calls == 2
+
+def test_refresh_after_write_uses_the_written_collection(chroma):
+    client = chroma(FakeCollection())
+    written = FakeCollection(count=5)
+
+    strapi_service._refresh_collection_cache(written)
+
+    assert strapi_service._get_search_collection() == (written, 5)
+    assert client.get_calls == 0
@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+from app.services import openai_service as openai_module
+from app.services.strapi_writer_service import StrapiWriterService
+
+@pytest.fixture
+def saves(monkeypatch):
+    calls = []
+    failing = set()
+
+    async def save(session_id):
+        calls.append(session_id)
+        await asyncio.sleep(0.01)
+        return session_id not in failing
+
+    monkeypatch.setattr(openai_module.openai_service, "save_conversation_to_strapi", save)
+    return calls, failing
+
+def make_writer(quiet_period=0.1, max_delay=1.0, max_retries=2):
+    writer = StrapiWriterService()
+    writer.quiet_period = quiet_period
+    writer.max_delay = max_delay
+    writer.max_retries = max_retries
+    return writer
+
+@pytest.mark.asyncio
+async def test_turns_within_quiet_period_are_coalesced(saves):
+    calls, _ = saves
+    writer = make_writer(quiet_period=0.1)
+
+    for _ in range(4):
+        writer.schedule("s1")
+        await asyncio.sleep(0.02)
+    assert calls == []
+    await asyncio.sleep(0.2)
+
+    assert calls == ["s1"]
+    assert writer.coalesced == 3
+    assert writer.flushed == 1
+    await writer.shutdown()
+
+@pytest.mark.asyncio
+async def test_busy_session_is_written_after_max_delay(saves):
+    calls, _ = saves
+    writer = make_writer(quiet_period=0.1, max_delay=0.2)
+
+    # 每轮间隔都短于静默期，只有最长等待时间能触发写入
+    for _ in range(8):
+        writer.schedule("s1")
+        await asyncio.sleep(0.05)
+
+    assert calls.count("s1") >= 1
+    await writer.shutdown()
+
+@pytest.mark.asyncio
+async def test_failed_write_is_retried_then_given_up(saves):
+    calls, failing = saves
+    failing.add("s1")
+    writer = make_writer(quiet_period=0.05, max_retries=2)
+
+    writer.schedule("s1")
+    await asyncio.sleep(0.5)
+
+    assert calls == ["s1"] * 3
+    assert writer.retried == 2
+    assert writer.failed == 1
+    assert writer.get_stats()["queue_depth"] == 0
+    await writer.shutdown()
+
+@pytest.mark.asyncio
+async def test_shutdown_flushes_pending_sessions(saves):
+    calls, _ = saves
+    writer = make_writer(quiet_period=60.0, max_delay=60.0)
+
+    for session_id in ("s1", "s2", "s3"):
+        writer.schedule(session_id)
+    await writer.shutdown()
+
+    assert sorted(calls) == ["s1", "s2", "s3"]
+    assert writer.get_stats()["queue_depth"] == 0
+
+@pytest.mark.asyncio
+async def test_shutdown_writes_turns_still_being_persisted(fake_redis, fake_strapi, monkeypatch):
+    from app.services.session_cache_service import session_cache_service
+    from app.services.strapi_writer_service import strapi_writer_service
+
+    monkeypatch.setattr(strapi_writer_service, "_closing", False)
+    monkeypatch.setattr(strapi_writer_service, "quiet_period", 60.0)
+    openai_module.openai_service.schedule_persist("s1", "q0", "a0")
+
+    # 与 app.main.lifespan 的关闭顺序相同
+    await openai_module.openai_service.shutdown()
+    await session_cache_service.shutdown()
+    await strapi_writer_service.shutdown()
+
+    assert [m["content"] for m in fake_strapi.records[1]["history"]] == ["q0", "a0"]
@@ -0,0 +1,55 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.main import TraceRequestsMiddleware
+from app.services.tracing_service import InMemoryExporter, tracing_service
+
+def test_root_span_covers_streaming_body(monkeypatch):
+    exporter = InMemoryExporter()
+    monkeypatch.setattr(tracing_service, "enabled", True)
+    monkeypatch.setattr(tracing_service, "exporter", exporter)
+
+    app = FastAPI()
+    app.add_middleware(TraceRequestsMiddleware)
+
+    @app.get("/stream")
+    async def stream():
+        async def body():
+            for i in range(3):
+                with tracing_service.span("stream.chunk"):
+                    await asyncio.sleep(0.05)
+                yield f"{i}\n"
+        return StreamingResponse(body())
+
+    response = TestClient(app).get("/stream", headers={settings.TRACE_HEADER: "trace-1"})
+    assert response.text == "0\n1\n2\n"
+    assert response.headers[settings.TRACE_HEADER] == "trace-1"
+
+    spans = exporter.get_finished_spans("trace-1")
+    root = next(s for s in spans if s.name == "GET /stream")
+    chunks = [s for s in spans if s.name == "stream.chunk"]
+    assert len(chunks) == 3
+    assert all(s.parent_id == root.span_id for s in chunks)
+    # 根 span 在流式输出结束后才结束，且最后导出
+    assert root.duration >= 0.15
+    assert spans[-1] is root
+    assert root.attributes["http.status_code"] == 200
+
+def test_no_spans_without_exporter(monkeypatch):
+    monkeypatch.setattr(tracing_service, "enabled", True)
+    monkeypatch.setattr(tracing_service, "exporter", None)
+    tracing_service.set_exporter(None)
+
+    app = FastAPI()
+    app.add_middleware(TraceRequestsMiddleware)
+
+    @app.get("/ping")
+    async def ping():
+        assert tracing_service.current_span() is None
+        return {"ok": True}
+
+    response = TestClient(app).get("/ping")
+    assert response.json() == {"ok": True}
+    assert settings.TRACE_HEADER not in response.headers